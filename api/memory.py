@@ -20,12 +20,12 @@ class MemoryService:
             "content": content,
             "created_at": datetime.utcnow()
         }
-        self.supabase.table("project_memory").insert(item).execute()
+        await self.supabase.table("project_memory").insert(item).execute()
         return MemoryItem(**item)
 
     async def get_project_memory(self, project_id: str, limit: int = 50) -> List[MemoryItem]:
         """Retrieve recent memory items for a project"""
-        response = self.supabase.table("project_memory")\
+        response = await self.supabase.table("project_memory")\
             .select("*")\
             .eq("project_id", project_id)\
             .order("created_at", desc=True)\
@@ -35,7 +35,7 @@ class MemoryService:
 
     async def clear_project_memory(self, project_id: str):
         """Clear all memory for a project"""
-        self.supabase.table("project_memory").delete().eq("project_id", project_id).execute()
+        await self.supabase.table("project_memory").delete().eq("project_id", project_id).execute()
         return {"message": f"Memory cleared for project {project_id}"}
 
 
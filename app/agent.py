@@ -31,7 +31,7 @@ class AgnoAgent:
         for path, content in files.items():
             change_id = str(uuid.uuid4())
             diff = "\n".join([f"+ {line}" for line in content.split("\n")])
-            self.supabase.table("code_changes").insert({
+            await self.supabase.table("code_changes").insert({
                 "id": change_id,
                 "task_id": str(uuid.uuid4()),  # generate new task if needed
                 "file_path": path,
@@ -47,19 +47,8 @@ class AgnoAgent:
     async def apply_change_to_sandbox(self, project_id: str, file_path: str, content: str):
         """
         Apply a generated code change to the E2B sandbox.
+        The file is saved to the store and queued for the sandbox, so the
+        changes of one generation reach it as a single batch.
         """
         from app.services.sandbox_service import sandbox_service
-        sandbox = await sandbox_service.get_sandbox(project_id)
-        if not sandbox:
-            sandbox = await sandbox_service.create_sandbox(project_id)
-
-        # Traverse nested structure to create/update file
-        parts = file_path.split("/")
-        node = sandbox
-        for part in parts[:-1]:
-            if part not in node:
-                node[part] = {"type": "directory", "children": {}}
-            node = node[part]["children"]
-
-        node[parts[-1]] = {"type": "file", "content": content}
-        await sandbox_service.update_sandbox(project_id, sandbox)
+        await sandbox_service.update_file(project_id, file_path, content)
@@ -7,6 +7,7 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from app.config import settings
 from app.database import get_supabase
 from app.models import User
+from app.cache import TTLCache
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -14,6 +15,9 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 # HTTP Bearer token
 security = HTTPBearer()
 
+# Authenticated users keyed by token subject
+user_cache = TTLCache(maxsize=settings.user_cache_size, ttl=settings.user_cache_ttl_seconds)
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against a hash"""
@@ -54,7 +58,11 @@ def decode_token(token: str) -> dict:
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security)
 ) -> User:
-    """Get the current authenticated user"""
+    """Get the current authenticated user.
+    
+    Users are cached for ``user_cache_ttl_seconds``; a tier or credit change
+    made outside this process shows up once the entry expires.
+    """
     token = credentials.credentials
     payload = decode_token(token)
     
@@ -65,9 +73,14 @@ async def get_current_user(
             detail="Could not validate credentials",
         )
     
+    # Serve from cache when possible
+    cached_user = user_cache.get(user_id)
+    if cached_user is not None:
+        return cached_user
+    
     # Fetch user from database
     supabase = get_supabase()
-    response = supabase.table("users").select("*").eq("id", user_id).execute()
+    response = await supabase.table("users").select("*").eq("id", user_id).execute()
     
     if not response.data:
         raise HTTPException(
@@ -75,8 +88,23 @@ async def get_current_user(
             detail="User not found",
         )
     
-    user_data = response.data[0]
-    return User(**user_data)
+    user = User(**response.data[0])
+    user_cache.set(user_id, user)
+    return user
+
+
+def cache_user(user: User):
+    """Store a freshly loaded user so the next request skips the database"""
+    user_cache.set(user.id, user)
+
+
+def invalidate_user(user_id: str):
+    """Drop a cached user after their tier or credits change.
+    
+    No endpoint writes tier or credits yet; whatever does (e.g. the payment
+    upgrade) must call this, or the change waits out the cache TTL.
+    """
+    user_cache.invalidate(user_id)
 
 
 def check_project_access(user: User, project_user_id: str):
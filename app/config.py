@@ -24,6 +24,132 @@ class Settings(BaseSettings):
     
     # E2B
     e2b_api_key: str = ""
+    e2b_template: str = "expo"
+    e2b_start_command: str = "npx expo start --web --port {port}"
+    e2b_preview_port: int = 8081
+    
+    # Sandboxes: "local" (rlimited processes on this node) or "e2b"
+    sandbox_backend: str = "local"
+    sandbox_root_dir: str = ".sandboxes"
+    sandbox_cpu_seconds: int = 600
+    sandbox_memory_mb: int = 2048
+    sandbox_file_size_mb: int = 100
+    sandbox_command_timeout_seconds: float = 120.0
+    sandbox_ready_timeout_seconds: float = 60.0
+    local_sandbox_start_command: str = "python3 -m http.server {port} --bind 127.0.0.1"
+    
+    # Warm sandbox pool (per worker)
+    sandbox_pool_min_size: int = 2
+    sandbox_pool_max_size: int = 10
+    sandbox_pool_demand_window_seconds: float = 600.0
+    sandbox_pool_warm_concurrency: int = 2
+    sandbox_pool_check_seconds: float = 30.0
+    
+    # Editor -> sandbox file sync (per-project debounced batches)
+    sandbox_sync_debounce_seconds: float = 0.15
+    sandbox_sync_max_delay_seconds: float = 1.0
+    sandbox_sync_max_batch_files: int = 200
+    
+    # Sandbox lifecycle: hibernate (snapshot and stop) after a per-tier idle window
+    sandbox_idle_seconds_free: float = 900.0
+    sandbox_idle_seconds_pro: float = 3600.0
+    sandbox_idle_seconds_premium: float = 14400.0
+    sandbox_max_live: int = 20
+    sandbox_reaper_interval_seconds: float = 60.0
+    sandbox_touch_seconds: float = 30.0
+    
+    # Sandbox snapshots: "disk" (snapshot_dir) or "s3" (snapshot_bucket)
+    snapshot_storage: str = "disk"
+    snapshot_dir: str = ".cache/snapshots"
+    snapshot_bucket: str = ""
+    snapshot_prefix: str = "snapshots/"
+    snapshot_endpoint_url: str = ""
+    snapshot_known_blobs: int = 100000
+    
+    # Database connection pool
+    db_http2: bool = True
+    db_pool_max_connections: int = 100
+    db_pool_max_keepalive: int = 20
+    db_pool_keepalive_expiry: float = 30.0
+    db_pool_timeout: float = 10.0
+    db_connect_timeout: float = 5.0
+    db_read_timeout: float = 30.0
+    
+    # Authenticated user cache. Tier and credits change outside this app (database or
+    # billing), so a changed user can be served stale for up to user_cache_ttl_seconds.
+    user_cache_size: int = 10000
+    user_cache_ttl_seconds: float = 60.0
+    
+    # Agent task queue
+    task_workers: int = 4
+    task_lease_seconds: float = 120.0
+    task_max_attempts: int = 3
+    task_retry_backoff_seconds: float = 5.0
+    task_poll_interval_seconds: float = 2.0
+    
+    # Chat streaming ("agno" or "fake" for a local timer-driven model)
+    chat_stream_model: str = "agno"
+    fake_stream_interval_seconds: float = 0.05
+    
+    # Agent execution (thread pool and per-tier concurrency)
+    agent_thread_pool_size: int = 16
+    agent_concurrency_free: int = 2
+    agent_concurrency_pro: int = 4
+    agent_concurrency_premium: int = 8
+    agent_disconnect_poll_seconds: float = 0.5
+    
+    # Code generation response cache ("memory", "disk" or "database")
+    response_cache_backend: str = "memory"
+    response_cache_size: int = 1000
+    response_cache_ttl_seconds: float = 86400.0
+    response_cache_dir: str = ".cache/responses"
+    
+    # Project memory registry
+    memory_max_resident_projects: int = 200
+    memory_idle_seconds: float = 1800.0
+    memory_flush_batch_size: int = 100
+    memory_flush_interval_seconds: float = 1.0
+    memory_dedupe_window_seconds: float = 30.0
+    # Flushes a row may fail before it is dropped (and logged) instead of retried
+    memory_flush_max_attempts: int = 3
+    memory_warm_items: int = 200
+    memory_load_page_size: int = 500
+    
+    # Prompt context assembly
+    context_memory_hits: int = 10
+    context_history_messages: int = 20
+    context_cache_size: int = 1000
+    # Context snapshots are invalidated only in the worker that made the edit; with
+    # several workers, others can serve a stale spec or chat history for up to this long
+    context_cache_ttl_seconds: float = 30.0
+    
+    # Chat history pagination
+    chat_history_page_size: int = 50
+    chat_history_max_page_size: int = 200
+    
+    # Project event stream
+    event_queue_size: int = 100
+    event_keepalive_seconds: float = 15.0
+    event_retry_ms: int = 3000
+    
+    # Spec history
+    spec_keyframe_interval: int = 20
+    spec_history_cache_size: int = 500
+    # Versions longer than this many lines are stored whole: the line diff is
+    # quadratic on repetitive text and would hold a worker for seconds
+    spec_delta_max_lines: int = 4000
+    
+    # Project file store (content-addressed blobs and trees)
+    file_store_cache_size: int = 10000
+    file_store_index_cache_size: int = 500
+    file_store_write_retries: int = 3
+    
+    # Memory embeddings: "agno" (remote), "hashing" (deterministic, for tests) or "local" (CPU model,
+    # needs the optional sentence-transformers package; embedding_dim must match the model)
+    embedding_backend: str = "agno"
+    embedding_dim: int = 384
+    local_embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2"
+    local_similarity_threshold: float = 0.25
     
     @property
     def cors_origins_list(self) -> List[str]:
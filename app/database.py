@@ -1,18 +1,277 @@
-from supabase import create_client, Client
+"""
+Async Supabase (PostgREST) data-access layer backed by a shared HTTP/2 connection pool
+"""
+from typing import Any, Dict, List, Optional
+import json
+import httpx
 from app.config import settings
 
+
+class DatabaseError(Exception):
+    """Raised when PostgREST returns an error response"""
+
+    def __init__(self, message: str, code: Optional[str] = None, details: Any = None, status_code: int = 500):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+        self.details = details
+        self.status_code = status_code
+
+
+class QueryResponse:
+    """Result of an executed query, mirroring the supabase-py response shape"""
+
+    def __init__(self, data: List[Dict[str, Any]], count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+
+def _format_value(value: Any) -> str:
+    """Format a Python value for use in a PostgREST filter"""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if value is None:
+        return "null"
+    return str(value)
+
+
+class AsyncQueryBuilder:
+    """Chainable query builder with the same surface as the supabase-py table builder.
+
+    Builder methods return ``self`` so existing call chains keep working; only
+    ``execute()`` is a coroutine and must be awaited.
+    """
+
+    def __init__(self, client: "AsyncSupabaseClient", table: str):
+        self._client = client
+        self._table = table
+        self._method = "GET"
+        self._params: List[tuple] = []
+        self._orders: List[str] = []
+        self._headers: Dict[str, str] = {}
+        self._prefer: List[str] = []
+        self._body: Any = None
+
+    # --- Operations ---
+    def select(self, columns: str = "*", count: Optional[str] = None) -> "AsyncQueryBuilder":
+        self._method = "GET"
+        self._params.append(("select", "".join(columns.split())))
+        if count:
+            self._prefer.append(f"count={count}")
+        return self
+
+    def insert(self, data: Any) -> "AsyncQueryBuilder":
+        self._method = "POST"
+        self._body = data
+        self._prefer.append("return=representation")
+        return self
+
+    def upsert(self, data: Any, on_conflict: Optional[str] = None,
+               ignore_duplicates: bool = False) -> "AsyncQueryBuilder":
+        self._method = "POST"
+        self._body = data
+        resolution = "ignore-duplicates" if ignore_duplicates else "merge-duplicates"
+        self._prefer.extend([f"resolution={resolution}", "return=representation"])
+        if on_conflict:
+            self._params.append(("on_conflict", on_conflict))
+        return self
+
+    def update(self, data: Dict[str, Any]) -> "AsyncQueryBuilder":
+        self._method = "PATCH"
+        self._body = data
+        self._prefer.append("return=representation")
+        return self
+
+    def delete(self) -> "AsyncQueryBuilder":
+        self._method = "DELETE"
+        self._prefer.append("return=representation")
+        return self
+
+    # --- Filters ---
+    def _filter(self, column: str, operator: str, value: Any) -> "AsyncQueryBuilder":
+        self._params.append((column, f"{operator}.{_format_value(value)}"))
+        return self
+
+    def eq(self, column: str, value: Any) -> "AsyncQueryBuilder":
+        return self._filter(column, "eq", value)
+
+    def neq(self, column: str, value: Any) -> "AsyncQueryBuilder":
+        return self._filter(column, "neq", value)
+
+    def gt(self, column: str, value: Any) -> "AsyncQueryBuilder":
+        return self._filter(column, "gt", value)
+
+    def gte(self, column: str, value: Any) -> "AsyncQueryBuilder":
+        return self._filter(column, "gte", value)
+
+    def lt(self, column: str, value: Any) -> "AsyncQueryBuilder":
+        return self._filter(column, "lt", value)
+
+    def lte(self, column: str, value: Any) -> "AsyncQueryBuilder":
+        return self._filter(column, "lte", value)
+
+    def is_(self, column: str, value: Any) -> "AsyncQueryBuilder":
+        return self._filter(column, "is", value)
+
+    def in_(self, column: str, values: List[Any]) -> "AsyncQueryBuilder":
+        joined = ",".join(_format_value(v) for v in values)
+        self._params.append((column, f"in.({joined})"))
+        return self
+
+    def or_(self, filters: str) -> "AsyncQueryBuilder":
+        self._params.append(("or", f"({filters})"))
+        return self
+
+    # --- Modifiers ---
+    def order(self, column: str, desc: bool = False) -> "AsyncQueryBuilder":
+        self._orders.append(f"{column}.{'desc' if desc else 'asc'}")
+        return self
+
+    def limit(self, count: int) -> "AsyncQueryBuilder":
+        self._params.append(("limit", str(count)))
+        return self
+
+    def offset(self, count: int) -> "AsyncQueryBuilder":
+        self._params.append(("offset", str(count)))
+        return self
+
+    def range(self, start: int, end: int) -> "AsyncQueryBuilder":
+        self._params.append(("offset", str(start)))
+        self._params.append(("limit", str(end - start + 1)))
+        return self
+
+    async def execute(self) -> QueryResponse:
+        """Send the query over the shared connection pool"""
+        params = list(self._params)
+        if self._orders:
+            params.append(("order", ",".join(self._orders)))
+
+        headers = dict(self._headers)
+        if self._prefer:
+            headers["Prefer"] = ",".join(self._prefer)
+
+        response = await self._client.request(
+            self._method,
+            f"/rest/v1/{self._table}",
+            params=params,
+            headers=headers,
+            body=self._body,
+        )
+        return _build_response(response)
+
+
+def _parse_count(response: httpx.Response) -> Optional[int]:
+    """Extract the total row count from a Content-Range header"""
+    content_range = response.headers.get("content-range")
+    if not content_range or "/" not in content_range:
+        return None
+    total = content_range.split("/")[-1]
+    return int(total) if total.isdigit() else None
+
+
+def _build_response(response: httpx.Response) -> QueryResponse:
+    """Convert an HTTP response into a QueryResponse or raise DatabaseError"""
+    if response.status_code >= 400:
+        try:
+            error = response.json()
+        except ValueError:
+            error = {"message": response.text}
+        raise DatabaseError(
+            error.get("message", "Database request failed"),
+            code=error.get("code"),
+            details=error.get("details"),
+            status_code=response.status_code,
+        )
+
+    data: Any = []
+    if response.content:
+        data = response.json()
+    if isinstance(data, dict):
+        data = [data]
+
+    return QueryResponse(data=data, count=_parse_count(response))
+
+
+class AsyncSupabaseClient:
+    """Async Supabase REST client sharing one pooled HTTP/2 connection set"""
+
+    def __init__(self, url: str, key: str):
+        self.url = url.rstrip("/")
+        self.key = key
+        self._http: Optional[httpx.AsyncClient] = None
+
+    def _get_http(self) -> httpx.AsyncClient:
+        """Lazily create the pooled HTTP client"""
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(
+                base_url=self.url,
+                http2=settings.db_http2,
+                limits=httpx.Limits(
+                    max_connections=settings.db_pool_max_connections,
+                    max_keepalive_connections=settings.db_pool_max_keepalive,
+                    keepalive_expiry=settings.db_pool_keepalive_expiry,
+                ),
+                timeout=httpx.Timeout(
+                    settings.db_read_timeout,
+                    connect=settings.db_connect_timeout,
+                    pool=settings.db_pool_timeout,
+                ),
+                headers={
+                    "apikey": self.key,
+                    "Authorization": f"Bearer {self.key}",
+                    "Content-Type": "application/json",
+                },
+            )
+        return self._http
+
+    def table(self, name: str) -> AsyncQueryBuilder:
+        """Start a query against a table"""
+        return AsyncQueryBuilder(self, name)
+
+    async def rpc(self, function: str, params: Optional[Dict[str, Any]] = None) -> QueryResponse:
+        """Call a Postgres function exposed through PostgREST"""
+        response = await self.request("POST", f"/rest/v1/rpc/{function}", body=params or {})
+        return _build_response(response)
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        params: Optional[List[tuple]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        body: Any = None,
+    ) -> httpx.Response:
+        """Issue a raw request against the Supabase REST API"""
+        content = json.dumps(body, default=str) if body is not None else None
+        return await self._get_http().request(
+            method, path, params=params, headers=headers, content=content
+        )
+
+    async def close(self):
+        """Close pooled connections"""
+        if self._http is not None and not self._http.is_closed:
+            await self._http.aclose()
+        self._http = None
+
+
 # Initialize Supabase client
-supabase: Client = create_client(settings.supabase_url, settings.supabase_key)
+supabase = AsyncSupabaseClient(settings.supabase_url, settings.supabase_key)
 
 # Service role client for admin operations
-supabase_admin: Client = create_client(settings.supabase_url, settings.supabase_service_key)
+supabase_admin = AsyncSupabaseClient(settings.supabase_url, settings.supabase_service_key)
 
 
-def get_supabase() -> Client:
+def get_supabase() -> AsyncSupabaseClient:
     """Get Supabase client instance"""
     return supabase
 
 
-def get_supabase_admin() -> Client:
+def get_supabase_admin() -> AsyncSupabaseClient:
     """Get Supabase admin client instance"""
     return supabase_admin
+
+
+async def close_database_connections():
+    """Release pooled connections held by both clients"""
+    await supabase.close()
+    await supabase_admin.close()
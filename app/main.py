@@ -1,7 +1,8 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.config import settings
-from app.routers import auth, projects, specs, files, agents, chat, subscription, status
+from app.database import close_database_connections
+from app.routers import auth, projects, specs, files, agents, chat, events, subscription, status
 
 app = FastAPI(
     title="Spec-Driven AI App Builder API",
@@ -25,11 +26,35 @@ app.include_router(specs.router, prefix="/api/projects/{project_id}/specs", tags
 app.include_router(files.router, prefix="/api/projects/{project_id}/files", tags=["Files"])
 app.include_router(agents.router, prefix="/api/projects/{project_id}", tags=["Agents"])
 app.include_router(chat.router, prefix="/api/projects/{project_id}/chat", tags=["Chat"])
+app.include_router(events.router, prefix="/api/projects/{project_id}/events", tags=["Events"])
 # app.include_router(marketplace.router, prefix="/api/marketplace", tags=["Marketplace"])  # Disabled for now
 app.include_router(subscription.router, prefix="/api/subscription", tags=["Subscription"])
 app.include_router(status.router, prefix="/api", tags=["Status"])
 
 
+@app.on_event("startup")
+async def startup():
+    from app.services.task_queue import task_queue
+    from app.services.memory_service import memory_service
+    from app.services.sandbox_service import sandbox_service
+    memory_service.start()
+    await task_queue.start()
+    sandbox_service.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    from app.services.task_queue import task_queue
+    from app.services.agent_executor import agent_executor
+    from app.services.memory_service import memory_service
+    from app.services.sandbox_service import sandbox_service
+    await task_queue.stop()
+    agent_executor.shutdown()
+    await memory_service.stop()
+    await sandbox_service.stop()
+    await close_database_connections()
+
+
 @app.get("/")
 async def root():
     return {
@@ -0,0 +1,68 @@
+"""
+Lightweight in-process metrics helpers
+"""
+from typing import Dict, Any, Sequence
+from collections import deque
+import bisect
+
+
+class LatencyRecorder:
+    """Keeps a rolling window of latency samples (in milliseconds)"""
+
+    def __init__(self, window: int = 1000):
+        self._samples = deque(maxlen=window)
+        self.count = 0
+        self.total_ms = 0.0
+
+    def record(self, value_ms: float):
+        """Add a sample"""
+        self._samples.append(value_ms)
+        self.count += 1
+        self.total_ms += value_ms
+
+    def percentile(self, pct: float) -> float:
+        """Percentile over the rolling window"""
+        if not self._samples:
+            return 0.0
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def stats(self) -> Dict[str, Any]:
+        """Summary suitable for the metrics endpoint"""
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 2) if self.count else 0.0,
+            "p50_ms": round(self.percentile(50), 2),
+            "p95_ms": round(self.percentile(95), 2),
+            "p99_ms": round(self.percentile(99), 2),
+            "max_ms": round(max(self._samples), 2) if self._samples else 0.0,
+        }
+
+
+class LatencyHistogram:
+    """Cumulative counts of latency samples (in milliseconds) per upper bound"""
+
+    def __init__(self, buckets_ms: Sequence[float] = (100, 250, 500, 1000, 2500, 5000, 10000, 30000)):
+        self.buckets_ms = sorted(buckets_ms)
+        self._counts = [0] * len(self.buckets_ms)
+        self.count = 0
+        self.total_ms = 0.0
+
+    def record(self, value_ms: float):
+        """Add a sample"""
+        index = bisect.bisect_left(self.buckets_ms, value_ms)
+        if index < len(self._counts):
+            self._counts[index] += 1
+        self.count += 1
+        self.total_ms += value_ms
+
+    def stats(self) -> Dict[str, Any]:
+        """Cumulative bucket counts (``le_<bound>`` and ``le_inf``), count and sum"""
+        buckets = {}
+        running = 0
+        for bound, count in zip(self.buckets_ms, self._counts):
+            running += count
+            buckets[f"le_{bound:g}"] = running
+        buckets["le_inf"] = self.count
+        return {"buckets": buckets, "count": self.count, "sum_ms": round(self.total_ms, 2)}
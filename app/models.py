@@ -70,10 +70,12 @@ class ProjectUpdate(BaseModel):
 
 class SpecFileUpdate(BaseModel):
     content: str
+    expected_version: Optional[int] = None
 
 
 class SpecRollback(BaseModel):
     version_id: str
+    expected_version: Optional[int] = None
 
 
 class FileUpdate(BaseModel):
@@ -81,9 +83,35 @@ class FileUpdate(BaseModel):
     content: str
 
 
+class FileCreate(BaseModel):
+    path: str
+    type: str = "file"  # "file" or "directory"
+    content: Optional[str] = None
+
+
+class FileDelete(BaseModel):
+    path: str
+
+
+class FileEntry(BaseModel):
+    path: str
+    name: str
+    type: str
+    hash: str
+    size: int = 0
+    mtime: Optional[str] = None
+
+
+class FileIndex(BaseModel):
+    root_hash: str
+    revision: int
+    entries: List[FileEntry]
+
+
 class TaskCreate(BaseModel):
     description: str
     agent_type: AgentType
+    use_cache: bool = True
 
 
 class ChangeApproval(BaseModel):
@@ -150,10 +178,12 @@ class SpecVersion(BaseModel):
     id: str
     spec_file_id: str
     version: int
-    content: str
+    content: Optional[str] = None  # Only when requested; history is stored as deltas
     changes_summary: Optional[str]
     created_at: datetime
     created_by: str
+    storage: Optional[str] = None
+    content_size: Optional[int] = None
 
 
 class Task(BaseModel):
@@ -3,22 +3,24 @@ from typing import List
 from app.models import Task, TaskCreate, CodeChange, ChangeModification, User
 from app.auth import get_current_user
 from app.database import get_supabase
+from app.services.event_bus import event_bus
 import uuid
 
 router = APIRouter()
 
 
-@router.post("/tasks", response_model=Task)
+@router.post("/tasks", response_model=Task, status_code=status.HTTP_202_ACCEPTED)
 async def submit_task(
     project_id: str,
     task_data: TaskCreate,
     current_user: User = Depends(get_current_user)
 ):
-    """Submit a task to an agent"""
+    """Submit a task to an agent (processed asynchronously by the task queue)"""
+    from app.services.task_queue import task_queue
     supabase = get_supabase()
     
     # Verify project access
-    project_response = supabase.table("projects")\
+    project_response = await supabase.table("projects")\
         .select("user_id")\
         .eq("id", project_id)\
         .execute()
@@ -35,53 +37,78 @@ async def submit_task(
             detail="Access denied"
         )
     
-    # Create task
-    import uuid
-    task_id = str(uuid.uuid4())
-    task_data_dict = {
-        "id": task_id,
-        "project_id": project_id,
-        "agent_type": task_data.agent_type,
-        "description": task_data.description,
-        "status": "pending",
-        "input_context": {"user_request": task_data.description},
-    }
+    # Queue task; a worker picks it up and runs the agent
+    task = await task_queue.enqueue(
+        project_id,
+        task_data.agent_type.value,
+        task_data.description,
+        current_user,
+        input_context={"user_request": task_data.description, "use_cache": task_data.use_cache}
+    )
+    
+    return Task(**task)
+
+
+@router.get("/tasks/{task_id}", response_model=Task)
+async def get_task(
+    project_id: str,
+    task_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Get the status of a submitted task"""
+    supabase = get_supabase()
     
-    task_response = supabase.table("tasks").insert(task_data_dict).execute()
+    task_response = await supabase.table("tasks")\
+        .select("*, projects!inner(user_id)")\
+        .eq("id", task_id)\
+        .eq("project_id", project_id)\
+        .execute()
     
-    # Process agent task with AI
-    await process_agent_task(task_id, task_data.agent_type, task_data.description, current_user)
+    if not task_response.data:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Task not found"
+        )
     
-    return Task(**task_response.data[0])
+    task = task_response.data[0]
+    if task["projects"]["user_id"] != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied"
+        )
+    
+    return Task(**task)
+
 
+async def process_agent_task(task_id: str, agent_type: str, description: str, user: User, use_cache: bool = True) -> dict:
+    """Process a task with the appropriate agent using AI; returns the task output.
 
-async def process_agent_task(task_id: str, agent_type: str, description: str, user: User):
-    """Process a task with the appropriate agent using AI"""
+    The task queue records completion, so only the worker holding the lease does.
+    """
     from app.services.ai_service import ai_service
     supabase = get_supabase()
     
     # Get project context
-    task_response = supabase.table("tasks").select("project_id").eq("id", task_id).execute()
+    task_response = await supabase.table("tasks").select("project_id").eq("id", task_id).execute()
     project_id = task_response.data[0]["project_id"] if task_response.data else None
     
     project_context = {}
     if project_id:
-        # Get project specs for context
-        specs = supabase.table("spec_files").select("file_type, content").eq("project_id", project_id).execute()
-        project_context = {spec["file_type"]: spec["content"][:1000] for spec in specs.data}
+        # Get project specs and relevant memory for context
+        from app.services.context_assembler import context_assembler
+        project_context = await context_assembler.gather(project_id, description, include_history=False)
     
     # Generate code using AI service
-    code_result = await ai_service.generate_code(user, description, agent_type, project_context)
+    code_result = await ai_service.generate_code(user, description, agent_type, project_context, use_cache=use_cache)
     
     # Create code changes for each generated file
+    changes = []
     for file_path, file_content in code_result["files"].items():
-        change_id = str(uuid.uuid4())
-        
         # Create diff format
         diff = "\n".join([f"+ {line}" for line in file_content.split("\n")])
         
-        change_data = {
-            "id": change_id,
+        changes.append({
+            "id": str(uuid.uuid4()),
             "task_id": task_id,
             "file_path": file_path,
             "change_type": "create",
@@ -89,19 +116,25 @@ async def process_agent_task(task_id: str, agent_type: str, description: str, us
             "agent_type": agent_type,
             "reasoning": code_result["reasoning"],
             "approved": None,  # Pending approval
-        }
-        
-        supabase.table("code_changes").insert(change_data).execute()
+        })
     
-    # Update task status
-    supabase.table("tasks")\
-        .update({
-            "status": "completed",
-            "output": {"generated_files": list(code_result["files"].keys())},
-            "completed_at": "now()"
-        })\
-        .eq("id", task_id)\
+    # A retried task replaces the pending changes of its earlier attempt
+    await supabase.table("code_changes")\
+        .delete()\
+        .eq("task_id", task_id)\
+        .is_("approved", "null")\
         .execute()
+    if changes:
+        await supabase.table("code_changes").insert(changes).execute()
+    for change in changes:
+        event_bus.publish(project_id, "code_change.created", {
+            "id": change["id"],
+            "task_id": task_id,
+            "file_path": change["file_path"],
+            "agent_type": agent_type,
+        })
+    
+    return {"generated_files": list(code_result["files"].keys())}
 
 
 @router.get("/changes/pending", response_model=List[CodeChange])
@@ -113,7 +146,7 @@ async def get_pending_changes(
     supabase = get_supabase()
     
     # Verify project access
-    project_response = supabase.table("projects")\
+    project_response = await supabase.table("projects")\
         .select("user_id")\
         .eq("id", project_id)\
         .execute()
@@ -131,7 +164,7 @@ async def get_pending_changes(
         )
     
     # Get pending changes (approved = null means pending)
-    changes_response = supabase.table("code_changes")\
+    changes_response = await supabase.table("code_changes")\
         .select("*, tasks!inner(project_id)")\
         .eq("tasks.project_id", project_id)\
         .is_("approved", "null")\
@@ -151,7 +184,7 @@ async def approve_change(
     supabase = get_supabase()
     
     # Verify change exists and belongs to user's project
-    change_response = supabase.table("code_changes")\
+    change_response = await supabase.table("code_changes")\
         .select("*, tasks!inner(project_id, projects!inner(user_id))")\
         .eq("id", change_id)\
         .eq("tasks.project_id", project_id)\
@@ -171,10 +204,11 @@ async def approve_change(
         )
     
     # Update change as approved
-    supabase.table("code_changes")\
+    await supabase.table("code_changes")\
         .update({"approved": True})\
         .eq("id", change_id)\
         .execute()
+    event_bus.publish(project_id, "code_change.updated", {"id": change_id, "approved": True})
     
     # TODO: Apply the change to the actual codebase/sandbox
     
@@ -191,7 +225,7 @@ async def reject_change(
     supabase = get_supabase()
     
     # Verify change exists and belongs to user's project
-    change_response = supabase.table("code_changes")\
+    change_response = await supabase.table("code_changes")\
         .select("*, tasks!inner(project_id, projects!inner(user_id))")\
         .eq("id", change_id)\
         .eq("tasks.project_id", project_id)\
@@ -211,10 +245,11 @@ async def reject_change(
         )
     
     # Update change as rejected
-    supabase.table("code_changes")\
+    await supabase.table("code_changes")\
         .update({"approved": False})\
         .eq("id", change_id)\
         .execute()
+    event_bus.publish(project_id, "code_change.updated", {"id": change_id, "approved": False})
     
     return {"message": "Change rejected successfully"}
 
@@ -230,7 +265,7 @@ async def request_modification(
     supabase = get_supabase()
     
     # Verify change exists and belongs to user's project
-    change_response = supabase.table("code_changes")\
+    change_response = await supabase.table("code_changes")\
         .select("*, tasks!inner(project_id, projects!inner(user_id))")\
         .eq("id", change_id)\
         .eq("tasks.project_id", project_id)\
@@ -256,21 +291,29 @@ async def request_modification(
         "project_id": project_id,
         "agent_type": change["agent_type"],
         "description": f"Modify previous change: {modification.feedback}",
-        "status": "pending",
+        # Runs inline below, so queue workers must not claim it
+        "status": "in_progress",
         "input_context": {
             "modification_request": modification.feedback,
             "original_change_id": change_id,
-            "original_file": change["file_path"]
+            "original_file": change["file_path"],
+            "user_id": current_user.id
         },
     }
     
-    supabase.table("tasks").insert(task_data).execute()
+    await supabase.table("tasks").insert(task_data).execute()
+    event_bus.publish(project_id, "task.created", {
+        "id": task_id,
+        "agent_type": change["agent_type"],
+        "status": "in_progress",
+    })
     
     # Mark original change as rejected
-    supabase.table("code_changes")\
+    await supabase.table("code_changes")\
         .update({"approved": False})\
         .eq("id", change_id)\
         .execute()
+    event_bus.publish(project_id, "code_change.updated", {"id": change_id, "approved": False})
     
     # Process the modification request
     await process_modification_request(task_id, change, modification.feedback)
@@ -285,9 +328,10 @@ async def get_sandbox(
 ):
     """Get sandbox information"""
     from app.services.sandbox_service import sandbox_service
+    supabase = get_supabase()
     
     # Verify project access
-    project_response = supabase.table("projects")\
+    project_response = await supabase.table("projects")\
         .select("user_id")\
         .eq("id", project_id)\
         .execute()
@@ -306,8 +350,8 @@ async def get_sandbox(
     
     sandbox = await sandbox_service.get_sandbox(project_id)
     
-    if not sandbox:
-        # Create sandbox if it doesn't exist
+    if not sandbox or sandbox["status"] in ("stopped", "error", "hibernated"):
+        # Create sandbox if it doesn't exist or isn't running (resuming a snapshot if it has one)
         sandbox = await sandbox_service.create_sandbox(project_id)
     
     return sandbox
@@ -320,9 +364,10 @@ async def get_preview(
 ):
     """Get preview information"""
     from app.services.sandbox_service import sandbox_service
+    supabase = get_supabase()
     
     # Verify project access
-    project_response = supabase.table("projects")\
+    project_response = await supabase.table("projects")\
         .select("user_id")\
         .eq("id", project_id)\
         .execute()
@@ -352,9 +397,10 @@ async def create_build(
 ):
     """Create a build for deployment"""
     from app.services.deployment_service import deployment_service
+    supabase = get_supabase()
     
     # Verify project access
-    project_response = supabase.table("projects")\
+    project_response = await supabase.table("projects")\
         .select("user_id")\
         .eq("id", project_id)\
         .execute()
@@ -439,10 +485,10 @@ async def process_modification_request(task_id: str, original_change: dict, feed
         "approved": None,  # Pending approval
     }
     
-    supabase.table("code_changes").insert(change_data).execute()
+    await supabase.table("code_changes").insert(change_data).execute()
     
     # Update task status
-    supabase.table("tasks")\
+    await supabase.table("tasks")\
         .update({
             "status": "completed",
             "output": {"modification_applied": True, "feedback": feedback},
@@ -450,3 +496,12 @@ async def process_modification_request(task_id: str, original_change: dict, feed
         })\
         .eq("id", task_id)\
         .execute()
+    
+    project_id = original_change["tasks"]["project_id"]
+    event_bus.publish(project_id, "code_change.created", {
+        "id": change_id,
+        "task_id": task_id,
+        "file_path": original_change["file_path"],
+        "agent_type": original_change["agent_type"],
+    })
+    event_bus.publish(project_id, "task.updated", {"id": task_id, "status": "completed"})
@@ -5,7 +5,8 @@ from app.auth import (
     get_password_hash,
     verify_password,
     create_access_token,
-    get_current_user
+    get_current_user,
+    cache_user
 )
 from app.database import get_supabase
 from app.config import settings
@@ -20,7 +21,7 @@ async def signup(user_data: UserCreate):
     supabase = get_supabase()
     
     # Check if user already exists
-    existing = supabase.table("users").select("id").eq("email", user_data.email).execute()
+    existing = await supabase.table("users").select("id").eq("email", user_data.email).execute()
     if existing.data:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -40,7 +41,7 @@ async def signup(user_data: UserCreate):
         "credits_remaining": 100,
     }
     
-    response = supabase.table("users").insert(new_user).execute()
+    response = await supabase.table("users").insert(new_user).execute()
     
     if not response.data:
         raise HTTPException(
@@ -55,6 +56,7 @@ async def signup(user_data: UserCreate):
     )
     
     user = User(**response.data[0])
+    cache_user(user)
     
     return Token(access_token=access_token, user=user)
 
@@ -65,7 +67,7 @@ async def login(credentials: UserLogin):
     supabase = get_supabase()
     
     # Get user by email
-    response = supabase.table("users").select("*").eq("email", credentials.email).execute()
+    response = await supabase.table("users").select("*").eq("email", credentials.email).execute()
     
     if not response.data:
         raise HTTPException(
@@ -89,6 +91,7 @@ async def login(credentials: UserLogin):
     )
     
     user = User(**user_data)
+    cache_user(user)
     
     return Token(access_token=access_token, user=user)
 
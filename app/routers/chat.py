@@ -1,24 +1,42 @@
-from fastapi import APIRouter, HTTPException, status, Depends
-from typing import List
+from fastapi import APIRouter, HTTPException, status, Depends, Request, Response, Query
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+from datetime import datetime
 from app.models import ChatMessage, ChatMessageResponse, User
 from app.auth import get_current_user
+from app.config import settings
 from app.database import get_supabase
+from app.services.context_assembler import context_assembler
+import asyncio
+import base64
+import hashlib
+import logging
 import uuid
+import json
+import time
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 
+def _sse_event(event: str, data: dict) -> str:
+    """Format a Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
 @router.post("", response_model=ChatMessageResponse)
 async def send_message(
     project_id: str,
     message: ChatMessage,
+    request: Request,
     current_user: User = Depends(get_current_user)
 ):
     """Send a message to the AI assistant"""
     supabase = get_supabase()
     
     # Verify project access
-    project_response = supabase.table("projects")\
+    project_response = await supabase.table("projects")\
         .select("user_id")\
         .eq("id", project_id)\
         .execute()
@@ -49,7 +67,8 @@ async def send_message(
         "attachments": None,
     }
     
-    supabase.table("chat_messages").insert(user_message_data).execute()
+    await supabase.table("chat_messages").insert(user_message_data).execute()
+    context_assembler.snapshots.record_message(project_id, "user", message.message)
     
     # Store in memory
     await memory_service.store_conversation(project_id, "user", message.message)
@@ -57,20 +76,16 @@ async def send_message(
     # Generate AI response with context using tier-based models
     from app.services.ai_service import ai_service
     
-    # Get project context for AI
-    project_info, recent_memory, spec_context = await get_project_context(project_id)
-    project_context = {
-        "project_info": project_info,
-        "recent_memory": recent_memory[:5],  # Last 5 memory items
-        "spec_context": spec_context
-    }
+    # Get project context for AI (packed to the tier's token budget by the AI service)
+    project_context = await get_project_context(project_id, message.message)
     
     ai_response = await ai_service.generate_response(
         current_user, 
         message.message, 
         context=project_context,
         system_prompt="You are an expert mobile app development assistant specializing in React Native and Expo.",
-        project_id=project_id
+        project_id=project_id,
+        request=request
     )
     
     # Store AI message
@@ -83,7 +98,8 @@ async def send_message(
         "attachments": None,
     }
     
-    ai_message_response = supabase.table("chat_messages").insert(ai_message_data).execute()
+    ai_message_response = await supabase.table("chat_messages").insert(ai_message_data).execute()
+    context_assembler.snapshots.record_message(project_id, "assistant", ai_response)
     
     # Store AI response in memory
     await memory_service.store_conversation(project_id, "assistant", ai_response)
@@ -91,16 +107,17 @@ async def send_message(
     return ChatMessageResponse(**ai_message_response.data[0])
 
 
-@router.get("/history", response_model=List[ChatMessageResponse])
-async def get_chat_history(
+@router.post("/stream")
+async def stream_message(
     project_id: str,
+    message: ChatMessage,
     current_user: User = Depends(get_current_user)
 ):
-    """Get chat history for a project"""
+    """Send a message and stream the AI response as Server-Sent Events"""
     supabase = get_supabase()
     
     # Verify project access
-    project_response = supabase.table("projects")\
+    project_response = await supabase.table("projects")\
         .select("user_id")\
         .eq("id", project_id)\
         .execute()
@@ -117,34 +134,191 @@ async def get_chat_history(
             detail="Access denied"
         )
     
-    # Get chat messages
-    messages_response = supabase.table("chat_messages")\
-        .select("*")\
-        .eq("project_id", project_id)\
-        .order("created_at", desc=False)\
-        .execute()
+    from app.services.memory_service import memory_service
+    from app.services.ai_service import ai_service
+    
+    # Store user message
+    await supabase.table("chat_messages").insert({
+        "id": str(uuid.uuid4()),
+        "project_id": project_id,
+        "role": "user",
+        "content": message.message,
+        "attachments": None,
+    }).execute()
+    context_assembler.snapshots.record_message(project_id, "user", message.message)
+    await memory_service.store_conversation(project_id, "user", message.message)
     
-    return [ChatMessageResponse(**msg) for msg in messages_response.data]
+    project_context = await get_project_context(project_id, message.message)
+    
+    async def save_response(content: str):
+        ai_message_response = await supabase.table("chat_messages").insert({
+            "id": str(uuid.uuid4()),
+            "project_id": project_id,
+            "role": "assistant",
+            "content": content,
+            "attachments": None,
+        }).execute()
+        context_assembler.snapshots.record_message(project_id, "assistant", content)
+        await memory_service.store_conversation(project_id, "assistant", content)
+        return ai_message_response.data[0] if ai_message_response.data else None
+    
+    async def event_stream():
+        started = time.perf_counter()
+        ttft_ms = None
+        chunks = []
+        saved = None
+        
+        try:
+            try:
+                async for token in ai_service.stream_response(
+                    current_user,
+                    message.message,
+                    context=project_context,
+                    system_prompt="You are an expert mobile app development assistant specializing in React Native and Expo.",
+                    project_id=project_id
+                ):
+                    if ttft_ms is None:
+                        ttft_ms = (time.perf_counter() - started) * 1000
+                    chunks.append(token)
+                    yield _sse_event("token", {"token": token})
+            except Exception as e:
+                logger.exception("Chat stream failed for project %s", project_id)
+                yield _sse_event("error", {"error": str(e)})
+                return
+            
+            # Persist the complete assistant message once the stream has finished
+            saved = asyncio.ensure_future(save_response("".join(chunks)))
+            yield _sse_event("done", {
+                "message": await asyncio.shield(saved),
+                "time_to_first_token_ms": round(ttft_ms or 0.0, 2),
+                "total_ms": round((time.perf_counter() - started) * 1000, 2),
+            })
+        finally:
+            if saved is None and chunks:
+                # The client went away or the model failed mid-stream: keep what was generated.
+                # Shielded so the save completes even though this generator is being cancelled.
+                await asyncio.shield(asyncio.ensure_future(save_response("".join(chunks))))
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
-async def get_project_context(project_id: str):
-    """Get project context for AI"""
-    from app.services.memory_service import memory_service
-    
+def _encode_cursor(message: dict) -> str:
+    """Opaque keyset cursor for a message's (created_at, id)"""
+    raw = json.dumps([str(message["created_at"]), str(message["id"])])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor: str) -> tuple:
+    try:
+        created_at, message_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return created_at, message_id
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+
+@router.get("/history", response_model=List[ChatMessageResponse])
+async def get_chat_history(
+    project_id: str,
+    request: Request,
+    response: Response,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    since: Optional[datetime] = None,
+    limit: int = Query(default=settings.chat_history_page_size, ge=1, le=settings.chat_history_max_page_size),
+    current_user: User = Depends(get_current_user)
+):
+    """Get chat history for a project, one page at a time.
+    
+    Without cursors the newest page is returned. ``before`` pages back through
+    older messages, ``after`` (or ``since`` for a timestamp) returns messages
+    newer than the ones the client already holds. Messages are always in
+    ascending order; ``X-Before-Cursor`` / ``X-After-Cursor`` headers carry the
+    cursors for the next request, and an unchanged page answers 304 to
+    ``If-None-Match``.
+    """
     supabase = get_supabase()
     
-    # Get project info
-    project = supabase.table("projects").select("name, description").eq("id", project_id).execute()
-    project_info = project.data[0] if project.data else {}
+    if sum(param is not None for param in (before, after, since)) > 1:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Use only one of before, after or since"
+        )
     
-    # Get recent memory for context
-    recent_memory = await memory_service.get_project_memory(project_id)
+    # Verify project access
+    project_response = await supabase.table("projects")\
+        .select("user_id")\
+        .eq("id", project_id)\
+        .execute()
     
-    # Get spec files for context
-    specs = supabase.table("spec_files").select("file_type, content").eq("project_id", project_id).execute()
-    spec_context = {spec["file_type"]: spec["content"][:500] + "..." for spec in specs.data}
+    if not project_response.data:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Project not found"
+        )
     
-    return project_info, recent_memory, spec_context
+    if project_response.data[0]["user_id"] != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied"
+        )
+    
+    # Keyset pagination on (created_at, id); one extra row tells us if there is more
+    query = supabase.table("chat_messages")\
+        .select("*")\
+        .eq("project_id", project_id)
+    
+    forward = after is not None or since is not None
+    if after is not None:
+        created_at, message_id = _decode_cursor(after)
+        query = query.or_(f"created_at.gt.{created_at},and(created_at.eq.{created_at},id.gt.{message_id})")
+    elif since is not None:
+        query = query.gt("created_at", since.isoformat())
+    elif before is not None:
+        created_at, message_id = _decode_cursor(before)
+        query = query.or_(f"created_at.lt.{created_at},and(created_at.eq.{created_at},id.lt.{message_id})")
+    
+    messages_response = await query\
+        .order("created_at", desc=not forward)\
+        .order("id", desc=not forward)\
+        .limit(limit + 1)\
+        .execute()
+    
+    messages = messages_response.data[:limit]
+    has_more = len(messages_response.data) > limit
+    if not forward:
+        messages.reverse()
+    
+    # Older history remains when paging backwards past a full page
+    if messages and not forward and has_more:
+        response.headers["X-Before-Cursor"] = _encode_cursor(messages[0])
+    if messages:
+        response.headers["X-After-Cursor"] = _encode_cursor(messages[-1])
+    elif after is not None:
+        response.headers["X-After-Cursor"] = after
+    response.headers["X-Has-More"] = "true" if has_more else "false"
+    
+    # Messages are immutable, so the page is identified by the request and the ids it holds
+    page_key = "|".join([str(request.query_params), *(str(msg["id"]) for msg in messages)])
+    etag = f'W/"{hashlib.sha1(page_key.encode("utf-8")).hexdigest()}"'
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=dict(response.headers))
+    
+    return [ChatMessageResponse(**msg) for msg in messages]
+
+
+async def get_project_context(project_id: str, query: str):
+    """Get project context for AI"""
+    # Project info, specs, relevant memory and recent chat history
+    return await context_assembler.gather(project_id, query)
 
 
 async def generate_ai_response(user_message: str, project_id: str) -> str:
@@ -155,14 +329,14 @@ async def generate_ai_response(user_message: str, project_id: str) -> str:
     supabase = get_supabase()
     
     # Get project info
-    project = supabase.table("projects").select("name, description").eq("id", project_id).execute()
+    project = await supabase.table("projects").select("name, description").eq("id", project_id).execute()
     project_info = project.data[0] if project.data else {}
     
     # Get recent memory for context
     recent_memory = await memory_service.get_project_memory(project_id)
     
     # Get spec files for context
-    specs = supabase.table("spec_files").select("file_type, content").eq("project_id", project_id).execute()
+    specs = await supabase.table("spec_files").select("file_type, content").eq("project_id", project_id).execute()
     spec_context = {spec["file_type"]: spec["content"][:500] + "..." for spec in specs.data}
     
     message_lower = user_message.lower()
@@ -0,0 +1,63 @@
+from fastapi import APIRouter, HTTPException, status, Depends, Request
+from fastapi.responses import StreamingResponse
+from app.models import User
+from app.auth import get_current_user
+from app.config import settings
+from app.database import get_supabase
+from app.services.event_bus import event_bus
+import json
+
+router = APIRouter()
+
+
+@router.get("")
+async def stream_project_events(
+    project_id: str,
+    request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    """Push task, code change, build and sandbox state changes as Server-Sent Events.
+
+    Event names are ``<table>.<action>`` (e.g. ``task.updated``); a ``resync``
+    event means this client fell behind and should refetch project state.
+    """
+    supabase = get_supabase()
+
+    # Verify project access
+    project_response = await supabase.table("projects")\
+        .select("user_id")\
+        .eq("id", project_id)\
+        .execute()
+
+    if not project_response.data:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Project not found"
+        )
+
+    if project_response.data[0]["user_id"] != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied"
+        )
+
+    subscription = event_bus.subscribe(project_id)
+
+    async def event_stream():
+        try:
+            yield f"retry: {settings.event_retry_ms}\n\n"
+            while not await request.is_disconnected():
+                event = await subscription.get(timeout=settings.event_keepalive_seconds)
+                if event is None:
+                    # Comment frame keeps proxies from closing an idle stream
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+        finally:
+            subscription.close()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,93 +1,155 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import Dict, Any
-from app.models import FileUpdate, User
-from app.auth import get_current_user
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response, status
+from typing import Dict, Any, List
+from app.models import FileUpdate, FileCreate, FileDelete, FileEntry, FileIndex, User
+from app.auth import get_current_user, check_project_access
+from app.database import get_supabase
+from app.services.file_store import file_store, FileStoreConflict
 
 router = APIRouter()
 
+# Store errors that map to client errors
+FILE_ERRORS = (ValueError, OSError, LookupError, FileStoreConflict)
+MAX_BATCH_PATHS = 200
+
+
+async def _verify_project(project_id: str, current_user: User):
+    """404 for an unknown project, 403 for someone else's"""
+    supabase = get_supabase()
+    response = await supabase.table("projects")\
+        .select("user_id")\
+        .eq("id", project_id)\
+        .execute()
+
+    if not response.data:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Project not found"
+        )
+    check_project_access(current_user, response.data[0]["user_id"])
+
+
+def _sync_to_sandbox(project_id: str, files: Dict[str, Any]):
+    """Queue saved changes (None for deletes) for the project's running sandbox"""
+    from app.services.sandbox_service import sandbox_service
+    sandbox_service.sync.enqueue(project_id, files)
+
+
+def _file_error(path: str, error: Exception) -> HTTPException:
+    """Map a file store error to an API error"""
+    if isinstance(error, FileNotFoundError):
+        return HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Path {path} not found")
+    if isinstance(error, LookupError):
+        return HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(error))
+    if isinstance(error, FileExistsError):
+        return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"A file already exists at {path}")
+    if isinstance(error, (IsADirectoryError, NotADirectoryError)):
+        return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"{path} is not a file path")
+    if isinstance(error, FileStoreConflict):
+        return HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(error))
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
+
 
 @router.get("", response_model=Dict[str, Any])
 async def get_project_files(
     project_id: str,
     current_user: User = Depends(get_current_user)
 ):
-    """Get all project files"""
-    # Mock file structure for now - in production this would come from E2B sandbox
-    return {
-        "App.js": {
-            "type": "file",
-            "content": """import React from 'react';
-import { StyleSheet, Text, View } from 'react-native';
-
-export default function App() {
-  return (
-    <View style={styles.container}>
-      <Text>Welcome to your AI-generated app!</Text>
-    </View>
-  );
-}
-
-const styles = StyleSheet.create({
-  container: {
-    flex: 1,
-    backgroundColor: '#fff',
-    alignItems: 'center',
-    justifyContent: 'center',
-  },
-});"""
-        },
-        "package.json": {
-            "type": "file",
-            "content": """{
-  "name": "my-app",
-  "version": "1.0.0",
-  "main": "node_modules/expo/AppEntry.js",
-  "scripts": {
-    "start": "expo start",
-    "android": "expo start --android",
-    "ios": "expo start --ios",
-    "web": "expo start --web"
-  },
-  "dependencies": {
-    "expo": "~49.0.0",
-    "react": "18.2.0",
-    "react-native": "0.72.6"
-  }
-}"""
-        },
-        "components": {
-            "type": "directory",
-            "children": {
-                "Button.js": {
-                    "type": "file",
-                    "content": """import React from 'react';
-import { TouchableOpacity, Text, StyleSheet } from 'react-native';
-
-export default function Button({ title, onPress }) {
-  return (
-    <TouchableOpacity style={styles.button} onPress={onPress}>
-      <Text style={styles.text}>{title}</Text>
-    </TouchableOpacity>
-  );
-}
-
-const styles = StyleSheet.create({
-  button: {
-    backgroundColor: '#007AFF',
-    padding: 12,
-    borderRadius: 8,
-    alignItems: 'center',
-  },
-  text: {
-    color: 'white',
-    fontSize: 16,
-    fontWeight: 'bold',
-  },
-});"""
-                }
-            }
-        }
-    }
+    """Get all project files with their content.
+
+    Editors should prefer ``/index`` or ``/list`` plus ``/read`` for the files
+    they open; this loads every file.
+    """
+    await _verify_project(project_id, current_user)
+    # New projects start from the Expo template
+    try:
+        return await file_store.export_tree(project_id)
+    except FILE_ERRORS as e:
+        raise _file_error("", e)
+
+
+@router.get("/index", response_model=FileIndex)
+async def get_file_index(
+    project_id: str,
+    request: Request,
+    response: Response,
+    current_user: User = Depends(get_current_user)
+):
+    """Flat metadata (path, type, size, hash, mtime) of every file, without content.
+
+    The ETag is the root tree hash, so an unchanged project answers 304.
+    """
+    await _verify_project(project_id, current_user)
+    try:
+        root = await file_store.get_root(project_id)
+    except FILE_ERRORS as e:
+        raise _file_error("", e)
+    etag = f'"{root["root_hash"]}"'
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=dict(response.headers))
+
+    index = await file_store.index(root["root_hash"])
+    return FileIndex(
+        root_hash=root["root_hash"],
+        revision=root["revision"],
+        entries=[
+            FileEntry(path=path, name=path.rsplit("/", 1)[-1], **entry)
+            for path, entry in sorted(index.items())
+        ]
+    )
+
+
+@router.get("/list", response_model=List[FileEntry])
+async def list_directory(
+    project_id: str,
+    path: str = "",
+    recursive: bool = False,
+    current_user: User = Depends(get_current_user)
+):
+    """Metadata of a directory's entries (everything below it with ``recursive``)"""
+    await _verify_project(project_id, current_user)
+    try:
+        entries = await file_store.list_directory(project_id, path, recursive=recursive)
+    except FILE_ERRORS as e:
+        raise _file_error(path, e)
+
+    return [FileEntry(**entry) for entry in entries]
+
+
+@router.get("/read", response_model=Dict[str, str])
+async def read_file(
+    project_id: str,
+    file_path: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Get the content of one file"""
+    await _verify_project(project_id, current_user)
+    try:
+        content = await file_store.read_file(project_id, file_path)
+    except FILE_ERRORS as e:
+        raise _file_error(file_path, e)
+
+    return {"file_path": file_path, "content": content}
+
+
+@router.get("/contents", response_model=Dict[str, str])
+async def read_files(
+    project_id: str,
+    paths: List[str] = Query(...),
+    current_user: User = Depends(get_current_user)
+):
+    """Get the content of several files at once; missing paths are left out"""
+    await _verify_project(project_id, current_user)
+    if len(paths) > MAX_BATCH_PATHS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Request at most {MAX_BATCH_PATHS} paths at once"
+        )
+    try:
+        return await file_store.read_files(project_id, paths)
+    except FILE_ERRORS as e:
+        raise _file_error(", ".join(paths), e)
 
 
 @router.put("", response_model=Dict[str, str])
@@ -97,9 +159,56 @@ async def update_file(
     current_user: User = Depends(get_current_user)
 ):
     """Update a project file"""
-    # In production, this would update the file in the E2B sandbox
-    # For now, just return success
+    await _verify_project(project_id, current_user)
+    try:
+        await file_store.write_file(project_id, file_data.file_path, file_data.content)
+    except FILE_ERRORS as e:
+        raise _file_error(file_data.file_path, e)
+    _sync_to_sandbox(project_id, {file_data.file_path: file_data.content})
+
     return {
         "message": f"File {file_data.file_path} updated successfully",
         "file_path": file_data.file_path
     }
+
+
+@router.post("", response_model=Dict[str, str])
+async def create_file(
+    project_id: str,
+    file_create: FileCreate,
+    current_user: User = Depends(get_current_user)
+):
+    """Create a file or directory (missing parent directories are created)"""
+    await _verify_project(project_id, current_user)
+    try:
+        if await file_store.stat(project_id, file_create.path) is not None:
+            raise FileExistsError(file_create.path)
+        if file_create.type == "directory":
+            await file_store.make_directory(project_id, file_create.path)
+        else:
+            await file_store.write_file(project_id, file_create.path, file_create.content or "")
+            _sync_to_sandbox(project_id, {file_create.path: file_create.content or ""})
+    except FILE_ERRORS as e:
+        raise _file_error(file_create.path, e)
+
+    return {
+        "message": f"{file_create.type.capitalize()} created successfully",
+        "path": file_create.path
+    }
+
+
+@router.delete("", response_model=Dict[str, str])
+async def delete_file(
+    project_id: str,
+    file_delete: FileDelete,
+    current_user: User = Depends(get_current_user)
+):
+    """Delete a file or directory"""
+    await _verify_project(project_id, current_user)
+    try:
+        await file_store.delete_path(project_id, file_delete.path)
+    except FILE_ERRORS as e:
+        raise _file_error(file_delete.path, e)
+    _sync_to_sandbox(project_id, {file_delete.path: None})
+
+    return {"message": f"Deleted {file_delete.path} successfully", "path": file_delete.path}
@@ -3,6 +3,7 @@ from typing import List
 from app.models import Project, ProjectCreate, ProjectUpdate, User
 from app.auth import get_current_user, check_project_access, check_tier_limits
 from app.database import get_supabase
+from app.services.context_assembler import context_assembler
 import uuid
 
 router = APIRouter()
@@ -13,7 +14,7 @@ async def get_projects(current_user: User = Depends(get_current_user)):
     """Get all projects for the current user"""
     supabase = get_supabase()
     
-    response = supabase.table("projects")\
+    response = await supabase.table("projects")\
         .select("*")\
         .eq("user_id", current_user.id)\
         .order("updated_at", desc=True)\
@@ -30,7 +31,7 @@ async def get_project(
     """Get a specific project"""
     supabase = get_supabase()
     
-    response = supabase.table("projects")\
+    response = await supabase.table("projects")\
         .select("*")\
         .eq("id", project_id)\
         .execute()
@@ -56,7 +57,7 @@ async def create_project(
     supabase = get_supabase()
     
     # Check tier limits
-    projects_response = supabase.table("projects")\
+    projects_response = await supabase.table("projects")\
         .select("id")\
         .eq("user_id", current_user.id)\
         .execute()
@@ -85,7 +86,7 @@ async def update_project(
     supabase = get_supabase()
     
     # Check project exists and user has access
-    project_response = supabase.table("projects")\
+    project_response = await supabase.table("projects")\
         .select("*")\
         .eq("id", project_id)\
         .execute()
@@ -103,11 +104,13 @@ async def update_project(
     if not update_data:
         return Project(**project_response.data[0])
     
-    response = supabase.table("projects")\
+    response = await supabase.table("projects")\
         .update(update_data)\
         .eq("id", project_id)\
         .execute()
     
+    context_assembler.snapshots.invalidate(project_id)
+    
     return Project(**response.data[0])
 
 
@@ -120,7 +123,7 @@ async def delete_project(
     supabase = get_supabase()
     
     # Check project exists and user has access
-    project_response = supabase.table("projects")\
+    project_response = await supabase.table("projects")\
         .select("user_id")\
         .eq("id", project_id)\
         .execute()
@@ -134,6 +137,7 @@ async def delete_project(
     check_project_access(current_user, project_response.data[0]["user_id"])
     
     # Delete project (cascade will handle related records)
-    supabase.table("projects").delete().eq("id", project_id).execute()
+    await supabase.table("projects").delete().eq("id", project_id).execute()
+    context_assembler.snapshots.invalidate(project_id)
     
     return None
@@ -2,12 +2,31 @@ from fastapi import APIRouter, HTTPException, status, Depends
 from typing import List
 from app.models import SpecFile, SpecVersion, SpecFileUpdate, SpecRollback, User
 from app.auth import get_current_user
-from app.database import get_supabase
-import uuid
+from app.database import get_supabase, DatabaseError
+from app.services.context_assembler import context_assembler
+from app.services.spec_history import spec_history
 
 router = APIRouter()
 
 
+def _save_error(error: DatabaseError) -> HTTPException:
+    """Map a failed save_spec_version call to an API error"""
+    if error.status_code == status.HTTP_409_CONFLICT:
+        return HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Spec file was changed by someone else: {error.message}"
+        )
+    if error.status_code == status.HTTP_404_NOT_FOUND:
+        return HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Spec file not found"
+        )
+    return HTTPException(
+        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        detail=f"Failed to save spec file: {error.message}"
+    )
+
+
 @router.get("/{file_type}", response_model=SpecFile)
 async def get_spec_file(
     project_id: str,
@@ -17,7 +36,7 @@ async def get_spec_file(
     """Get a spec file"""
     supabase = get_supabase()
     
-    response = supabase.table("spec_files")\
+    response = await supabase.table("spec_files")\
         .select("*")\
         .eq("project_id", project_id)\
         .eq("file_type", file_type)\
@@ -31,6 +50,8 @@ async def get_spec_file(
             detail="Spec file not found"
         )
     
+    spec_history.remember(response.data[0])
+    
     return SpecFile(**response.data[0])
 
 
@@ -41,65 +62,41 @@ async def update_spec_file(
     spec_data: SpecFileUpdate,
     current_user: User = Depends(get_current_user)
 ):
-    """Update a spec file (creates new version)"""
-    supabase = get_supabase()
-    
-    # Get current spec file
-    current_response = supabase.table("spec_files")\
-        .select("*")\
-        .eq("project_id", project_id)\
-        .eq("file_type", file_type)\
-        .order("version", desc=True)\
-        .limit(1)\
-        .execute()
-    
-    if not current_response.data:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Spec file not found"
+    """Update a spec file (creates new version).
+
+    Pass ``expected_version`` (the version being edited) to get a 409 instead
+    of overwriting a concurrent save.
+    """
+    # History row and new version are written atomically in one call
+    try:
+        spec = await spec_history.save(
+            project_id,
+            file_type,
+            spec_data.content,
+            "Updated via editor",
+            current_user.id,
+            expected_version=spec_data.expected_version,
         )
+    except DatabaseError as e:
+        raise _save_error(e)
     
-    current_spec = current_response.data[0]
-    
-    # Save current version to history
-    import uuid
-    version_id = str(uuid.uuid4())
-    version_data = {
-        "id": version_id,
-        "spec_file_id": current_spec["id"],
-        "version": current_spec["version"],
-        "content": current_spec["content"],
-        "changes_summary": "Updated via editor",
-        "created_by": current_user.id,
-    }
-    supabase.table("spec_versions").insert(version_data).execute()
-    
-    # Update spec file with new content and increment version
-    new_version = current_spec["version"] + 1
-    update_data = {
-        "content": spec_data.content,
-        "version": new_version,
-    }
-    
-    response = supabase.table("spec_files")\
-        .update(update_data)\
-        .eq("id", current_spec["id"])\
-        .execute()
+    context_assembler.snapshots.invalidate(project_id)
     
-    return SpecFile(**response.data[0])
+    return SpecFile(**spec)
 
 
 @router.get("/{file_type}/versions", response_model=List[SpecVersion])
 async def get_spec_versions(
     project_id: str,
     file_type: str,
+    include_content: bool = False,
     current_user: User = Depends(get_current_user)
 ):
-    """Get version history for a spec file"""
+    """Get version history for a spec file (metadata only unless include_content)"""
     supabase = get_supabase()
     
     # Get spec file id
-    spec_response = supabase.table("spec_files")\
+    spec_response = await supabase.table("spec_files")\
         .select("id")\
         .eq("project_id", project_id)\
         .eq("file_type", file_type)\
@@ -112,13 +109,9 @@ async def get_spec_versions(
     spec_file_id = spec_response.data[0]["id"]
     
     # Get versions
-    versions_response = supabase.table("spec_versions")\
-        .select("*")\
-        .eq("spec_file_id", spec_file_id)\
-        .order("version", desc=True)\
-        .execute()
+    versions = await spec_history.list_versions(spec_file_id, include_content=include_content)
     
-    return [SpecVersion(**version) for version in versions_response.data]
+    return [SpecVersion(**version) for version in versions]
 
 
 @router.post("/{file_type}/rollback", response_model=SpecFile)
@@ -132,8 +125,8 @@ async def rollback_spec(
     supabase = get_supabase()
     
     # Get the version to rollback to
-    version_response = supabase.table("spec_versions")\
-        .select("*")\
+    version_response = await supabase.table("spec_versions")\
+        .select("id, spec_file_id, version")\
         .eq("id", rollback_data.version_id)\
         .execute()
     
@@ -144,44 +137,23 @@ async def rollback_spec(
         )
     
     version = version_response.data[0]
-    
-    # Get current spec file
-    spec_response = supabase.table("spec_files")\
-        .select("*")\
-        .eq("id", version["spec_file_id"])\
-        .execute()
-    
-    if not spec_response.data:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Spec file not found"
+    content = await spec_history.get_content(version["spec_file_id"], version["version"])
+    
+    # Save current state to history and restore the old content in one call;
+    # spec_file_id ensures the version belongs to this project's spec
+    try:
+        spec = await spec_history.save(
+            project_id,
+            file_type,
+            content,
+            f"Before rollback to version {version['version']}",
+            current_user.id,
+            expected_version=rollback_data.expected_version,
+            spec_file_id=version["spec_file_id"],
         )
+    except DatabaseError as e:
+        raise _save_error(e)
     
-    current_spec = spec_response.data[0]
-    
-    # Save current state to history before rollback
-    import uuid
-    history_id = str(uuid.uuid4())
-    history_data = {
-        "id": history_id,
-        "spec_file_id": current_spec["id"],
-        "version": current_spec["version"],
-        "content": current_spec["content"],
-        "changes_summary": f"Before rollback to version {version['version']}",
-        "created_by": current_user.id,
-    }
-    supabase.table("spec_versions").insert(history_data).execute()
-    
-    # Update spec file with rolled back content
-    new_version = current_spec["version"] + 1
-    update_data = {
-        "content": version["content"],
-        "version": new_version,
-    }
-    
-    response = supabase.table("spec_files")\
-        .update(update_data)\
-        .eq("id", current_spec["id"])\
-        .execute()
+    context_assembler.snapshots.invalidate(project_id)
     
-    return SpecFile(**response.data[0])
+    return SpecFile(**spec)
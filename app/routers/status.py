@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends
 from app.models import User
-from app.auth import get_current_user
+from app.auth import get_current_user, user_cache
 from app.database import get_supabase
 
 router = APIRouter()
@@ -15,7 +15,7 @@ async def get_project_summary(
     supabase = get_supabase()
     
     # Get project info
-    project = supabase.table("projects")\
+    project = await supabase.table("projects")\
         .select("*")\
         .eq("id", project_id)\
         .eq("user_id", current_user.id)\
@@ -25,26 +25,26 @@ async def get_project_summary(
         return {"error": "Project not found"}
     
     # Get spec files count
-    specs = supabase.table("spec_files")\
+    specs = await supabase.table("spec_files")\
         .select("file_type", count="exact")\
         .eq("project_id", project_id)\
         .execute()
     
     # Get tasks count
-    tasks = supabase.table("tasks")\
+    tasks = await supabase.table("tasks")\
         .select("status", count="exact")\
         .eq("project_id", project_id)\
         .execute()
     
     # Get pending changes count
-    pending_changes = supabase.table("code_changes")\
+    pending_changes = await supabase.table("code_changes")\
         .select("id", count="exact")\
         .eq("tasks.project_id", project_id)\
         .is_("approved", "null")\
         .execute()
     
     # Get approved changes count
-    approved_changes = supabase.table("code_changes")\
+    approved_changes = await supabase.table("code_changes")\
         .select("id", count="exact")\
         .eq("tasks.project_id", project_id)\
         .eq("approved", True)\
@@ -68,4 +68,33 @@ async def health_check():
         "status": "healthy",
         "service": "Spec-Driven AI App Builder API",
         "version": "1.0.0"
-    }
\ No newline at end of file
+    }
+
+
+@router.get("/metrics")
+async def get_metrics(current_user: User = Depends(get_current_user)):
+    """Runtime metrics for monitoring (authenticated: exposes cache, queue and sandbox internals)"""
+    from app.services.task_queue import task_queue
+    from app.services.chat_stream import stream_metrics
+    from app.services.agent_executor import agent_executor
+    from app.services.response_cache import response_cache
+    from app.services.memory_service import memory_service
+    from app.services.context_assembler import context_assembler
+    from app.services.event_bus import event_bus
+    from app.services.spec_history import spec_history
+    from app.services.file_store import file_store
+    from app.services.sandbox_service import sandbox_service
+    
+    return {
+        "user_cache": user_cache.stats(),
+        "task_queue": task_queue.stats(),
+        "chat_stream": stream_metrics.stats(),
+        "agent_executor": agent_executor.stats(),
+        "response_cache": response_cache.stats(),
+        "project_memory": memory_service.stats(),
+        "context_assembly": context_assembler.stats(),
+        "event_bus": event_bus.stats(),
+        "spec_saves": spec_history.stats(),
+        "file_store": file_store.stats(),
+        "sandboxes": sandbox_service.stats(),
+    }
@@ -12,7 +12,7 @@ async def get_subscription(current_user: User = Depends(get_current_user)):
     supabase = get_supabase()
     
     # Get projects count
-    projects_response = supabase.table("projects")\
+    projects_response = await supabase.table("projects")\
         .select("id")\
         .eq("user_id", current_user.id)\
         .execute()
@@ -41,4 +41,6 @@ async def upgrade_subscription(
 ):
     """Upgrade subscription tier"""
     # TODO: Implement Polar payment integration
+    # Once tier/credits are written, call app.auth.invalidate_user(current_user.id)
+    # so the cached user reflects the new subscription on the next request.
     raise HTTPException(status_code=501, detail="Payment integration not implemented yet")
@@ -0,0 +1,106 @@
+"""
+Execution layer that runs blocking Agno calls off the event loop
+"""
+from typing import Any, Callable, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import Request
+from app.config import settings
+from app.metrics import LatencyRecorder
+import asyncio
+import functools
+import time
+
+
+class AgentExecutor:
+    """Dispatches blocking agent calls to a dedicated thread pool.
+
+    Concurrency is bounded per tier with semaphores so free-tier traffic cannot
+    starve paid tiers. Callers that pass the incoming ``Request`` are cancelled
+    when the client disconnects: queued work is dropped before it starts, and
+    running work has its result discarded (the thread keeps its slot until the
+    call returns, so the pool is never oversubscribed).
+    """
+
+    def __init__(self):
+        self._pool = ThreadPoolExecutor(
+            max_workers=settings.agent_thread_pool_size,
+            thread_name_prefix="agno"
+        )
+        self._limits = {
+            "free": settings.agent_concurrency_free,
+            "pro": settings.agent_concurrency_pro,
+            "premium": settings.agent_concurrency_premium,
+        }
+        self._semaphores = {tier: asyncio.Semaphore(limit) for tier, limit in self._limits.items()}
+        self._waiting = {tier: 0 for tier in self._limits}
+        self._running = {tier: 0 for tier in self._limits}
+        self._cancelled = 0
+        self.wait_time = LatencyRecorder()
+        self.run_time = LatencyRecorder()
+
+    def _tier(self, tier: Any) -> str:
+        tier = getattr(tier, "value", tier)
+        return tier if tier in self._semaphores else "free"
+
+    async def run(self, tier: Any, fn: Callable, *args, request: Optional[Request] = None, **kwargs) -> Any:
+        """Run ``fn(*args, **kwargs)`` in the pool under the tier's concurrency limit"""
+        call = self._run(self._tier(tier), functools.partial(fn, *args, **kwargs))
+        if request is None:
+            return await call
+        return await self._cancel_on_disconnect(call, request)
+
+    async def _run(self, tier: str, call: Callable) -> Any:
+        semaphore = self._semaphores[tier]
+        queued_at = time.perf_counter()
+
+        self._waiting[tier] += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self._waiting[tier] -= 1
+        self.wait_time.record((time.perf_counter() - queued_at) * 1000)
+
+        started = time.perf_counter()
+        self._running[tier] += 1
+        future = asyncio.get_running_loop().run_in_executor(self._pool, call)
+
+        def release(_):
+            self._running[tier] -= 1
+            self.run_time.record((time.perf_counter() - started) * 1000)
+            semaphore.release()
+
+        future.add_done_callback(release)
+        # Shield so cancelling the caller does not release the slot before the thread finishes
+        return await asyncio.shield(future)
+
+    async def _cancel_on_disconnect(self, call, request: Request) -> Any:
+        """Await ``call`` but cancel it if the client goes away"""
+        work = asyncio.ensure_future(call)
+        while not work.done():
+            done, _ = await asyncio.wait({work}, timeout=settings.agent_disconnect_poll_seconds)
+            if done:
+                break
+            if await request.is_disconnected():
+                work.cancel()
+                self._cancelled += 1
+                break
+        return await work
+
+    def shutdown(self):
+        """Stop the thread pool"""
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and latency metrics"""
+        return {
+            "limits": self._limits,
+            "queue_depth": dict(self._waiting),
+            "running": dict(self._running),
+            "cancelled": self._cancelled,
+            "wait_time": self.wait_time.stats(),
+            "run_time": self.run_time.stats(),
+        }
+
+
+# Singleton instance
+agent_executor = AgentExecutor()
@@ -0,0 +1,77 @@
+"""
+Factory for per-request Agno agents built from per-tier configurations
+"""
+from typing import Any, Dict, Optional, Tuple
+from agno import Agent
+
+
+# Agent profiles keyed by agent type
+AGENT_PROFILES: Dict[str, Dict[str, Any]] = {
+    # Design Agent for UI/UX tasks
+    "design": {
+        "name": "DesignAgent",
+        "role": "UI/UX Designer and React Native Developer",
+        "goal": "Create beautiful, functional, and accessible React Native components",
+        "backstory": """You are an expert UI/UX designer and React Native developer with years of experience 
+            creating mobile applications. You understand modern design principles, accessibility standards, 
+            and React Native best practices. You create components that are both visually appealing and 
+            highly functional.""",
+    },
+    # Backend Agent for API and database tasks
+    "backend": {
+        "name": "BackendAgent",
+        "role": "Backend Developer and API Architect",
+        "goal": "Design and implement robust backend systems and APIs",
+        "backstory": """You are a senior backend developer with expertise in FastAPI, Supabase, 
+            and modern API design. You create scalable, secure, and well-documented backend systems 
+            that integrate seamlessly with mobile applications.""",
+    },
+    # Testing Agent for quality assurance
+    "testing": {
+        "name": "TestingAgent",
+        "role": "QA Engineer and Test Automation Specialist",
+        "goal": "Ensure code quality through comprehensive testing strategies",
+        "backstory": """You are a quality assurance expert who believes in test-driven development. 
+            You create comprehensive test suites that catch bugs early and ensure code reliability. 
+            You understand both unit testing and integration testing for mobile applications.""",
+    },
+    # Chat Agent for general assistance
+    "chat": {
+        "name": "ChatAgent",
+        "role": "AI Development Assistant",
+        "goal": "Provide helpful guidance and assistance for mobile app development",
+        "backstory": """You are a friendly and knowledgeable AI assistant specializing in mobile 
+            app development. You help developers understand their code, debug issues, and implement 
+            new features. You communicate clearly and provide actionable advice.""",
+    },
+}
+
+
+class AgentFactory:
+    """Resolves one configuration per (agent type, tier) at startup.
+
+    ``get`` builds a fresh Agent from that configuration on every call, so
+    memory and run state created by the Agent constructor belong to a single
+    request and are never shared between concurrent requests or tenants.
+    Only the immutable profile and the (thread-safe) model are reused.
+    """
+
+    def __init__(self, models: Dict[str, Any]):
+        self._configs: Dict[Tuple[str, str], Tuple[Dict[str, Any], Any]] = {}
+        for agent_type, profile in AGENT_PROFILES.items():
+            for tier, model in models.items():
+                self._configs[(agent_type, tier)] = (profile, model)
+
+    def get(self, agent_type: str, tier: Any, memory: Optional[Any] = None) -> Agent:
+        """Get a per-request agent instance"""
+        tier = getattr(tier, "value", tier)
+        config = self._configs.get((agent_type, tier)) or self._configs.get((agent_type, "free"))
+        if config is None:
+            raise ValueError(f"Unknown agent type: {agent_type}")
+
+        profile, model = config
+        agent = Agent(**profile, tools=[], verbose=True)
+        agent.llm = model
+        if memory is not None:
+            agent.memory = memory
+        return agent
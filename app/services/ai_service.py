@@ -1,13 +1,26 @@
 """
 AI service using Agno framework for multi-agent orchestration
 """
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, AsyncIterator
 from app.models import User
 from app.config import settings
 import os
-from agno import Agent, Workflow, Task
+from agno import Workflow, Task
 from agno.models import OpenAI, Gemini
-import json
+from fastapi import Request
+from app.services.agent_executor import agent_executor
+from app.services.agent_factory import AgentFactory
+from app.services.context_assembler import context_assembler, TIER_TOKEN_BUDGETS
+import asyncio
+import re
+import time
+
+# Where each agent type's output goes, matching the single-agent generators
+AGENT_OUTPUT_PATHS = {
+    "design": "components/GeneratedComponent{suffix}.js",
+    "backend": "api/generated_endpoints{suffix}.py",
+    "testing": "__tests__/generated{suffix}.test.js",
+}
 
 
 class AIService:
@@ -20,74 +33,22 @@ class AIService:
                 model="deepseek-chat",
                 api_key=settings.deepseek_api_key,
                 base_url="https://api.deepseek.com/v1",
-                max_tokens=2048
+                max_tokens=TIER_TOKEN_BUDGETS["free"]
             ),
             "pro": Gemini(
                 model="gemini-2.5", 
-                max_tokens=4096,
+                max_tokens=TIER_TOKEN_BUDGETS["pro"],
                 api_key=settings.google_api_key
             ),
             "premium": Gemini(
                 model="gemini-2.5", 
-                max_tokens=8192,
+                max_tokens=TIER_TOKEN_BUDGETS["premium"],
                 api_key=settings.google_api_key
             )
         }
         
-        # Initialize specialized agents
-        self._init_agents()
-    
-    def _init_agents(self):
-        """Initialize Agno agents for different tasks"""
-        
-        # Design Agent for UI/UX tasks
-        self.design_agent = Agent(
-            name="DesignAgent",
-            role="UI/UX Designer and React Native Developer",
-            goal="Create beautiful, functional, and accessible React Native components",
-            backstory="""You are an expert UI/UX designer and React Native developer with years of experience 
-            creating mobile applications. You understand modern design principles, accessibility standards, 
-            and React Native best practices. You create components that are both visually appealing and 
-            highly functional.""",
-            tools=[],
-            verbose=True
-        )
-        
-        # Backend Agent for API and database tasks
-        self.backend_agent = Agent(
-            name="BackendAgent", 
-            role="Backend Developer and API Architect",
-            goal="Design and implement robust backend systems and APIs",
-            backstory="""You are a senior backend developer with expertise in FastAPI, Supabase, 
-            and modern API design. You create scalable, secure, and well-documented backend systems 
-            that integrate seamlessly with mobile applications.""",
-            tools=[],
-            verbose=True
-        )
-        
-        # Testing Agent for quality assurance
-        self.testing_agent = Agent(
-            name="TestingAgent",
-            role="QA Engineer and Test Automation Specialist", 
-            goal="Ensure code quality through comprehensive testing strategies",
-            backstory="""You are a quality assurance expert who believes in test-driven development. 
-            You create comprehensive test suites that catch bugs early and ensure code reliability. 
-            You understand both unit testing and integration testing for mobile applications.""",
-            tools=[],
-            verbose=True
-        )
-        
-        # Chat Agent for general assistance
-        self.chat_agent = Agent(
-            name="ChatAgent",
-            role="AI Development Assistant",
-            goal="Provide helpful guidance and assistance for mobile app development",
-            backstory="""You are a friendly and knowledgeable AI assistant specializing in mobile 
-            app development. You help developers understand their code, debug issues, and implement 
-            new features. You communicate clearly and provide actionable advice.""",
-            tools=[],
-            verbose=True
-        )
+        # Per-request agents built from per-tier templates
+        self.agents = AgentFactory(self.models)
     
     async def generate_response(
         self, 
@@ -95,89 +56,134 @@ class AIService:
         prompt: str, 
         context: Optional[Dict] = None,
         system_prompt: Optional[str] = None,
-        project_id: Optional[str] = None
+        project_id: Optional[str] = None,
+        request: Optional[Request] = None
     ) -> str:
         """Generate AI response using Agno chat agent with memory"""
-        model = self.models.get(user.tier, self.models["free"])
-        self.chat_agent.llm = model
+        # Per-request agent with project memory if project_id is available
+        memory = await self._get_agent_memory(project_id) if project_id else None
+        chat_agent = self.agents.get("chat", user.tier, memory=memory)
         
-        # Get relevant memory context if project_id is provided
-        memory_context = ""
-        if project_id:
-            from app.services.memory_service import memory_service
-            memory_context = await memory_service.get_relevant_context(
-                project_id, prompt, context_type=None
-            )
-        
-        # Create context-aware prompt
-        full_prompt = prompt
-        
-        # Add memory context
-        if memory_context:
-            full_prompt = f"Relevant Context from Project Memory:\n{memory_context}\n\nUser Request: {prompt}"
-        
-        # Add additional context
-        if context:
-            context_str = f"Project Context: {json.dumps(context, indent=2)}\n\n"
-            full_prompt = context_str + full_prompt
-        
-        if system_prompt:
-            full_prompt = f"System: {system_prompt}\n\nUser: {full_prompt}"
-        
-        # Set memory for the agent if project_id is available
-        if project_id:
-            # Configure agent to use Agno memory
-            self.chat_agent.memory = self._get_agent_memory(project_id)
+        full_prompt = await self._build_chat_prompt(prompt, context, system_prompt, project_id, user.tier)
         
         # Create and execute task
         task = Task(
             description=full_prompt,
-            agent=self.chat_agent,
+            agent=chat_agent,
             expected_output="A helpful and detailed response to the user's question or request"
         )
         
         # Create workflow and execute
         workflow = Workflow(
-            agents=[self.chat_agent],
+            agents=[chat_agent],
             tasks=[task],
             verbose=True
         )
         
-        result = workflow.kickoff()
+        result = await agent_executor.run(user.tier, workflow.kickoff, request=request)
+        
+        # Persisting the exchange to chat history and memory is the caller's job
+        return result
+    
+    async def stream_response(
+        self,
+        user: User,
+        prompt: str,
+        context: Optional[Dict] = None,
+        system_prompt: Optional[str] = None,
+        project_id: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """Stream an AI response token by token.
+        
+        Persisting the finished message (chat history and memory) is left to the
+        caller, which knows when the stream has been fully delivered.
+        """
+        from app.services.chat_stream import get_token_model, timed_stream, stream_metrics
+        
+        memory = await self._get_agent_memory(project_id) if project_id else None
+        chat_agent = self.agents.get("chat", user.tier, memory=memory)
+        
+        full_prompt = await self._build_chat_prompt(prompt, context, system_prompt, project_id, user.tier)
+        token_model = get_token_model(chat_agent, user.tier)
+        
+        async for token in timed_stream(token_model.stream(full_prompt), stream_metrics):
+            yield token
+    
+    async def _build_chat_prompt(
+        self,
+        prompt: str,
+        context: Optional[Dict],
+        system_prompt: Optional[str],
+        project_id: Optional[str],
+        user_tier: Any
+    ) -> str:
+        """Assemble the chat prompt from memory, project context and system prompt"""
+        context = dict(context or {})
         
-        # Store the interaction in memory
-        if project_id:
+        # Get relevant memory hits if the caller didn't gather them already
+        if project_id and "memory" not in context:
             from app.services.memory_service import memory_service
-            await memory_service.store_conversation(project_id, "user", prompt)
-            await memory_service.store_conversation(project_id, "assistant", result)
+            context["memory"] = await memory_service.search_memory(
+                project_id, prompt, limit=settings.context_memory_hits
+            )
         
-        return result
+        # Pack the most useful context into the tier's token budget
+        context_str = context_assembler.pack(
+            context, prompt, user_tier, reserved=f"{system_prompt or ''}\n{prompt}"
+        )
+        
+        # Create context-aware prompt
+        full_prompt = prompt
+        if context_str:
+            full_prompt = f"{context_str}\n\nUser Request: {prompt}"
+        
+        if system_prompt:
+            full_prompt = f"System: {system_prompt}\n\nUser: {full_prompt}"
+        
+        return full_prompt
     
     async def generate_code(
         self, 
         user: User, 
         task_description: str, 
         agent_type: str,
-        project_context: Optional[Dict] = None
+        project_context: Optional[Dict] = None,
+        use_cache: bool = True
     ) -> Dict[str, Any]:
-        """Generate code using appropriate Agno agent"""
-        model = self.models.get(user.tier, self.models["free"])
+        """Generate code using appropriate Agno agent (served from the response cache when possible)"""
+        from app.services.response_cache import response_cache
+        
+        generators = {
+            "design": self._generate_design_code,
+            "backend": self._generate_backend_code,
+            "testing": self._generate_testing_code,
+        }
         
         # Select appropriate agent
-        if agent_type == "design":
-            agent = self.design_agent
-            agent.llm = model
-            return await self._generate_design_code(task_description, project_context, user.tier)
-        elif agent_type == "backend":
-            agent = self.backend_agent
-            agent.llm = model
-            return await self._generate_backend_code(task_description, project_context, user.tier)
-        elif agent_type == "testing":
-            agent = self.testing_agent
-            agent.llm = model
-            return await self._generate_testing_code(task_description, project_context, user.tier)
-        else:
+        generate = generators.get(agent_type)
+        if generate is None:
             raise ValueError(f"Unknown agent type: {agent_type}")
+        
+        if not use_cache:
+            response_cache.record_bypass()
+            return await generate(task_description, project_context, user.tier)
+        
+        cache_key = response_cache.make_key(
+            agent_type, user.tier, self._model_name(user.tier), task_description,
+            context_assembler.stable_sources(project_context)
+        )
+        cached = await response_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        result = await generate(task_description, project_context, user.tier)
+        await response_cache.set(cache_key, result)
+        return result
+    
+    def _model_name(self, tier: Any) -> str:
+        """Identifier of the model serving a tier"""
+        model = self.models.get(getattr(tier, "value", tier), self.models["free"])
+        return str(getattr(model, "id", None) or getattr(model, "model", None) or type(model).__name__)
     
     async def _generate_design_code(
         self, 
@@ -186,10 +192,11 @@ class AIService:
         user_tier: str
     ) -> Dict[str, Any]:
         """Generate React Native UI components using Design Agent"""
+        agent = self.agents.get("design", user_tier)
         
-        context_str = ""
-        if project_context:
-            context_str = f"Project Context: {json.dumps(project_context, indent=2)}\n\n"
+        context_str = context_assembler.pack(project_context, task_description, user_tier)
+        if context_str:
+            context_str = f"{context_str}\n\n"
         
         prompt = f"""{context_str}Task: {task_description}
 
@@ -204,17 +211,17 @@ Provide the component code and any necessary supporting files."""
         
         task = Task(
             description=prompt,
-            agent=self.design_agent,
+            agent=agent,
             expected_output="React Native component code with proper styling and functionality"
         )
         
         workflow = Workflow(
-            agents=[self.design_agent],
+            agents=[agent],
             tasks=[task],
             verbose=True
         )
         
-        result = workflow.kickoff()
+        result = await agent_executor.run(user_tier, workflow.kickoff)
         
         # Parse the result and format as expected
         return {
@@ -231,10 +238,11 @@ Provide the component code and any necessary supporting files."""
         user_tier: str
     ) -> Dict[str, Any]:
         """Generate backend code using Backend Agent"""
+        agent = self.agents.get("backend", user_tier)
         
-        context_str = ""
-        if project_context:
-            context_str = f"Project Context: {json.dumps(project_context, indent=2)}\n\n"
+        context_str = context_assembler.pack(project_context, task_description, user_tier)
+        if context_str:
+            context_str = f"{context_str}\n\n"
         
         prompt = f"""{context_str}Task: {task_description}
 
@@ -246,17 +254,17 @@ Provide complete, production-ready code with proper error handling and documenta
         
         task = Task(
             description=prompt,
-            agent=self.backend_agent,
+            agent=agent,
             expected_output="Backend code including API endpoints and database schemas"
         )
         
         workflow = Workflow(
-            agents=[self.backend_agent],
+            agents=[agent],
             tasks=[task],
             verbose=True
         )
         
-        result = workflow.kickoff()
+        result = await agent_executor.run(user_tier, workflow.kickoff)
         
         return {
             "files": {
@@ -272,10 +280,11 @@ Provide complete, production-ready code with proper error handling and documenta
         user_tier: str
     ) -> Dict[str, Any]:
         """Generate test code using Testing Agent"""
+        agent = self.agents.get("testing", user_tier)
         
-        context_str = ""
-        if project_context:
-            context_str = f"Project Context: {json.dumps(project_context, indent=2)}\n\n"
+        context_str = context_assembler.pack(project_context, task_description, user_tier)
+        if context_str:
+            context_str = f"{context_str}\n\n"
         
         prompt = f"""{context_str}Task: {task_description}
 
@@ -287,17 +296,17 @@ Provide complete test files with proper setup, teardown, and assertions."""
         
         task = Task(
             description=prompt,
-            agent=self.testing_agent,
+            agent=agent,
             expected_output="Comprehensive test suite with unit and integration tests"
         )
         
         workflow = Workflow(
-            agents=[self.testing_agent],
+            agents=[agent],
             tasks=[task],
             verbose=True
         )
         
-        result = workflow.kickoff()
+        result = await agent_executor.run(user_tier, workflow.kickoff)
         
         return {
             "files": {
@@ -312,79 +321,137 @@ Provide complete test files with proper setup, teardown, and assertions."""
         tasks: List[Dict[str, Any]],
         project_context: Optional[Dict] = None
     ) -> List[Dict[str, Any]]:
-        """Coordinate multiple agents working on related tasks"""
-        model = self.models.get(user.tier, self.models["free"])
+        """Coordinate multiple agents working on related tasks.
+        
+        Each task may carry an ``id`` (defaults to its index), a ``depends_on``
+        list of task ids and a ``file_path`` for its output (defaults to a path
+        for its agent type, suffixed with the task id). Independent tasks run concurrently; a task starts as soon
+        as its dependencies finish and receives their output as extra context.
+        Results come back in submission order with per-agent timings.
+        """
+        nodes: Dict[str, Dict[str, Any]] = {}
+        for index, task_data in enumerate(tasks):
+            if task_data.get("agent_type") not in ("design", "backend", "testing"):
+                continue
+            task_id = str(task_data.get("id", index))
+            nodes[task_id] = {
+                **task_data,
+                "depends_on": [str(dep) for dep in task_data.get("depends_on", [])],
+            }
         
-        # Set model for all agents
-        self.design_agent.llm = model
-        self.backend_agent.llm = model
-        self.testing_agent.llm = model
+        if not nodes:
+            return []
         
-        # Create tasks for each agent
-        agno_tasks = []
-        agents_used = []
+        self._check_task_graph(nodes)
         
-        for task_data in tasks:
-            agent_type = task_data.get("agent_type")
-            description = task_data.get("description")
-            
-            if agent_type == "design":
-                agent = self.design_agent
-            elif agent_type == "backend":
-                agent = self.backend_agent
-            elif agent_type == "testing":
-                agent = self.testing_agent
-            else:
-                continue
+        # One packed context shared by every task in the graph
+        context_str = context_assembler.pack(
+            project_context, "\n".join(node.get("description") or "" for node in nodes.values()), user.tier
+        )
+        if context_str:
+            context_str = f"{context_str}\n\n"
+        
+        started = time.perf_counter()
+        runs: Dict[str, asyncio.Task] = {}
+        
+        async def run_node(task_id: str) -> Dict[str, Any]:
+            node = nodes[task_id]
+            agent_type = node["agent_type"]
             
-            context_str = ""
-            if project_context:
-                context_str = f"Project Context: {json.dumps(project_context, indent=2)}\n\n"
+            # Wait for upstream tasks and pass their output along
+            upstream = await asyncio.gather(*(runs[dep] for dep in node["depends_on"]))
+            upstream_str = "".join(
+                f"Output of {dep['agent_type']} task {dep['task_id']}:\n{dep['output']}\n\n"
+                for dep in upstream
+            )
             
+            agent = self.agents.get(agent_type, user.tier)
             task = Task(
-                description=f"{context_str}{description}",
+                description=f"{context_str}{upstream_str}{node.get('description')}",
                 agent=agent,
                 expected_output=f"Code implementation for {agent_type} task"
             )
-            
-            agno_tasks.append(task)
-            agents_used.append(agent)
-        
-        # Create coordinated workflow
-        if agno_tasks:
             workflow = Workflow(
-                agents=agents_used,
-                tasks=agno_tasks,
+                agents=[agent],
+                tasks=[task],
                 verbose=True
             )
             
-            results = workflow.kickoff()
+            agent_started = time.perf_counter()
+            result = await agent_executor.run(user.tier, workflow.kickoff)
+            finished = time.perf_counter()
             
-            # Format results
-            formatted_results = []
-            for i, result in enumerate(results if isinstance(results, list) else [results]):
+            return {
+                "task_id": task_id,
+                "agent_type": agent_type,
+                "output": result,
+                "started_ms": round((agent_started - started) * 1000, 2),
+                "duration_ms": round((finished - agent_started) * 1000, 2),
+            }
+        
+        # All runs are registered before any of them starts awaiting dependencies
+        for task_id in nodes:
+            runs[task_id] = asyncio.ensure_future(run_node(task_id))
+        
+        outcomes = await asyncio.gather(*runs.values(), return_exceptions=True)
+        
+        # Format results
+        formatted_results = []
+        for task_id, outcome in zip(runs.keys(), outcomes):
+            node = nodes[task_id]
+            if isinstance(outcome, Exception):
                 formatted_results.append({
-                    "agent_type": tasks[i].get("agent_type"),
-                    "files": {f"generated_{i}.js": result},
-                    "reasoning": f"Generated by Agno {tasks[i].get('agent_type')} agent"
+                    "task_id": task_id,
+                    "agent_type": node["agent_type"],
+                    "files": {},
+                    "reasoning": f"Agno {node['agent_type']} agent failed: {outcome}",
+                    "error": str(outcome),
                 })
+                continue
             
-            return formatted_results
-        
-        return []
+            formatted_results.append({
+                "task_id": task_id,
+                "agent_type": node["agent_type"],
+                "files": {self._output_path(node, task_id): outcome["output"]},
+                "reasoning": f"Generated by Agno {node['agent_type']} agent",
+                "timing": {
+                    "started_ms": outcome["started_ms"],
+                    "duration_ms": outcome["duration_ms"],
+                },
+            })
+        
+        return formatted_results
     
-    def _get_agent_memory(self, project_id: str):
-        """Get Agno memory instance for an agent"""
-        from agno.memory import Memory
-        
-        # Return project-specific memory instance
-        return Memory(
-            memory_id=f"agent_{project_id}",
-            storage_backend="supabase",
-            embedding_model="text-embedding-ada-002",
-            max_memory_items=500,
-            similarity_threshold=0.7
-        )
+    def _output_path(self, node: Dict[str, Any], task_id: str) -> str:
+        """File a coordinated task's output is written to"""
+        if node.get("file_path"):
+            return node["file_path"]
+        suffix = re.sub(r"\W+", "_", task_id).strip("_")
+        return AGENT_OUTPUT_PATHS[node["agent_type"]].format(suffix=f"_{suffix}" if suffix else "")
+    
+    def _check_task_graph(self, nodes: Dict[str, Dict[str, Any]]):
+        """Reject unknown dependencies and dependency cycles"""
+        remaining = {}
+        for task_id, node in nodes.items():
+            for dep in node["depends_on"]:
+                if dep not in nodes:
+                    raise ValueError(f"Task {task_id} depends on unknown task {dep}")
+            remaining[task_id] = set(node["depends_on"])
+        
+        while remaining:
+            ready = [task_id for task_id, deps in remaining.items() if not deps]
+            if not ready:
+                raise ValueError(f"Dependency cycle between tasks: {', '.join(sorted(remaining))}")
+            for task_id in ready:
+                del remaining[task_id]
+            for deps in remaining.values():
+                deps.difference_update(ready)
+    
+    async def _get_agent_memory(self, project_id: str):
+        """Get the shared, registry-managed Agno memory for a project"""
+        from app.services.memory_service import memory_service
+        
+        return await memory_service.get_memory(project_id)
 
 
 # Singleton instance
@@ -0,0 +1,120 @@
+"""
+Token streaming backends for chat responses
+"""
+from typing import AsyncIterator, Dict, Any, Optional
+from app.config import settings
+from app.metrics import LatencyRecorder
+import asyncio
+import threading
+import time
+
+
+class FakeTokenModel:
+    """Local model that emits tokens on a timer.
+
+    Used for development and load testing of the streaming path without calling
+    an LLM provider: it echoes the prompt back word by word.
+    """
+
+    def __init__(self, interval: float = 0.05, reply: Optional[str] = None):
+        self.interval = interval
+        self.reply = reply
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        text = self.reply or f"You asked: {prompt.splitlines()[-1] if prompt else ''}"
+        for index, word in enumerate(text.split(" ")):
+            await asyncio.sleep(self.interval)
+            yield word if index == 0 else f" {word}"
+
+
+class AgnoTokenModel:
+    """Streams tokens from an Agno agent running on the agent thread pool"""
+
+    def __init__(self, agent, tier: str):
+        self.agent = agent
+        self.tier = tier
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        done = object()
+        cancelled = threading.Event()
+
+        def produce():
+            try:
+                for chunk in self.agent.run(prompt, stream=True):
+                    if cancelled.is_set():
+                        break
+                    content = getattr(chunk, "content", chunk)
+                    if content:
+                        loop.call_soon_threadsafe(queue.put_nowait, str(content))
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+
+        def finished(future: asyncio.Future):
+            # produce() may never have started (e.g. the executor rejected the call)
+            if not future.cancelled() and future.exception() is not None:
+                queue.put_nowait(future.exception())
+            queue.put_nowait(done)
+
+        from app.services.agent_executor import agent_executor
+        producer = asyncio.ensure_future(agent_executor.run(self.tier, produce))
+        producer.add_done_callback(finished)
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # Stop the producer thread if the consumer went away early
+            cancelled.set()
+            if not producer.done():
+                producer.cancel()
+
+
+class StreamMetrics:
+    """Time-to-first-token and total stream duration metrics"""
+
+    def __init__(self):
+        self.time_to_first_token = LatencyRecorder()
+        self.total_duration = LatencyRecorder()
+        self.active_streams = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active_streams": self.active_streams,
+            "time_to_first_token": self.time_to_first_token.stats(),
+            "total_duration": self.total_duration.stats(),
+        }
+
+
+async def timed_stream(tokens: AsyncIterator[str], metrics: StreamMetrics) -> AsyncIterator[str]:
+    """Wrap a token stream and record TTFT / duration"""
+    started = time.perf_counter()
+    first = True
+    metrics.active_streams += 1
+    try:
+        async for token in tokens:
+            if first:
+                metrics.time_to_first_token.record((time.perf_counter() - started) * 1000)
+                first = False
+            yield token
+    finally:
+        metrics.active_streams -= 1
+        metrics.total_duration.record((time.perf_counter() - started) * 1000)
+
+
+def get_token_model(agent, tier: str):
+    """Select the configured streaming backend"""
+    if settings.chat_stream_model == "fake":
+        return FakeTokenModel(interval=settings.fake_stream_interval_seconds)
+    return AgnoTokenModel(agent, tier)
+
+
+# Singleton instance
+stream_metrics = StreamMetrics()
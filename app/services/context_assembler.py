@@ -0,0 +1,312 @@
+"""
+Token-budgeted assembly of project context for AI prompts
+"""
+from typing import Any, Dict, List, Optional
+from app.cache import TTLCache
+from app.config import settings
+from app.database import get_supabase
+import asyncio
+import itertools
+import json
+import re
+
+# Prompt budget per tier, matching the max_tokens of the tier's model in AIService
+TIER_TOKEN_BUDGETS = {
+    "free": 2048,
+    "pro": 4096,
+    "premium": 8192,
+}
+
+# Rough chars-per-token ratio for English text and code
+CHARS_PER_TOKEN = 4
+
+# Don't bother including a truncated item smaller than this
+MIN_PARTIAL_TOKENS = 48
+
+# Section headers and separators around the packed items
+LAYOUT_TOKENS = 32
+
+SECTION_TITLES = {
+    "project": "Project",
+    "spec": "Project Specs",
+    "memory": "Relevant Context from Project Memory",
+    "extra": "Additional Context",
+    "history": "Recent Conversation",
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate; good enough for budgeting without a tokenizer"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN if text else 0
+
+
+def _terms(text: str) -> set:
+    return {term for term in re.findall(r"\w+", (text or "").lower()) if len(term) > 2}
+
+
+def _overlap(query_terms: set, text: str) -> float:
+    """Share of query terms that appear in ``text``"""
+    if not query_terms:
+        return 0.0
+    return len(query_terms & _terms(text)) / len(query_terms)
+
+
+def _truncate(text: str, tokens: int) -> str:
+    """Cut ``text`` to roughly ``tokens``, preferring a line boundary"""
+    limit = tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text.rfind("\n", 0, limit)
+    if cut < limit // 2:
+        cut = limit
+    return text[:cut].rstrip() + "\n..."
+
+
+class ProjectContextCache:
+    """Versioned snapshots of the query-independent context of each project.
+
+    A snapshot holds the project row, its spec files and recent chat history.
+    Writers call ``invalidate`` (specs, project updates) or ``record_message``
+    (chat turns, applied to the snapshot in place). Every change takes a new
+    version from a global counter; a snapshot built from reads that started
+    before the project's last invalidation is discarded instead of cached, so a
+    slow fetch can never resurrect stale specs. Invalidation is per process:
+    other API workers keep their snapshot until it expires, so after an edit
+    they may serve old context for up to ``context_cache_ttl_seconds``.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._snapshots = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._invalidated = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._versions = itertools.count(1)
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0, "stale_discards": 0}
+
+    def begin(self) -> int:
+        """Version to tag a snapshot whose reads start now"""
+        return next(self._versions)
+
+    def get(self, project_id: str) -> Optional[Dict[str, Any]]:
+        snapshot = self._snapshots.get(project_id)
+        self._stats["hits" if snapshot is not None else "misses"] += 1
+        return snapshot
+
+    def set(self, project_id: str, snapshot: Dict[str, Any], version: int):
+        """Cache a snapshot unless the project changed while it was being built"""
+        if (self._invalidated.get(project_id) or 0) > version:
+            self._stats["stale_discards"] += 1
+            return
+        self._snapshots.set(project_id, {**snapshot, "version": version})
+
+    def invalidate(self, project_id: str):
+        """Drop a project's snapshot after its project row or specs changed"""
+        self._snapshots.invalidate(project_id)
+        self._invalidated.set(project_id, next(self._versions))
+        self._stats["invalidations"] += 1
+
+    def record_message(self, project_id: str, role: str, content: str):
+        """Append a chat message to a cached snapshot rather than refetching history"""
+        snapshot = self._snapshots.get(project_id)
+        if snapshot is None:
+            # A snapshot being built right now may have read history before this message
+            self._invalidated.set(project_id, next(self._versions))
+            return
+        history = snapshot["history"] + [{"role": role, "content": content}]
+        self._snapshots.set(project_id, {
+            **snapshot,
+            "history": history[-settings.context_history_messages:],
+            "version": next(self._versions),
+        })
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            **self._stats,
+            "resident": len(self._snapshots),
+            "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+        }
+
+
+class ContextAssembler:
+    """Collects project info, specs, memory hits and chat history, and packs the
+    most useful of them into a tier's token budget.
+
+    Every candidate is scored (relevance to the request for specs and memory,
+    recency for chat history) and added greedily in score order; the item that
+    crosses the budget is truncated rather than dropped when enough room is left.
+    """
+
+    def __init__(self):
+        self.snapshots = ProjectContextCache(
+            maxsize=settings.context_cache_size,
+            ttl=settings.context_cache_ttl_seconds
+        )
+        self._stats = {"assembled": 0, "tokens": 0, "truncated": 0, "dropped": 0}
+
+    async def gather(self, project_id: str, query: str, include_history: bool = True) -> Dict[str, Any]:
+        """Context sources for a project: cached snapshot plus live memory hits"""
+        from app.services.memory_service import memory_service
+
+        snapshot, memory_hits = await asyncio.gather(
+            self._snapshot(project_id),
+            memory_service.search_memory(project_id, query, limit=settings.context_memory_hits),
+        )
+
+        sources = {
+            "project_info": snapshot["project_info"],
+            "specs": snapshot["specs"],
+            "memory": memory_hits,
+        }
+        if include_history:
+            messages = snapshot["history"]
+            # The request itself is usually the newest message; don't repeat it
+            if messages and messages[-1]["role"] == "user" and messages[-1]["content"] == query:
+                messages = messages[:-1]
+            sources["history"] = messages
+
+        return sources
+
+    def stable_sources(self, sources: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """The sources minus live memory hits, for keying cached responses.
+
+        Memory search results (and their similarity scores) change with every
+        memory write, so keys built from them would almost never repeat.
+        """
+        return {key: value for key, value in (sources or {}).items() if key != "memory"}
+
+    async def _snapshot(self, project_id: str) -> Dict[str, Any]:
+        """Project row, specs and recent history, served from the snapshot cache"""
+        snapshot = self.snapshots.get(project_id)
+        if snapshot is not None:
+            return snapshot
+
+        version = self.snapshots.begin()
+        supabase = get_supabase()
+        project, specs, history = await asyncio.gather(
+            supabase.table("projects").select("name, description").eq("id", project_id).execute(),
+            supabase.table("spec_files").select("file_type, content").eq("project_id", project_id).execute(),
+            supabase.table("chat_messages")
+                .select("role, content")
+                .eq("project_id", project_id)
+                .order("created_at", desc=True)
+                .limit(settings.context_history_messages)
+                .execute(),
+        )
+
+        snapshot = {
+            "project_info": project.data[0] if project.data else {},
+            "specs": {spec["file_type"]: spec["content"] for spec in specs.data},
+            "history": list(reversed(history.data)),
+        }
+        self.snapshots.set(project_id, snapshot, version)
+        return snapshot
+
+    def budget(self, tier: Any, reserved: str = "") -> int:
+        """Tokens left for context in a tier once ``reserved`` text is accounted for"""
+        tier = getattr(tier, "value", tier)
+        total = TIER_TOKEN_BUDGETS.get(tier, TIER_TOKEN_BUDGETS["free"])
+        return max(0, total - estimate_tokens(reserved))
+
+    def pack(self, sources: Optional[Dict[str, Any]], query: str, tier: Any, reserved: str = "") -> str:
+        """Render the highest-value context that fits the tier's budget"""
+        if not sources:
+            return ""
+
+        remaining = self.budget(tier, reserved or query) - LAYOUT_TOKENS
+        candidates = sorted(self._candidates(sources, query), key=lambda item: item["score"], reverse=True)
+
+        chosen = []
+        for item in candidates:
+            tokens = estimate_tokens(item["text"]) + 1
+            if tokens <= remaining:
+                chosen.append(item)
+                remaining -= tokens
+            elif item["truncatable"] and remaining >= MIN_PARTIAL_TOKENS:
+                chosen.append({**item, "text": _truncate(item["text"], remaining)})
+                remaining = 0
+                self._stats["truncated"] += 1
+            else:
+                self._stats["dropped"] += 1
+
+        rendered = self._render(chosen)
+        self._stats["assembled"] += 1
+        self._stats["tokens"] += estimate_tokens(rendered)
+        return rendered
+
+    def _candidates(self, sources: Dict[str, Any], query: str) -> List[Dict[str, Any]]:
+        """Score every piece of context as a separately packable item"""
+        query_terms = _terms(query)
+        items = []
+
+        def add(section: str, text: str, score: float, order: float = 0.0, truncatable: bool = True):
+            if text:
+                items.append({
+                    "section": section,
+                    "text": text,
+                    "score": score,
+                    "order": order,
+                    "truncatable": truncatable,
+                })
+
+        project_info = sources.get("project_info") or {}
+        if project_info:
+            description = project_info.get("description") or ""
+            add("project", f"{project_info.get('name', '')}: {description}".strip(": "), 2.0, truncatable=False)
+
+        for file_type, content in (sources.get("specs") or {}).items():
+            add("spec", f"[{file_type.upper()}]\n{content}", 0.4 + 0.6 * _overlap(query_terms, content))
+
+        for hit in sources.get("memory") or []:
+            metadata = hit.get("metadata") or {}
+            similarity = hit.get("similarity_score") or 0.5
+            importance = hit.get("importance_score") or 0.7
+            add(
+                "memory",
+                f"[{metadata.get('type', 'memory').upper()}] {hit['content']}",
+                similarity * (0.5 + 0.5 * importance),
+                order=-similarity,
+            )
+
+        history = sources.get("history") or []
+        for position, message in enumerate(history):
+            age = len(history) - 1 - position
+            add(
+                "history",
+                f"{message['role']}: {message['content']}",
+                0.9 * 0.8 ** age,
+                order=position,
+                truncatable=age == 0,
+            )
+
+        # Callers may still pass ad-hoc context dicts; keep them, compactly encoded
+        for key, value in sources.items():
+            if key in ("project_info", "specs", "memory", "history") or not value:
+                continue
+            text = value if isinstance(value, str) else json.dumps(value, separators=(",", ":"), default=str)
+            add("extra", f"{key}: {text}", 0.3 + 0.6 * _overlap(query_terms, text))
+
+        return items
+
+    def _render(self, items: List[Dict[str, Any]]) -> str:
+        """Lay chosen items out in fixed sections, in a stable order within each"""
+        blocks = []
+        for section, title in SECTION_TITLES.items():
+            entries = [item for item in items if item["section"] == section]
+            if not entries:
+                continue
+            if section != "spec":
+                entries.sort(key=lambda item: item["order"])
+            blocks.append(f"{title}:\n" + "\n\n".join(item["text"] for item in entries))
+        return "\n\n".join(blocks)
+
+    def stats(self) -> Dict[str, Any]:
+        """Packing counters"""
+        assembled = self._stats["assembled"]
+        return {
+            **self._stats,
+            "avg_tokens": round(self._stats["tokens"] / assembled, 1) if assembled else 0.0,
+            "snapshots": self.snapshots.stats(),
+        }
+
+
+# Singleton instance
+context_assembler = ContextAssembler()
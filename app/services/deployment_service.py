@@ -3,6 +3,7 @@ Deployment service for building and deploying apps
 """
 from typing import Dict, Any
 from app.database import get_supabase
+from app.services.event_bus import event_bus
 import uuid
 
 
@@ -25,31 +26,33 @@ class DeploymentService:
             "error_message": None,
         }
         
-        response = self.supabase.table("build_jobs").insert(build_data).execute()
+        response = await self.supabase.table("build_jobs").insert(build_data).execute()
         
         if response.data:
+            event_bus.publish(project_id, "build.created", {"id": job_id, "platform": platform, "status": "queued"})
             # Simulate build process
-            await self._process_build(job_id, platform)
+            await self._process_build(job_id, project_id, platform)
             return response.data[0]
         
         raise Exception("Failed to create build job")
     
-    async def _process_build(self, job_id: str, platform: str):
+    async def _process_build(self, job_id: str, project_id: str, platform: str):
         """Process the build job"""
         import asyncio
         
         # Update status to building
-        self.supabase.table("build_jobs")\
+        await self.supabase.table("build_jobs")\
             .update({"status": "building"})\
             .eq("id", job_id)\
             .execute()
+        event_bus.publish(project_id, "build.updated", {"id": job_id, "status": "building"})
         
         # Simulate build time
         await asyncio.sleep(2)
         
         # Update with success
         build_url = f"https://expo.dev/builds/{job_id}"
-        self.supabase.table("build_jobs")\
+        await self.supabase.table("build_jobs")\
             .update({
                 "status": "completed",
                 "build_url": build_url,
@@ -57,10 +60,11 @@ class DeploymentService:
             })\
             .eq("id", job_id)\
             .execute()
+        event_bus.publish(project_id, "build.updated", {"id": job_id, "status": "completed", "build_url": build_url})
     
     async def get_build_status(self, build_id: str) -> Dict[str, Any]:
         """Get build job status"""
-        response = self.supabase.table("build_jobs")\
+        response = await self.supabase.table("build_jobs")\
             .select("*")\
             .eq("id", build_id)\
             .execute()
@@ -0,0 +1,165 @@
+"""
+Pluggable embedding backends and an in-process vector index for project memory
+"""
+from typing import Any, Dict, List, Optional, Sequence
+from app.config import settings
+import asyncio
+import hashlib
+import re
+import numpy as np
+
+
+class HashingEmbedder:
+    """Deterministic feature-hashing embedder.
+
+    Needs no model download or network, so it is the default for tests and
+    development. Tokens and token bigrams are hashed into ``dim`` signed buckets
+    and the result is L2-normalized.
+    """
+
+    blocking = False
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _features(self, text: str) -> List[str]:
+        tokens = re.findall(r"\w+", text.lower())
+        return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+                bucket = int.from_bytes(digest[:4], "little") % self.dim
+                sign = 1.0 if digest[4] & 1 else -1.0
+                vectors[row, bucket] += sign
+        return _normalize(vectors)
+
+
+class LocalModelEmbedder:
+    """CPU-only sentence-transformers model loaded in-process.
+
+    Requires the optional ``sentence-transformers`` package. ``dim`` comes
+    from configuration so sizing an index doesn't load the model; the model
+    is loaded on the first (off-loop) ``embed`` call and must match it.
+    """
+
+    blocking = True
+
+    def __init__(self, model_name: str, dim: int):
+        self.name = model_name
+        self.dim = dim
+        self._model = None
+
+    def _load(self):
+        if self._model is None:
+            try:
+                from sentence_transformers import SentenceTransformer
+            except ImportError as e:
+                raise RuntimeError(
+                    "EMBEDDING_BACKEND=local requires the sentence-transformers package"
+                ) from e
+            model = SentenceTransformer(self.name, device="cpu")
+            if model.get_sentence_embedding_dimension() != self.dim:
+                raise RuntimeError(
+                    f"{self.name} produces {model.get_sentence_embedding_dimension()}-dimensional "
+                    f"embeddings but EMBEDDING_DIM is {self.dim}"
+                )
+            self._model = model
+        return self._model
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = self._load().encode(list(texts), batch_size=32, convert_to_numpy=True)
+        return _normalize(vectors.astype(np.float32))
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class VectorIndex:
+    """Per-project in-memory index of normalized vectors with cosine top-k search.
+
+    With ``max_items`` set, adding past the limit evicts the least important
+    entries (oldest first among equals), so the index stays the size of the
+    project memory it mirrors.
+    """
+
+    def __init__(self, dim: int, capacity: int = 64, max_items: Optional[int] = None):
+        self.dim = dim
+        self.max_items = max_items
+        self._vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self._payloads: List[Dict[str, Any]] = []
+
+    def __len__(self) -> int:
+        return len(self._payloads)
+
+    @property
+    def nbytes(self) -> int:
+        return self._vectors.nbytes
+
+    def add(self, vectors: np.ndarray, payloads: List[Dict[str, Any]]):
+        """Append vectors (already normalized) with their payloads"""
+        vectors = np.atleast_2d(vectors)
+        needed = len(self._payloads) + len(vectors)
+        if needed > len(self._vectors):
+            grown = np.zeros((max(needed, len(self._vectors) * 2), self.dim), dtype=np.float32)
+            grown[:len(self._payloads)] = self._vectors[:len(self._payloads)]
+            self._vectors = grown
+        self._vectors[len(self._payloads):needed] = vectors
+        self._payloads.extend(payloads)
+        if self.max_items is not None and needed > self.max_items:
+            self._evict(needed - self.max_items)
+
+    def _evict(self, count: int):
+        """Drop the ``count`` least important entries"""
+        total = len(self._payloads)
+        importance = np.array([payload.get("importance_score") or 0.0 for payload in self._payloads])
+        # lexsort's last key is primary: importance, then insertion order
+        evicted = np.lexsort((np.arange(total), importance))[:count]
+        keep = np.ones(total, dtype=bool)
+        keep[evicted] = False
+        self._vectors[:total - count] = self._vectors[:total][keep]
+        self._payloads = [payload for payload, kept in zip(self._payloads, keep) if kept]
+
+    def search(self, queries: np.ndarray, k: int, threshold: float = 0.0) -> List[List[Dict[str, Any]]]:
+        """Batched cosine top-k; returns one result list per query"""
+        queries = np.atleast_2d(queries)
+        count = len(self._payloads)
+        if count == 0:
+            return [[] for _ in range(len(queries))]
+
+        scores = queries @ self._vectors[:count].T
+        k = min(k, count)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+        results = []
+        for row, candidates in enumerate(top):
+            ordered = candidates[np.argsort(-scores[row, candidates])]
+            results.append([
+                {**self._payloads[i], "similarity_score": float(scores[row, i])}
+                for i in ordered
+                if scores[row, i] >= threshold
+            ])
+        return results
+
+
+def get_embedder() -> Optional[Any]:
+    """Configured embedder, or None to keep using Agno's remote embeddings"""
+    backend = settings.embedding_backend
+    if backend == "hashing":
+        return HashingEmbedder(settings.embedding_dim)
+    if backend == "local":
+        return LocalModelEmbedder(settings.local_embedding_model, settings.embedding_dim)
+    return None
+
+
+async def embed(embedder, texts: Sequence[str]) -> np.ndarray:
+    """Embed texts, moving model inference off the event loop"""
+    if getattr(embedder, "blocking", False):
+        return await asyncio.to_thread(embedder.embed, texts)
+    return embedder.embed(texts)
@@ -0,0 +1,137 @@
+"""
+In-process pub/sub bus for project state-change events
+"""
+from typing import Any, Dict, Optional, Set
+from collections import defaultdict
+from datetime import datetime
+from app.config import settings
+import asyncio
+import itertools
+
+
+class Subscription:
+    """A subscriber's bounded event queue.
+
+    When a slow consumer lets the queue fill up, its backlog is replaced by a
+    single ``resync`` event: the client has missed updates and should refetch
+    state once, instead of the bus buffering without bound or blocking the
+    publisher.
+    """
+
+    def __init__(self, bus: "EventBus", project_id: str, maxsize: int):
+        self.bus = bus
+        self.project_id = project_id
+        self.dropped = 0
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+
+    def offer(self, event: Dict[str, Any]) -> bool:
+        """Enqueue without blocking; returns False if the backlog was collapsed"""
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            self.dropped += self._queue.qsize()
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            self._queue.put_nowait({
+                "id": event["id"],
+                "type": "resync",
+                "project_id": self.project_id,
+                "data": {"reason": "subscriber fell behind"},
+                "timestamp": event["timestamp"],
+            })
+            return False
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Next event, or None if nothing arrived within ``timeout`` seconds"""
+        # Fast path: a backlogged consumer shouldn't pay for a timeout wrapper per event
+        if not self._queue.empty():
+            return self._queue.get_nowait()
+        # asyncio.wait rather than wait_for: a cancellation racing the timeout
+        # must reach the caller, or a closed stream would keep looping
+        getter = asyncio.ensure_future(self._queue.get())
+        try:
+            done, _ = await asyncio.wait({getter}, timeout=timeout)
+        finally:
+            if not getter.done():
+                getter.cancel()
+        # A just-cancelled getter isn't done yet, so test the wait's result
+        return getter.result() if getter in done else None
+
+    @property
+    def backlog(self) -> int:
+        return self._queue.qsize()
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+
+class EventBus:
+    """Fan-out of project events to in-process subscribers.
+
+    Services call ``publish`` after changing ``tasks``, ``code_changes``,
+    ``build_jobs`` or ``sandboxes`` rows; the events router streams them to
+    clients. Publishing never awaits: each subscriber has its own bounded queue,
+    so an idle subscriber costs one small queue and a slow one cannot stall the
+    services. The bus is per process; every worker fans out the events its own
+    services publish.
+    """
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, Set[Subscription]] = defaultdict(set)
+        self._ids = itertools.count(1)
+        self._stats = {"published": 0, "delivered": 0, "overflows": 0}
+
+    def subscribe(self, project_id: str) -> Subscription:
+        subscription = Subscription(self, project_id, self.queue_size)
+        self._subscribers[project_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._subscribers.get(subscription.project_id)
+        if subscribers is None:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._subscribers[subscription.project_id]
+
+    def publish(self, project_id: Optional[str], event_type: str, data: Dict[str, Any]) -> int:
+        """Deliver an event to every subscriber of the project; returns the fan-out"""
+        if not project_id:
+            return 0
+
+        self._stats["published"] += 1
+        subscribers = self._subscribers.get(str(project_id))
+        if not subscribers:
+            return 0
+
+        event = {
+            "id": next(self._ids),
+            "type": event_type,
+            "project_id": str(project_id),
+            "data": data,
+            "timestamp": datetime.utcnow().isoformat(),
+        }
+        for subscription in list(subscribers):
+            if not subscription.offer(event):
+                self._stats["overflows"] += 1
+        self._stats["delivered"] += len(subscribers)
+        return len(subscribers)
+
+    def subscriber_count(self, project_id: Optional[str] = None) -> int:
+        if project_id is not None:
+            return len(self._subscribers.get(project_id, ()))
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def stats(self) -> Dict[str, Any]:
+        """Fan-out counters"""
+        return {
+            "subscribers": self.subscriber_count(),
+            "projects": len(self._subscribers),
+            **self._stats,
+        }
+
+
+# Singleton instance
+event_bus = EventBus(queue_size=settings.event_queue_size)
@@ -0,0 +1,542 @@
+"""
+Content-addressed project file store with structurally shared trees
+"""
+from typing import Any, Dict, List, Optional, Tuple
+from datetime import datetime
+from app.cache import TTLCache
+from app.config import settings
+from app.database import get_supabase, DatabaseError
+from app.metrics import LatencyRecorder
+import asyncio
+import hashlib
+import json
+import time
+
+# Starter Expo app every new project's file tree is seeded with
+EXPO_TEMPLATE: Dict[str, str] = {
+    "App.js": """import React from 'react';
+import { StyleSheet, Text, View } from 'react-native';
+
+export default function App() {
+  return (
+    <View style={styles.container}>
+      <Text>Welcome to your AI-generated app!</Text>
+    </View>
+  );
+}
+
+const styles = StyleSheet.create({
+  container: {
+    flex: 1,
+    backgroundColor: '#fff',
+    alignItems: 'center',
+    justifyContent: 'center',
+  },
+});""",
+    "package.json": """{
+  "name": "my-app",
+  "version": "1.0.0",
+  "main": "node_modules/expo/AppEntry.js",
+  "scripts": {
+    "start": "expo start",
+    "android": "expo start --android",
+    "ios": "expo start --ios",
+    "web": "expo start --web"
+  },
+  "dependencies": {
+    "expo": "~49.0.0",
+    "react": "18.2.0",
+    "react-native": "0.72.6"
+  }
+}""",
+    "components/Button.js": """import React from 'react';
+import { TouchableOpacity, Text, StyleSheet } from 'react-native';
+
+export default function Button({ title, onPress }) {
+  return (
+    <TouchableOpacity style={styles.button} onPress={onPress}>
+      <Text style={styles.text}>{title}</Text>
+    </TouchableOpacity>
+  );
+}
+
+const styles = StyleSheet.create({
+  button: {
+    backgroundColor: '#007AFF',
+    padding: 12,
+    borderRadius: 8,
+    alignItems: 'center',
+  },
+  text: {
+    color: 'white',
+    fontSize: 16,
+    fontWeight: 'bold',
+  },
+});""",
+}
+
+# Template entries carry a fixed mtime so every project shares the same trees
+TEMPLATE_MTIME = "1970-01-01T00:00:00"
+
+# Change operations for write_files; a str value writes a file
+DELETE = ("delete",)
+DIRECTORY = ("directory",)
+
+# Batch size for ``in.(...)`` lookups of trees and blobs
+FETCH_BATCH_SIZE = 100
+
+
+class FileStoreConflict(Exception):
+    """The project's tree kept moving under concurrent writers"""
+
+
+def blob_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def tree_hash(entries: Dict[str, Dict[str, Any]]) -> str:
+    raw = json.dumps(entries, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+EMPTY_TREE = tree_hash({})
+
+
+def split_path(path: str) -> List[str]:
+    """Normalize a project-relative path into its segments"""
+    parts = [part for part in path.strip().strip("/").split("/") if part not in ("", ".")]
+    if not parts or ".." in parts:
+        raise ValueError(f"Invalid path: {path!r}")
+    return parts
+
+
+class FileStore:
+    """Project files as immutable, content-addressed trees.
+
+    File contents live in ``file_blobs`` and directories in ``file_trees``, both
+    keyed by SHA-256, so identical files and unchanged subtrees are stored once
+    and shared between revisions and projects (every project starts from the
+    same template objects). A project is a pointer to its root tree in
+    ``project_files``. Writing one file creates one blob plus one new tree per
+    directory on its path and moves the pointer, so a save costs O(depth), not
+    O(project size). Objects never change once written, so they are cached
+    without invalidation; the pointer is moved with a compare-and-set on
+    ``revision`` and a write that loses the race is re-applied on the new root.
+
+    Alongside the hierarchy each root has a flat path -> entry index, so
+    lookups are one dict access instead of a walk down the trees. A write
+    derives the new root's index from the old one by touching only the
+    changed paths.
+    """
+
+    def __init__(self):
+        self.supabase = get_supabase()
+        self._trees = TTLCache(maxsize=settings.file_store_cache_size, ttl=3600.0)
+        self._blobs = TTLCache(maxsize=settings.file_store_cache_size, ttl=3600.0)
+        self._trees.set(EMPTY_TREE, {})
+        self._template_root: Optional[str] = None
+        # Flat path index per root tree; roots are immutable, so these are too
+        self._indexes = TTLCache(maxsize=settings.file_store_index_cache_size, ttl=3600.0)
+        self.write_latency = LatencyRecorder()
+        self._stats = {
+            "writes": 0,
+            "noop_writes": 0,
+            "conflicts": 0,
+            "trees_written": 0,
+            "blobs_written": 0,
+        }
+
+    # --- Objects ---
+    async def get_tree(self, hash_: str) -> Dict[str, Dict[str, Any]]:
+        """Entries of a directory tree: name -> {type, hash, size, mtime}"""
+        trees = await self.get_trees([hash_])
+        if hash_ not in trees:
+            raise LookupError(f"Tree {hash_} is missing")
+        return trees[hash_]
+
+    async def get_trees(self, hashes: List[str]) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        return await self._fetch("file_trees", "entries", self._trees, hashes)
+
+    async def get_blob(self, hash_: str) -> str:
+        blobs = await self.get_blobs([hash_])
+        if hash_ not in blobs:
+            raise LookupError(f"Blob {hash_} is missing")
+        return blobs[hash_]
+
+    async def get_blobs(self, hashes: List[str]) -> Dict[str, str]:
+        return await self._fetch("file_blobs", "content", self._blobs, hashes)
+
+    async def _fetch(self, table: str, column: str, cache: TTLCache, hashes: List[str]) -> Dict[str, Any]:
+        found = {}
+        missing = []
+        for hash_ in dict.fromkeys(hashes):
+            cached = cache.get(hash_)
+            if cached is not None:
+                found[hash_] = cached
+            else:
+                missing.append(hash_)
+
+        for start in range(0, len(missing), FETCH_BATCH_SIZE):
+            response = await self.supabase.table(table)\
+                .select(f"hash, {column}")\
+                .in_("hash", missing[start:start + FETCH_BATCH_SIZE])\
+                .execute()
+            for row in response.data:
+                cache.set(row["hash"], row[column])
+                found[row["hash"]] = row[column]
+        return found
+
+    # --- Project roots ---
+    async def get_root(self, project_id: str) -> Dict[str, Any]:
+        """The project's current root tree and revision, seeding the template if it has none"""
+        response = await self.supabase.table("project_files")\
+            .select("root_hash, revision")\
+            .eq("project_id", project_id)\
+            .execute()
+        if response.data:
+            return response.data[0]
+        return await self._seed(project_id)
+
+    async def template_root(self) -> str:
+        """Root tree of the Expo template, written once per process"""
+        if self._template_root is None:
+            pending: Dict[str, Dict[str, Any]] = {"blobs": {}, "trees": {}, "paths": {}}
+            root, _ = await self._apply(None, self._changes(EXPO_TEMPLATE), pending, TEMPLATE_MTIME)
+            await self._persist(pending)
+            self._template_root = root
+        return self._template_root
+
+    async def _seed(self, project_id: str) -> Dict[str, Any]:
+        root = await self.template_root()
+        try:
+            await self.supabase.table("project_files").insert({
+                "project_id": project_id,
+                "root_hash": root,
+                "revision": 1,
+            }).execute()
+        except DatabaseError as e:
+            if e.code == "23503":
+                raise LookupError(f"Project {project_id} not found") from e
+            # Another request seeded it first
+            response = await self.supabase.table("project_files")\
+                .select("root_hash, revision")\
+                .eq("project_id", project_id)\
+                .execute()
+            if not response.data:
+                raise
+            return response.data[0]
+        return {"root_hash": root, "revision": 1}
+
+    # --- Reads ---
+    async def stat(self, project_id: str, path: str, root_hash: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Entry for a path, or None; the root directory for an empty path"""
+        if root_hash is None:
+            root_hash = (await self.get_root(project_id))["root_hash"]
+        if not path.strip("/"):
+            return {"type": "directory", "hash": root_hash}
+
+        index = self._indexes.get(root_hash)
+        if index is not None:
+            return index.get("/".join(split_path(path)))
+
+        entry = {"type": "directory", "hash": root_hash}
+        for part in split_path(path):
+            if entry["type"] != "directory":
+                return None
+            entry = (await self.get_tree(entry["hash"])).get(part)
+            if entry is None:
+                return None
+        return entry
+
+    async def read_file(self, project_id: str, path: str) -> str:
+        entry = await self.stat(project_id, path)
+        if entry is None:
+            raise FileNotFoundError(path)
+        if entry["type"] != "file":
+            raise IsADirectoryError(path)
+        return await self.get_blob(entry["hash"])
+
+    async def index(self, root_hash: str) -> Dict[str, Dict[str, Any]]:
+        """Flat path -> entry index of a root (shared; do not mutate)"""
+        index = self._indexes.get(root_hash)
+        if index is None:
+            index = await self.walk(root_hash)
+            self._indexes.set(root_hash, index)
+        return index
+
+    async def list_directory(self, project_id: str, path: str = "",
+                             recursive: bool = False) -> List[Dict[str, Any]]:
+        """Metadata (no content) of a directory's entries, or of everything under it"""
+        root = await self.get_root(project_id)
+        directory = await self.stat(project_id, path, root_hash=root["root_hash"])
+        if directory is None:
+            raise FileNotFoundError(path)
+        if directory["type"] != "directory":
+            raise NotADirectoryError(path)
+
+        prefix = "/".join(split_path(path)) + "/" if path.strip("/") else ""
+        if recursive:
+            index = await self.index(root["root_hash"])
+            entries = {name: entry for name, entry in index.items() if name.startswith(prefix)}
+        else:
+            tree = await self.get_tree(directory["hash"])
+            entries = {f"{prefix}{name}": entry for name, entry in tree.items()}
+        return [
+            {"path": name, "name": name.rsplit("/", 1)[-1], **entry}
+            for name, entry in sorted(entries.items())
+        ]
+
+    async def read_files(self, project_id: str, paths: List[str]) -> Dict[str, str]:
+        """Contents of the requested files that exist, fetched in one pass"""
+        root = await self.get_root(project_id)
+        wanted = {}
+        for path in paths:
+            entry = await self.stat(project_id, path, root_hash=root["root_hash"])
+            if entry is not None and entry["type"] == "file":
+                wanted[path] = entry["hash"]
+        blobs = await self.get_blobs(list(wanted.values()))
+        return {path: blobs[hash_] for path, hash_ in wanted.items()}
+
+    async def diff(self, old_root: Optional[str], new_root: Optional[str]) -> Dict[str, Optional[str]]:
+        """Files that differ between two roots: path -> new content, None where deleted.
+
+        Subtrees with equal hashes are skipped without being read, so the cost
+        follows the size of the change rather than of the project.
+        """
+        changed: Dict[str, str] = {}
+        deleted: List[str] = []
+
+        async def compare(old_hash: Optional[str], new_hash: Optional[str], prefix: str):
+            if old_hash == new_hash:
+                return
+            old = await self.get_tree(old_hash) if old_hash else {}
+            new = await self.get_tree(new_hash) if new_hash else {}
+            for name in old.keys() | new.keys():
+                before, after = old.get(name), new.get(name)
+                if before is not None and after is not None and before == after:
+                    continue
+                path = f"{prefix}{name}"
+                before_dir = before["hash"] if before is not None and before["type"] == "directory" else None
+                after_dir = after["hash"] if after is not None and after["type"] == "directory" else None
+                if before_dir or after_dir:
+                    await compare(before_dir, after_dir, f"{path}/")
+                if after is not None and after["type"] == "file":
+                    if before is None or before["hash"] != after["hash"] or before["type"] != "file":
+                        changed[path] = after["hash"]
+                elif before is not None and before["type"] == "file":
+                    deleted.append(path)
+
+        await compare(old_root, new_root, "")
+        blobs = await self.get_blobs(list(changed.values()))
+        result: Dict[str, Optional[str]] = {path: blobs[hash_] for path, hash_ in changed.items()}
+        result.update({path: None for path in deleted})
+        return result
+
+    async def walk(self, root_hash: str) -> Dict[str, Dict[str, Any]]:
+        """Every entry under a root keyed by path, fetching one tree level per query"""
+        entries: Dict[str, Dict[str, Any]] = {}
+        level = {"": root_hash}
+        while level:
+            trees = await self.get_trees(list(level.values()))
+            next_level = {}
+            for prefix, hash_ in level.items():
+                for name, entry in trees[hash_].items():
+                    path = f"{prefix}{name}"
+                    entries[path] = entry
+                    if entry["type"] == "directory":
+                        next_level[f"{path}/"] = entry["hash"]
+            level = next_level
+        return entries
+
+    async def export_files(self, project_id: str) -> Dict[str, str]:
+        """Flat path -> content map of the project's files"""
+        root = await self.get_root(project_id)
+        entries = await self.index(root["root_hash"])
+        return await self._contents(entries)
+
+    async def export_tree(self, project_id: str) -> Dict[str, Any]:
+        """Nested ``{name: {type, content | children}}`` view of the project's files"""
+        root = await self.get_root(project_id)
+        entries = await self.index(root["root_hash"])
+        contents = await self._contents(entries)
+
+        tree: Dict[str, Any] = {}
+        # Sorted paths put every directory before its children
+        for path, entry in sorted(entries.items()):
+            node = tree
+            parts = path.split("/")
+            for part in parts[:-1]:
+                node = node[part]["children"]
+            if entry["type"] == "directory":
+                node[parts[-1]] = {"type": "directory", "children": {}}
+            else:
+                node[parts[-1]] = {"type": "file", "content": contents[path]}
+        return tree
+
+    async def _contents(self, entries: Dict[str, Dict[str, Any]]) -> Dict[str, str]:
+        files = {path: entry["hash"] for path, entry in entries.items() if entry["type"] == "file"}
+        blobs = await self.get_blobs(list(files.values()))
+        return {path: blobs[hash_] for path, hash_ in files.items()}
+
+    # --- Writes ---
+    async def write_file(self, project_id: str, path: str, content: str) -> str:
+        return await self.write_files(project_id, {path: content})
+
+    async def make_directory(self, project_id: str, path: str) -> str:
+        return await self.write_files(project_id, {path: DIRECTORY})
+
+    async def delete_path(self, project_id: str, path: str) -> str:
+        return await self.write_files(project_id, {path: DELETE})
+
+    async def write_files(self, project_id: str, files: Dict[str, Any]) -> str:
+        """Apply several changes as one revision; returns the new root hash.
+
+        Values are file contents, ``DIRECTORY`` or ``DELETE``. Parent directories
+        are created as needed; only trees on changed paths are rewritten.
+        """
+        started = time.perf_counter()
+        changes = self._changes(files)
+
+        for _ in range(max(1, settings.file_store_write_retries)):
+            root = await self.get_root(project_id)
+            pending: Dict[str, Dict[str, Any]] = {"blobs": {}, "trees": {}, "paths": {}}
+            new_root, _ = await self._apply(root["root_hash"], changes, pending, self._now())
+            if new_root == root["root_hash"]:
+                self._stats["noop_writes"] += 1
+                return new_root
+
+            await self._persist(pending)
+            response = await self.supabase.table("project_files")\
+                .update({
+                    "root_hash": new_root,
+                    "revision": root["revision"] + 1,
+                    "updated_at": datetime.utcnow().isoformat(),
+                })\
+                .eq("project_id", project_id)\
+                .eq("revision", root["revision"])\
+                .execute()
+            if response.data:
+                self._update_index(root["root_hash"], new_root, pending["paths"])
+                self._stats["writes"] += 1
+                self.write_latency.record((time.perf_counter() - started) * 1000)
+                return new_root
+            # Lost the compare-and-set; re-apply on the winner's tree
+            self._stats["conflicts"] += 1
+
+        raise FileStoreConflict(f"Files of project {project_id} changed concurrently; retry the write")
+
+    def _update_index(self, old_root: str, new_root: str, paths: Dict[str, Optional[Dict[str, Any]]]):
+        """Derive the new root's index from the old one; None marks a deleted path"""
+        old_index = self._indexes.get(old_root)
+        if old_index is None:
+            return
+        index = dict(old_index)
+        for path, entry in paths.items():
+            if entry is not None:
+                index[path] = entry
+                continue
+            index.pop(path, None)
+            for name in [name for name in index if name.startswith(f"{path}/")]:
+                del index[name]
+        self._indexes.set(new_root, index)
+
+    def _changes(self, files: Dict[str, Any]) -> Dict[str, Any]:
+        """Nest flat path changes by directory"""
+        changes: Dict[str, Any] = {}
+        for path, change in files.items():
+            parts = split_path(path)
+            node = changes
+            for part in parts[:-1]:
+                node = node.setdefault(part, {})
+                if not isinstance(node, dict):
+                    raise ValueError(f"Conflicting changes under {path!r}")
+            if isinstance(node.get(parts[-1]), dict):
+                raise ValueError(f"Conflicting changes under {path!r}")
+            node[parts[-1]] = change
+        return changes
+
+    async def _apply(self, base: Optional[str], changes: Dict[str, Any], pending: Dict[str, Dict[str, Any]],
+                     now: str, prefix: str = "") -> Tuple[str, int]:
+        """New tree for ``base`` with ``changes`` applied; returns (hash, total size)"""
+        entries = dict(await self.get_tree(base)) if base else {}
+        for name, change in changes.items():
+            existing = entries.get(name)
+            path = f"{prefix}{name}"
+            if isinstance(change, dict):
+                if existing is not None and existing["type"] != "directory":
+                    raise NotADirectoryError(path)
+                child_hash, size = await self._apply(
+                    existing["hash"] if existing else None, change, pending, now, prefix=f"{path}/"
+                )
+                if existing is None or child_hash != existing["hash"]:
+                    entries[name] = {"type": "directory", "hash": child_hash, "size": size, "mtime": now}
+            elif change is DELETE:
+                if existing is None:
+                    raise FileNotFoundError(path)
+                del entries[name]
+                pending["paths"][path] = None
+                continue
+            elif change is DIRECTORY:
+                if existing is not None and existing["type"] != "directory":
+                    raise FileExistsError(path)
+                if existing is None:
+                    entries[name] = {"type": "directory", "hash": EMPTY_TREE, "size": 0, "mtime": now}
+                    pending["trees"][EMPTY_TREE] = {}
+            else:
+                if existing is not None and existing["type"] == "directory":
+                    raise IsADirectoryError(path)
+                hash_ = blob_hash(change)
+                if existing is None or existing["hash"] != hash_:
+                    entries[name] = {"type": "file", "hash": hash_, "size": len(change.encode("utf-8")), "mtime": now}
+                    pending["blobs"][hash_] = change
+            if entries[name] is not existing:
+                pending["paths"][path] = entries[name]
+
+        hash_ = tree_hash(entries)
+        if hash_ != base:
+            pending["trees"][hash_] = entries
+        return hash_, sum(entry["size"] for entry in entries.values())
+
+    async def _persist(self, pending: Dict[str, Dict[str, Any]]):
+        """Write new objects; they must exist before any root points at them"""
+        blobs_written, trees_written = await asyncio.gather(
+            self._insert_objects("file_blobs", [
+                {"hash": hash_, "content": content, "size": len(content.encode("utf-8"))}
+                for hash_, content in pending["blobs"].items()
+            ]),
+            self._insert_objects("file_trees", [
+                {"hash": hash_, "entries": entries} for hash_, entries in pending["trees"].items()
+            ]),
+        )
+        self._stats["blobs_written"] += blobs_written
+        self._stats["trees_written"] += trees_written
+        for hash_, content in pending["blobs"].items():
+            self._blobs.set(hash_, content)
+        for hash_, entries in pending["trees"].items():
+            self._trees.set(hash_, entries)
+
+    async def _insert_objects(self, table: str, rows: List[Dict[str, Any]]) -> int:
+        """Insert objects not stored yet; returns how many were new"""
+        if not rows:
+            return 0
+        response = await self.supabase.table(table)\
+            .upsert(rows, on_conflict="hash", ignore_duplicates=True)\
+            .execute()
+        return len(response.data)
+
+    def _now(self) -> str:
+        return datetime.utcnow().isoformat()
+
+    def stats(self) -> Dict[str, Any]:
+        """Write counters, object cache usage and write latency"""
+        return {
+            **self._stats,
+            "cached_trees": len(self._trees),
+            "cached_blobs": len(self._blobs),
+            "cached_indexes": len(self._indexes),
+            "write_latency": self.write_latency.stats(),
+        }
+
+
+# Singleton instance
+file_store = FileStore()
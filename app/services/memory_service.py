@@ -1,11 +1,280 @@
 """
 Project memory service using Agno framework's memory capabilities
 """
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable, Awaitable
+from collections import OrderedDict
 from agno.memory import Memory, MemoryItem
-from app.database import get_supabase
+from app.cache import TTLCache
+from app.config import settings
+from app.database import get_supabase, DatabaseError
+from app.metrics import LatencyRecorder
+from app.services.embeddings import VectorIndex, get_embedder, embed
+import asyncio
+import hashlib
+import logging
+import time
 import uuid
 import json
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Columns needed to rehydrate a Memory (skips the remote embedding vector)
+MEMORY_ITEM_COLUMNS = "id,item_type,content,metadata,importance_score,created_at,local_embedding,embedding_model"
+
+# Items kept per resident project, in Agno Memory and the local vector index alike
+MEMORY_MAX_ITEMS = 1000
+
+
+class ProjectMemoryRegistry:
+    """Bounded registry of resident per-project Agno Memory objects.
+
+    Projects are kept in LRU order and evicted when more than ``max_resident``
+    are loaded or when they have been idle for ``idle_seconds``. A miss builds a
+    fresh Memory and rehydrates it through ``loader`` (from ``memory_items``);
+    concurrent misses for the same project share a single load.
+    """
+
+    def __init__(self, factory: Callable[[str], Memory], loader: Callable[[str, Memory], Awaitable[None]],
+                 max_resident: int, idle_seconds: float, index_factory: Optional[Callable[[], Any]] = None):
+        self._factory = factory
+        self._loader = loader
+        self._index_factory = index_factory
+        self.max_resident = max_resident
+        self.idle_seconds = idle_seconds
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._loading: Dict[str, asyncio.Future] = {}
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    async def get(self, project_id: str) -> Memory:
+        """Get the resident Memory for a project, rehydrating it on a miss"""
+        self._evict_idle()
+
+        # Wait for an in-flight rehydration rather than using a half-loaded Memory
+        if project_id in self._loading:
+            return await asyncio.shield(self._loading[project_id])
+
+        entry = self._entries.get(project_id)
+        if entry is not None:
+            entry["last_access"] = time.monotonic()
+            self._entries.move_to_end(project_id)
+            self._stats["hits"] += 1
+            return entry["memory"]
+
+        self._stats["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._loading[project_id] = future
+        try:
+            memory = self._factory(project_id)
+            self._entries[project_id] = {
+                "memory": memory,
+                "index": self._index_factory() if self._index_factory else None,
+                "last_access": time.monotonic(),
+                "bytes": 0,
+            }
+            await self._loader(project_id, memory)
+            future.set_result(memory)
+        except Exception as e:
+            self._entries.pop(project_id, None)
+            future.set_exception(e)
+            future.exception()  # Waiters re-raise; don't warn if there are none
+            raise
+        finally:
+            del self._loading[project_id]
+
+        self._evict_overflow()
+        return memory
+
+    def record_item(self, project_id: str, content: str, metadata: Optional[Dict] = None):
+        """Account for an item added to a resident project"""
+        entry = self._entries.get(project_id)
+        if entry is not None:
+            entry["bytes"] += len(content.encode("utf-8")) + len(json.dumps(metadata or {}, default=str))
+
+    def get_index(self, project_id: str) -> Optional[Any]:
+        """Vector index of a resident project, if local embeddings are enabled"""
+        entry = self._entries.get(project_id)
+        return entry["index"] if entry else None
+
+    def is_resident(self, project_id: str, memory: Memory) -> bool:
+        """Whether ``memory`` is still the registered Memory for the project"""
+        entry = self._entries.get(project_id)
+        return entry is not None and entry["memory"] is memory
+
+    def evict(self, project_id: str) -> Optional[Memory]:
+        """Drop a project from the registry"""
+        entry = self._entries.pop(project_id, None)
+        return entry["memory"] if entry else None
+
+    def _evict_idle(self):
+        cutoff = time.monotonic() - self.idle_seconds
+        while self._entries:
+            project_id, entry = next(iter(self._entries.items()))
+            if entry["last_access"] >= cutoff:
+                break
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _evict_overflow(self):
+        while len(self._entries) > self.max_resident:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Gauges for resident projects and approximate memory held"""
+        return {
+            "resident_projects": len(self._entries),
+            "max_resident_projects": self.max_resident,
+            "approx_bytes": sum(
+                entry["bytes"] + (entry["index"].nbytes if entry["index"] is not None else 0)
+                for entry in self._entries.values()
+            ),
+            **self._stats,
+        }
+
+
+class MemoryWriteBuffer:
+    """Write-behind buffer for ``memory_items`` rows.
+
+    Rows are queued per project and written with bulk inserts once
+    ``batch_size`` rows are pending, every ``flush_interval`` seconds, and on
+    shutdown. Identical items (same project, type, content and metadata) seen
+    within ``dedupe_window`` seconds are dropped.
+
+    If a bulk insert fails the batch is retried row by row, so one bad row
+    doesn't hold back the rest; rows that fail ``max_attempts`` flushes are
+    logged and dropped.
+    """
+
+    def __init__(self, supabase, batch_size: int, flush_interval: float, dedupe_window: float,
+                 max_attempts: int = 3):
+        self.supabase = supabase
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dedupe_window = dedupe_window
+        self.max_attempts = max_attempts
+        self._pending: Dict[str, List[Dict[str, Any]]] = {}
+        self._recent: Dict[str, float] = {}
+        # Failed flushes per row id
+        self._attempts: Dict[str, int] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flusher: Optional[asyncio.Task] = None
+        self.flush_latency = LatencyRecorder()
+        self._stats = {"queued": 0, "flushed": 0, "flushes": 0, "deduplicated": 0, "failures": 0, "dropped": 0}
+
+    @property
+    def backlog(self) -> int:
+        return sum(len(rows) for rows in self._pending.values())
+
+    async def add(self, row: Dict[str, Any]) -> bool:
+        """Queue a row; returns False if it was a duplicate"""
+        fingerprint = hashlib.sha1(json.dumps(
+            [row["project_id"], row["item_type"], row["content"], row["metadata"]],
+            sort_keys=True, default=str
+        ).encode("utf-8")).hexdigest()
+
+        now = time.monotonic()
+        seen_at = self._recent.get(fingerprint)
+        if seen_at is not None and now - seen_at < self.dedupe_window:
+            self._stats["deduplicated"] += 1
+            return False
+        self._recent[fingerprint] = now
+
+        self._pending.setdefault(row["project_id"], []).append(row)
+        self._stats["queued"] += 1
+
+        if self.backlog >= self.batch_size:
+            await self.flush()
+        return True
+
+    async def flush(self):
+        """Write all pending rows in a single bulk insert"""
+        async with self._flush_lock:
+            if not self._pending:
+                return
+
+            pending, self._pending = self._pending, {}
+            rows = [row for project_rows in pending.values() for row in project_rows]
+
+            started = time.perf_counter()
+            try:
+                await self.supabase.table("memory_items").insert(rows).execute()
+                failed = []
+            except Exception:
+                logger.exception("Failed to flush %d memory items; retrying them one by one", len(rows))
+                self._stats["failures"] += 1
+                failed = await self._insert_each(rows)
+            finally:
+                self.flush_latency.record((time.perf_counter() - started) * 1000)
+
+            self._stats["flushes"] += 1
+            self._stats["flushed"] += len(rows) - len(failed)
+            failed_ids = {row["id"] for row in failed}
+            for row in rows:
+                if row["id"] not in failed_ids:
+                    self._attempts.pop(row["id"], None)
+            self._requeue(failed)
+            self._prune_recent()
+
+    async def _insert_each(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Insert rows individually; returns the ones that still failed"""
+        async def insert(row):
+            try:
+                await self.supabase.table("memory_items").insert(row).execute()
+            except DatabaseError as e:
+                # Already written by an earlier flush whose response was lost
+                if e.code != "23505":
+                    raise
+
+        results = await asyncio.gather(*(insert(row) for row in rows), return_exceptions=True)
+        return [row for row, result in zip(rows, results) if isinstance(result, Exception)]
+
+    def _requeue(self, rows: List[Dict[str, Any]]):
+        """Put failed rows back ahead of anything queued meanwhile, or drop them once exhausted"""
+        retry: Dict[str, List[Dict[str, Any]]] = {}
+        for row in rows:
+            attempts = self._attempts.get(row["id"], 0) + 1
+            if attempts >= self.max_attempts:
+                self._attempts.pop(row["id"], None)
+                self._stats["dropped"] += 1
+                logger.error(
+                    "Dropping memory item %s for project %s after %d failed flushes",
+                    row["id"], row["project_id"], attempts,
+                )
+                continue
+            self._attempts[row["id"]] = attempts
+            retry.setdefault(row["project_id"], []).append(row)
+        for project_id, project_rows in retry.items():
+            self._pending[project_id] = project_rows + self._pending.get(project_id, [])
+
+    def _prune_recent(self):
+        cutoff = time.monotonic() - self.dedupe_window
+        self._recent = {key: seen for key, seen in self._recent.items() if seen >= cutoff}
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        """Start the periodic flusher"""
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self):
+        """Stop the periodic flusher and write anything still pending"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backlog": self.backlog,
+            **self._stats,
+            "flush_latency": self.flush_latency.stats(),
+        }
 
 
 class MemoryService:
@@ -13,25 +282,93 @@ class MemoryService:
     
     def __init__(self):
         self.supabase = get_supabase()
-        # Initialize Agno memory instances per project
-        self._project_memories = {}
+        # Local embedder + per-project vector index (None keeps Agno's remote search)
+        self._embedder = get_embedder()
+        self.search_latency = LatencyRecorder()
+        # Rehydration: time until a project is usable, and until its tail is loaded
+        self.warmup_latency = LatencyRecorder()
+        self.full_load_latency = LatencyRecorder()
+        self._warmup = TTLCache(maxsize=settings.memory_max_resident_projects, ttl=settings.memory_idle_seconds)
+        self._warming: Dict[str, set] = {}
+        self._tail_loads: Dict[str, asyncio.Task] = {}
+        # Bounded registry of Agno memory instances per project
+        self._registry = ProjectMemoryRegistry(
+            factory=self._create_project_memory,
+            loader=self._load_items,
+            max_resident=settings.memory_max_resident_projects,
+            idle_seconds=settings.memory_idle_seconds,
+            index_factory=self._create_index if self._embedder else None,
+        )
+        # Write-behind persistence for memory_items
+        self._writer = MemoryWriteBuffer(
+            self.supabase,
+            batch_size=settings.memory_flush_batch_size,
+            flush_interval=settings.memory_flush_interval_seconds,
+            dedupe_window=settings.memory_dedupe_window_seconds,
+            max_attempts=settings.memory_flush_max_attempts,
+        )
     
-    def _get_project_memory(self, project_id: str) -> Memory:
-        """Get or create Agno Memory instance for a project"""
-        if project_id not in self._project_memories:
-            # Initialize Agno Memory with project-specific configuration
-            self._project_memories[project_id] = Memory(
-                memory_id=f"project_{project_id}",
-                storage_backend="supabase",  # Use Supabase as storage backend
-                embedding_model="text-embedding-ada-002",  # For semantic search
-                max_memory_items=1000,  # Limit memory items per project
-                similarity_threshold=0.7
-            )
-        return self._project_memories[project_id]
+    def start(self):
+        """Start background persistence"""
+        self._writer.start()
+    
+    async def stop(self):
+        """Cancel background rehydration and flush pending memory writes"""
+        for task in list(self._tail_loads.values()):
+            task.cancel()
+        await self._writer.stop()
+    
+    def _create_index(self) -> VectorIndex:
+        """Create an empty vector index sized for the configured embedder and capped like Memory"""
+        return VectorIndex(self._embedder.dim, max_items=MEMORY_MAX_ITEMS)
+    
+    def _create_project_memory(self, project_id: str) -> Memory:
+        """Create an empty Agno Memory instance for a project"""
+        # Initialize Agno Memory with project-specific configuration
+        return Memory(
+            memory_id=f"project_{project_id}",
+            storage_backend="supabase",  # Use Supabase as storage backend
+            embedding_model="text-embedding-ada-002",  # For semantic search
+            max_memory_items=MEMORY_MAX_ITEMS,  # Limit memory items per project
+            similarity_threshold=0.7
+        )
+    
+    async def _get_project_memory(self, project_id: str) -> Memory:
+        """Get the resident Agno Memory for a project, loading it on first use"""
+        return await self._registry.get(project_id)
+    
+    async def get_memory(self, project_id: str) -> Memory:
+        """Shared project Memory for agents"""
+        return await self._get_project_memory(project_id)
+    
+    async def _add_item(self, project_id: str, memory: Memory, memory_item: MemoryItem, vector=None):
+        """Add an item to a resident Memory and its vector index; returns the local embedding"""
+        await memory.add(memory_item)
+        self._registry.record_item(project_id, memory_item.content, memory_item.metadata)
+        
+        index = self._registry.get_index(project_id)
+        if index is None:
+            return None
+        
+        if vector is None:
+            vector = (await embed(self._embedder, [memory_item.content]))[0]
+        index.add(vector, [self._index_payload(memory_item)])
+        return vector
+    
+    def _index_payload(self, memory_item: MemoryItem, row: Optional[Dict] = None) -> Dict:
+        """Search result shape stored alongside each vector"""
+        row = row or {}
+        return {
+            "id": row.get("id", getattr(memory_item, "id", None)),
+            "content": memory_item.content,
+            "metadata": memory_item.metadata,
+            "importance_score": memory_item.importance_score,
+            "created_at": row.get("created_at", getattr(memory_item, "created_at", None)),
+        }
     
     async def store_conversation(self, project_id: str, role: str, content: str, metadata: Dict = None):
         """Store a conversation message using Agno Memory"""
-        memory = self._get_project_memory(project_id)
+        memory = await self._get_project_memory(project_id)
         
         # Create memory item with Agno
         memory_item = MemoryItem(
@@ -46,17 +383,17 @@ class MemoryService:
         )
         
         # Store in Agno memory
-        await memory.add(memory_item)
+        vector = await self._add_item(project_id, memory, memory_item)
         
         # Also store in Supabase for persistence
         await self._store_in_supabase(project_id, "conversation", content, {
             "role": role,
             **(metadata or {})
-        })
+        }, embedding=vector, importance_score=memory_item.importance_score)
     
     async def store_decision(self, project_id: str, decision: str, rationale: str, components: List[str]):
         """Store a coding decision using Agno Memory"""
-        memory = self._get_project_memory(project_id)
+        memory = await self._get_project_memory(project_id)
         
         content = f"Decision: {decision}\nRationale: {rationale}\nAffected Components: {', '.join(components)}"
         
@@ -72,18 +409,18 @@ class MemoryService:
             importance_score=0.9  # Decisions are very important
         )
         
-        await memory.add(memory_item)
+        vector = await self._add_item(project_id, memory, memory_item)
         
         # Store in Supabase
         await self._store_in_supabase(project_id, "decision", content, {
             "decision": decision,
             "rationale": rationale,
             "affected_components": components
-        })
+        }, embedding=vector, importance_score=memory_item.importance_score)
     
     async def store_pattern(self, project_id: str, pattern_name: str, pattern_code: str, usage_context: str):
         """Store a code pattern using Agno Memory"""
-        memory = self._get_project_memory(project_id)
+        memory = await self._get_project_memory(project_id)
         
         content = f"Pattern: {pattern_name}\nCode: {pattern_code}\nContext: {usage_context}"
         
@@ -98,17 +435,17 @@ class MemoryService:
             importance_score=0.8  # Patterns are important for reuse
         )
         
-        await memory.add(memory_item)
+        vector = await self._add_item(project_id, memory, memory_item)
         
         # Store in Supabase
         await self._store_in_supabase(project_id, "pattern", content, {
             "pattern_name": pattern_name,
             "usage_context": usage_context
-        })
+        }, embedding=vector, importance_score=memory_item.importance_score)
     
     async def store_preference(self, project_id: str, key: str, value: str):
         """Store a user preference using Agno Memory"""
-        memory = self._get_project_memory(project_id)
+        memory = await self._get_project_memory(project_id)
         
         content = f"Preference: {key} = {value}"
         
@@ -123,17 +460,17 @@ class MemoryService:
             importance_score=0.7  # Preferences are moderately important
         )
         
-        await memory.add(memory_item)
+        vector = await self._add_item(project_id, memory, memory_item)
         
         # Store in Supabase
         await self._store_in_supabase(project_id, "preference", content, {
             "key": key,
             "value": value
-        })
+        }, embedding=vector, importance_score=memory_item.importance_score)
     
     async def get_project_memory(self, project_id: str, item_type: Optional[str] = None, limit: int = 50) -> List[Dict]:
         """Get memory items for a project using Agno Memory"""
-        memory = self._get_project_memory(project_id)
+        memory = await self._get_project_memory(project_id)
         
         # Get recent memories from Agno
         recent_memories = await memory.get_recent(limit=limit)
@@ -158,8 +495,11 @@ class MemoryService:
         ]
     
     async def search_memory(self, project_id: str, query: str, limit: int = 10) -> List[Dict]:
-        """Search memory items using Agno's semantic search"""
-        memory = self._get_project_memory(project_id)
+        """Search memory items using the local vector index, or Agno's semantic search"""
+        if self._embedder is not None:
+            return await self._search_index(project_id, query, limit)
+        
+        memory = await self._get_project_memory(project_id)
         
         # Use Agno's semantic search
         search_results = await memory.search(
@@ -183,31 +523,47 @@ class MemoryService:
     
     async def get_relevant_context(self, project_id: str, query: str, context_type: Optional[str] = None) -> str:
         """Get relevant context for AI agents using Agno Memory"""
-        memory = self._get_project_memory(project_id)
-        
         # Search for relevant memories
-        relevant_memories = await memory.search(
-            query=query,
-            limit=5,
-            similarity_threshold=0.7
-        )
+        if self._embedder is not None:
+            relevant_memories = await self._search_index(project_id, query, 5)
+        else:
+            memory = await self._get_project_memory(project_id)
+            relevant_memories = [
+                {"content": mem.content, "metadata": mem.metadata}
+                for mem in await memory.search(
+                    query=query,
+                    limit=5,
+                    similarity_threshold=0.7
+                )
+            ]
         
         # Filter by context type if specified
         if context_type:
             relevant_memories = [
                 mem for mem in relevant_memories 
-                if mem.metadata.get("type") == context_type
+                if mem["metadata"].get("type") == context_type
             ]
         
         # Format context for AI
         context_parts = []
         for mem in relevant_memories:
-            context_parts.append(f"[{mem.metadata.get('type', 'memory').upper()}] {mem.content}")
+            context_parts.append(f"[{mem['metadata'].get('type', 'memory').upper()}] {mem['content']}")
         
         return "\n\n".join(context_parts) if context_parts else ""
     
-    async def _store_in_supabase(self, project_id: str, item_type: str, content: str, metadata: Dict):
-        """Store memory item in Supabase for persistence"""
+    async def _search_index(self, project_id: str, query: str, limit: int) -> List[Dict]:
+        """Cosine top-k over the project's in-process vector index"""
+        started = time.perf_counter()
+        await self._get_project_memory(project_id)
+        index = self._registry.get_index(project_id)
+        query_vector = await embed(self._embedder, [query])
+        results = index.search(query_vector, limit, threshold=settings.local_similarity_threshold)[0]
+        self.search_latency.record((time.perf_counter() - started) * 1000)
+        return results
+    
+    async def _store_in_supabase(self, project_id: str, item_type: str, content: str, metadata: Dict,
+                                 embedding=None, importance_score: float = 0.7):
+        """Queue memory item for batched persistence in Supabase"""
         memory_id = str(uuid.uuid4())
         
         memory_data = {
@@ -215,48 +571,178 @@ class MemoryService:
             "project_id": project_id,
             "item_type": item_type,
             "content": content,
-            "metadata": metadata
+            "metadata": metadata,
+            "importance_score": importance_score
         }
         
-        self.supabase.table("memory_items").insert(memory_data).execute()
+        # Already resident; keep a running background load from adding it twice
+        warming = self._warming.get(project_id)
+        if warming is not None:
+            warming.add(memory_id)
+        
+        # Persist the local embedding so rehydration doesn't recompute it
+        if embedding is not None:
+            memory_data["local_embedding"] = [round(float(x), 6) for x in embedding]
+            memory_data["embedding_model"] = self._embedder.name
+        
+        await self._writer.add(memory_data)
     
     async def load_project_memory_from_supabase(self, project_id: str):
-        """Load existing memory items from Supabase into Agno Memory"""
-        memory = self._get_project_memory(project_id)
+        """Reload a project's Agno Memory from Supabase"""
+        self._registry.evict(project_id)
+        await self._get_project_memory(project_id)
+    
+    async def _load_items(self, project_id: str, memory: Memory):
+        """Rehydrate a project's Memory: most important items now, the rest in the background"""
+        started = time.perf_counter()
+        # Make sure buffered writes are visible to the load
+        await self._writer.flush()
         
-        # Get existing memory items from Supabase
-        response = self.supabase.table("memory_items")\
-            .select("*")\
+        # Most important, then most recent, items first so the project is usable right away
+        response = await self.supabase.table("memory_items")\
+            .select(MEMORY_ITEM_COLUMNS)\
             .eq("project_id", project_id)\
-            .order("created_at", desc=False)\
+            .order("importance_score", desc=True)\
+            .order("created_at", desc=True)\
+            .limit(settings.memory_warm_items)\
             .execute()
+        await self._add_rows(project_id, memory, response.data)
+        
+        ready_ms = (time.perf_counter() - started) * 1000
+        self.warmup_latency.record(ready_ms)
+        complete = len(response.data) < settings.memory_warm_items
+        self._warmup.set(project_id, {
+            "ready_ms": round(ready_ms, 2),
+            "loaded_ms": round(ready_ms, 2) if complete else None,
+            "items": len(response.data),
+        })
+        if complete:
+            self.full_load_latency.record(ready_ms)
+            return
         
-        # Load into Agno Memory
-        for item in response.data:
-            memory_item = MemoryItem(
+        # Stream the remaining items newest first without holding up the caller
+        seen = {row["id"] for row in response.data}
+        self._warming[project_id] = seen
+        self._tail_loads[project_id] = asyncio.create_task(
+            self._load_tail(project_id, memory, seen, started)
+        )
+    
+    async def _load_tail(self, project_id: str, memory: Memory, seen: set, started: float):
+        """Page through the rest of a project's memory_items by (created_at, id) cursor"""
+        page_size = settings.memory_load_page_size
+        cursor = None
+        try:
+            while self._registry.is_resident(project_id, memory):
+                query = self.supabase.table("memory_items")\
+                    .select(MEMORY_ITEM_COLUMNS)\
+                    .eq("project_id", project_id)
+                if cursor:
+                    created_at, item_id = cursor
+                    query = query.or_(f"created_at.lt.{created_at},and(created_at.eq.{created_at},id.lt.{item_id})")
+                response = await query\
+                    .order("created_at", desc=True)\
+                    .order("id", desc=True)\
+                    .limit(page_size)\
+                    .execute()
+                
+                rows = [row for row in response.data if row["id"] not in seen]
+                seen.update(row["id"] for row in rows)
+                await self._add_rows(project_id, memory, rows)
+                
+                if len(response.data) < page_size:
+                    loaded_ms = (time.perf_counter() - started) * 1000
+                    self.full_load_latency.record(loaded_ms)
+                    self._warmup.set(project_id, {
+                        **(self._warmup.get(project_id) or {}),
+                        "loaded_ms": round(loaded_ms, 2),
+                        "items": len(seen),
+                    })
+                    break
+                cursor = (response.data[-1]["created_at"], response.data[-1]["id"])
+        except Exception:
+            logger.warning("Background memory load failed for project %s", project_id, exc_info=True)
+        finally:
+            if self._warming.get(project_id) is seen:
+                del self._warming[project_id]
+                self._tail_loads.pop(project_id, None)
+    
+    async def _add_rows(self, project_id: str, memory: Memory, rows: List[Dict]):
+        """Bulk-add a page of memory_items rows to a resident Memory and its vector index"""
+        if not rows:
+            return
+        
+        vectors = await self._stored_embeddings(rows)
+        memory_items = [
+            MemoryItem(
                 content=item["content"],
                 metadata={
-                    **item["metadata"],
+                    **(item["metadata"] or {}),
                     "type": item["item_type"],
                     "project_id": project_id
                 },
-                importance_score=0.7  # Default importance
+                importance_score=item.get("importance_score") or 0.7
             )
+            for item in rows
+        ]
+        
+        for memory_item in memory_items:
             await memory.add(memory_item)
+            self._registry.record_item(project_id, memory_item.content, memory_item.metadata)
+        
+        index = self._registry.get_index(project_id)
+        if index is not None:
+            index.add(vectors, [
+                self._index_payload(memory_item, row) for memory_item, row in zip(memory_items, rows)
+            ])
+    
+    async def _stored_embeddings(self, rows: List[Dict]):
+        """Embeddings for loaded rows: reuse persisted vectors, batch-embed the rest"""
+        if self._embedder is None or not rows:
+            return None
+        
+        vectors = np.zeros((len(rows), self._embedder.dim), dtype=np.float32)
+        missing = []
+        for position, row in enumerate(rows):
+            stored = row.get("local_embedding")
+            if stored and row.get("embedding_model") == self._embedder.name:
+                vectors[position] = stored
+            else:
+                missing.append(position)
+        
+        if missing:
+            vectors[missing] = await embed(self._embedder, [rows[i]["content"] for i in missing])
+        return vectors
     
     async def clear_project_memory(self, project_id: str):
         """Clear all memory for a project"""
-        if project_id in self._project_memories:
-            memory = self._project_memories[project_id]
+        memory = self._registry.evict(project_id)
+        if memory is not None:
             await memory.clear()
-            del self._project_memories[project_id]
         
-        # Also clear from Supabase
-        self.supabase.table("memory_items")\
+        # Also clear from Supabase (flush first so buffered rows are removed too)
+        await self._writer.flush()
+        await self.supabase.table("memory_items")\
             .delete()\
             .eq("project_id", project_id)\
             .execute()
 
 
+    def get_warmup(self, project_id: str) -> Optional[Dict[str, Any]]:
+        """Last rehydration timings for a project (ready_ms, loaded_ms, items)"""
+        return self._warmup.get(project_id)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Registry and write-buffer gauges for monitoring"""
+        return {
+            **self._registry.stats(),
+            "embedding_backend": self._embedder.name if self._embedder else "agno",
+            "search_latency": self.search_latency.stats(),
+            "warming_projects": len(self._warming),
+            "warmup_latency": self.warmup_latency.stats(),
+            "full_load_latency": self.full_load_latency.stats(),
+            "writes": self._writer.stats(),
+        }
+
+
 # Singleton instance
 memory_service = MemoryService()
\ No newline at end of file
@@ -4,6 +4,7 @@ Project-related business logic
 from typing import List, Optional
 from app.database import get_supabase
 from app.models import Project, User
+from app.services.context_assembler import context_assembler
 import uuid
 
 
@@ -13,7 +14,7 @@ class ProjectService:
     
     async def get_user_projects(self, user_id: str) -> List[dict]:
         """Get all projects for a user"""
-        response = self.supabase.table("projects")\
+        response = await self.supabase.table("projects")\
             .select("*")\
             .eq("user_id", user_id)\
             .order("updated_at", desc=True)\
@@ -23,7 +24,7 @@ class ProjectService:
     
     async def get_project_by_id(self, project_id: str) -> Optional[dict]:
         """Get a project by ID"""
-        response = self.supabase.table("projects")\
+        response = await self.supabase.table("projects")\
             .select("*")\
             .eq("id", project_id)\
             .execute()
@@ -44,7 +45,7 @@ class ProjectService:
             "tier": user.tier,
         }
         
-        project_response = self.supabase.table("projects").insert(project_data).execute()
+        project_response = await self.supabase.table("projects").insert(project_data).execute()
         
         if not project_response.data:
             raise Exception("Failed to create project")
@@ -55,6 +56,10 @@ class ProjectService:
         else:
             await self._initialize_spec_files(project_id, user.id)
         
+        # Hand the project a warm sandbox so the first preview doesn't wait for one
+        from app.services.sandbox_service import sandbox_service
+        sandbox_service.prepare(project_id)
+        
         return project_response.data[0]
     
     async def _generate_ai_specs(self, project_id: str, user_id: str, project_name: str, description: str, include_backend: bool = False):
@@ -97,7 +102,7 @@ class ProjectService:
                     "version": 1,
                     "created_by": user_id,
                 }
-                self.supabase.table("spec_files").insert(spec_data).execute()
+                await self.supabase.table("spec_files").insert(spec_data).execute()
     
     async def _initialize_spec_files(self, project_id: str, user_id: str):
         """Initialize the three spec files for a new project"""
@@ -180,19 +185,23 @@ Each user story should have clear acceptance criteria...
                 "version": 1,
                 "created_by": user_id,
             }
-            self.supabase.table("spec_files").insert(spec_data).execute()
+            await self.supabase.table("spec_files").insert(spec_data).execute()
+        
+        context_assembler.snapshots.invalidate(project_id)
     
     async def update_project_status(self, project_id: str, status: str):
         """Update project status"""
-        self.supabase.table("projects")\
+        await self.supabase.table("projects")\
             .update({"status": status})\
             .eq("id", project_id)\
             .execute()
+        context_assembler.snapshots.invalidate(project_id)
     
     async def delete_project(self, project_id: str):
         """Delete a project and all related data"""
         # Supabase will handle cascade deletion due to foreign key constraints
-        self.supabase.table("projects").delete().eq("id", project_id).execute()
+        await self.supabase.table("projects").delete().eq("id", project_id).execute()
+        context_assembler.snapshots.invalidate(project_id)
 
 
 # Singleton instance
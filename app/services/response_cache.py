@@ -0,0 +1,153 @@
+"""
+Content-addressed cache for deterministic code generation responses
+"""
+from typing import Any, Dict, Optional
+from datetime import datetime, timedelta
+from pathlib import Path
+from app.cache import TTLCache
+from app.config import settings
+from app.database import get_supabase
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapse whitespace so prompts differing only in spacing share a key.
+
+    Case is kept: identifiers in the prompt end up in the generated code.
+    """
+    return re.sub(r"\s+", " ", prompt or "").strip()
+
+
+def hash_context(context: Optional[Dict[str, Any]]) -> str:
+    """Stable hash of the spec/project context passed to the agent"""
+    encoded = json.dumps(context or {}, sort_keys=True, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Two-level response cache: in-memory LRU in front of an optional persistent tier.
+
+    Keys are SHA-256 digests of (agent type, tier, model, normalized prompt,
+    context hash). The persistent tier is selected by ``response_cache_backend``:
+    ``memory`` (none), ``disk`` (JSON files under ``response_cache_dir``) or
+    ``database`` (the ``response_cache`` table).
+    """
+
+    def __init__(self):
+        self.ttl = settings.response_cache_ttl_seconds
+        self.backend = settings.response_cache_backend
+        self._memory = TTLCache(maxsize=settings.response_cache_size, ttl=self.ttl)
+        self._dir = Path(settings.response_cache_dir)
+        self.supabase = get_supabase()
+        self._stats = {"hits": 0, "persistent_hits": 0, "misses": 0, "bypassed": 0, "stores": 0}
+
+    def make_key(self, agent_type: str, tier: Any, model: str, prompt: str,
+                 context: Optional[Dict[str, Any]] = None) -> str:
+        """Build the content address for a generation request"""
+        tier = getattr(tier, "value", tier)
+        parts = [agent_type, str(tier), model, normalize_prompt(prompt), hash_context(context)]
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Look up a cached response (memory first, then the persistent tier)"""
+        value = self._memory.get(key)
+        if value is not None:
+            self._stats["hits"] += 1
+            return value
+
+        try:
+            value = await self._get_persistent(key)
+        except Exception:
+            logger.warning("Response cache lookup failed for %s", key, exc_info=True)
+            value = None
+
+        if value is None:
+            self._stats["misses"] += 1
+            return None
+
+        self._stats["persistent_hits"] += 1
+        self._memory.set(key, value)
+        return value
+
+    async def set(self, key: str, value: Dict[str, Any]):
+        """Store a response in every configured tier"""
+        self._memory.set(key, value)
+        self._stats["stores"] += 1
+        try:
+            await self._set_persistent(key, value)
+        except Exception:
+            logger.warning("Response cache store failed for %s", key, exc_info=True)
+
+    def record_bypass(self):
+        self._stats["bypassed"] += 1
+
+    # --- Persistent tier ---
+    def _path(self, key: str) -> Path:
+        return self._dir / key[:2] / f"{key}.json"
+
+    async def _get_persistent(self, key: str) -> Optional[Dict[str, Any]]:
+        if self.backend == "disk":
+            return await asyncio.to_thread(self._read_disk, key)
+
+        if self.backend == "database":
+            response = await self.supabase.table("response_cache")\
+                .select("value")\
+                .eq("key", key)\
+                .gt("expires_at", datetime.utcnow().isoformat())\
+                .limit(1)\
+                .execute()
+            return response.data[0]["value"] if response.data else None
+
+        return None
+
+    async def _set_persistent(self, key: str, value: Dict[str, Any]):
+        if self.backend == "disk":
+            await asyncio.to_thread(self._write_disk, key, value)
+
+        elif self.backend == "database":
+            await self.supabase.table("response_cache")\
+                .upsert({
+                    "key": key,
+                    "value": value,
+                    "expires_at": (datetime.utcnow() + timedelta(seconds=self.ttl)).isoformat(),
+                }, on_conflict="key")\
+                .execute()
+
+    def _read_disk(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        if not path.exists():
+            return None
+        entry = json.loads(path.read_text(encoding="utf-8"))
+        if entry["expires_at"] < time.time():
+            path.unlink(missing_ok=True)
+            return None
+        return entry["value"]
+
+    def _write_disk(self, key: str, value: Dict[str, Any]):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps({"expires_at": time.time() + self.ttl, "value": value}), encoding="utf-8")
+        tmp_path.replace(path)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit-rate metrics"""
+        lookups = self._stats["hits"] + self._stats["persistent_hits"] + self._stats["misses"]
+        hits = self._stats["hits"] + self._stats["persistent_hits"]
+        return {
+            "backend": self.backend,
+            "memory": self._memory.stats(),
+            **self._stats,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# Singleton instance
+response_cache = ResponseCache()
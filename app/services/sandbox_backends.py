@@ -0,0 +1,450 @@
+"""
+Sandbox execution backends: E2B cloud sandboxes or local rlimited processes
+"""
+from typing import Any, Dict, List, Optional
+from app.config import settings
+import asyncio
+import os
+import shlex
+import shutil
+import signal
+import socket
+import uuid
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+class SandboxBackend:
+    """Interface the sandbox service drives.
+
+    A backend owns the running environments, identified by the ``backend_id``
+    it returns from ``create`` (stored as ``sandboxes.e2b_sandbox_id``). File
+    maps are project-relative path -> content, with ``None`` meaning delete.
+    """
+
+    name = "base"
+    # Environments die with the worker process that created them
+    ephemeral = False
+
+    async def create(self, sandbox_id: str) -> str:
+        """Provision an environment and return its backend id"""
+        raise NotImplementedError
+
+    async def write_files(self, backend_id: str, files: Dict[str, Optional[str]]):
+        raise NotImplementedError
+
+    async def read_file(self, backend_id: str, path: str) -> str:
+        raise NotImplementedError
+
+    async def list_files(self, backend_id: str) -> Dict[str, Dict[str, Any]]:
+        """Every file in the project directory (dependencies included): path -> {size, mtime}"""
+        raise NotImplementedError
+
+    async def read_bytes(self, backend_id: str, paths: List[str]) -> Dict[str, bytes]:
+        raise NotImplementedError
+
+    async def write_bytes(self, backend_id: str, files: Dict[str, bytes],
+                          mtimes: Optional[Dict[str, Any]] = None):
+        """Write raw files, restoring their ``list_files`` mtimes where the backend can"""
+        raise NotImplementedError
+
+    async def run(self, backend_id: str, command: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Run a command in the project directory; returns exit_code, stdout, stderr"""
+        raise NotImplementedError
+
+    async def start_preview(self, backend_id: str) -> str:
+        """Start the dev server if it isn't running and return its URL"""
+        raise NotImplementedError
+
+    async def is_ready(self, backend_id: str) -> bool:
+        """Whether the dev server is accepting connections"""
+        raise NotImplementedError
+
+    async def wait_ready(self, backend_id: str, timeout: Optional[float] = None) -> bool:
+        timeout = settings.sandbox_ready_timeout_seconds if timeout is None else timeout
+        deadline = asyncio.get_running_loop().time() + timeout
+        while True:
+            if await self.is_ready(backend_id):
+                return True
+            if asyncio.get_running_loop().time() >= deadline:
+                return False
+            await asyncio.sleep(0.1)
+
+    async def stop(self, backend_id: str):
+        """Tear the environment down, discarding its state"""
+        raise NotImplementedError
+
+    def running(self) -> List[str]:
+        """Ids of environments this worker holds"""
+        return []
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name}
+
+
+def _safe_join(root: str, path: str) -> str:
+    """Resolve a project-relative path inside ``root`` or raise ValueError"""
+    full = os.path.realpath(os.path.join(root, path.lstrip("/")))
+    if os.path.commonpath([full, os.path.realpath(root)]) != os.path.realpath(root):
+        raise ValueError(f"Path escapes the sandbox: {path!r}")
+    return full
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class LocalProcessBackend(SandboxBackend):
+    """Sandboxes as working directories on this machine.
+
+    Each sandbox is a directory under ``sandbox_root_dir``; commands and the dev
+    server run there as child processes in their own session, with CPU time,
+    address space and file size capped by rlimits. It is not an isolation
+    boundary (processes share the host user and network), but it exercises the
+    full sandbox lifecycle on one Linux box for development and load testing.
+    Processes live in this worker, so ids are only valid in the process that
+    created them.
+    """
+
+    name = "local"
+    ephemeral = True
+
+    def __init__(self, root_dir: str, cpu_seconds: int, memory_mb: int, file_size_mb: int, start_command: str):
+        self.root_dir = os.path.abspath(root_dir)
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.file_size_mb = file_size_mb
+        self.start_command = start_command
+        # backend_id -> {"workdir", "port", "process"}
+        self._sandboxes: Dict[str, Dict[str, Any]] = {}
+        self._stats = {"created": 0, "stopped": 0, "commands": 0, "files_written": 0}
+
+    def _limits(self):
+        """Applied in the child between fork and exec"""
+        os.setsid()
+        if resource is None:
+            return
+        resource.setrlimit(resource.RLIMIT_CPU, (self.cpu_seconds, self.cpu_seconds))
+        memory = self.memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+        file_size = self.file_size_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_FSIZE, (file_size, file_size))
+
+    def _get(self, backend_id: str) -> Dict[str, Any]:
+        sandbox = self._sandboxes.get(backend_id)
+        if sandbox is None:
+            raise LookupError(f"Sandbox {backend_id} is not running on this node")
+        return sandbox
+
+    def running(self) -> List[str]:
+        return list(self._sandboxes)
+
+    def workdir(self, backend_id: str) -> str:
+        return self._get(backend_id)["workdir"]
+
+    async def create(self, sandbox_id: str) -> str:
+        backend_id = f"local_{uuid.uuid4().hex[:12]}"
+        workdir = os.path.join(self.root_dir, backend_id)
+        await asyncio.to_thread(os.makedirs, workdir, exist_ok=True)
+        self._sandboxes[backend_id] = {"workdir": workdir, "port": None, "process": None}
+        self._stats["created"] += 1
+        return backend_id
+
+    async def write_files(self, backend_id: str, files: Dict[str, Optional[str]]):
+        workdir = self.workdir(backend_id)
+        targets = {_safe_join(workdir, path): content for path, content in files.items()}
+        await asyncio.to_thread(self._write_files, targets)
+        self._stats["files_written"] += len(files)
+
+    @staticmethod
+    def _write_files(targets: Dict[str, Optional[str]]):
+        for full, content in targets.items():
+            if content is None:
+                if os.path.isdir(full):
+                    shutil.rmtree(full, ignore_errors=True)
+                elif os.path.exists(full):
+                    os.remove(full)
+                continue
+            os.makedirs(os.path.dirname(full), exist_ok=True)
+            # Write then rename so the dev server never reads a half-written file
+            temp = f"{full}.tmp-{os.getpid()}"
+            with open(temp, "w", encoding="utf-8") as handle:
+                handle.write(content)
+            os.replace(temp, full)
+
+    async def read_file(self, backend_id: str, path: str) -> str:
+        full = _safe_join(self.workdir(backend_id), path)
+
+        def read() -> str:
+            with open(full, "r", encoding="utf-8") as handle:
+                return handle.read()
+
+        return await asyncio.to_thread(read)
+
+    async def list_files(self, backend_id: str) -> Dict[str, Dict[str, Any]]:
+        workdir = self.workdir(backend_id)
+
+        def scan() -> Dict[str, Dict[str, Any]]:
+            files = {}
+            for directory, _, names in os.walk(workdir):
+                for name in names:
+                    full = os.path.join(directory, name)
+                    if os.path.islink(full) or ".tmp-" in name:
+                        continue
+                    info = os.stat(full)
+                    files[os.path.relpath(full, workdir)] = {"size": info.st_size, "mtime": info.st_mtime_ns}
+            return files
+
+        return await asyncio.to_thread(scan)
+
+    async def read_bytes(self, backend_id: str, paths: List[str]) -> Dict[str, bytes]:
+        workdir = self.workdir(backend_id)
+
+        def read() -> Dict[str, bytes]:
+            contents = {}
+            for path in paths:
+                with open(_safe_join(workdir, path), "rb") as handle:
+                    contents[path] = handle.read()
+            return contents
+
+        return await asyncio.to_thread(read)
+
+    async def write_bytes(self, backend_id: str, files: Dict[str, bytes],
+                          mtimes: Optional[Dict[str, Any]] = None):
+        workdir = self.workdir(backend_id)
+        mtimes = mtimes or {}
+
+        def write():
+            for path, content in files.items():
+                full = _safe_join(workdir, path)
+                os.makedirs(os.path.dirname(full), exist_ok=True)
+                temp = f"{full}.tmp-{os.getpid()}"
+                with open(temp, "wb") as handle:
+                    handle.write(content)
+                if isinstance(mtimes.get(path), int):
+                    os.utime(temp, ns=(mtimes[path], mtimes[path]))
+                os.replace(temp, full)
+
+        await asyncio.to_thread(write)
+        self._stats["files_written"] += len(files)
+
+    async def run(self, backend_id: str, command: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        timeout = settings.sandbox_command_timeout_seconds if timeout is None else timeout
+        process = await asyncio.create_subprocess_shell(
+            command,
+            cwd=self.workdir(backend_id),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            preexec_fn=self._limits,
+        )
+        self._stats["commands"] += 1
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=timeout)
+        except asyncio.TimeoutError:
+            self._kill(process)
+            await process.wait()
+            return {"exit_code": None, "stdout": "", "stderr": f"Timed out after {timeout}s"}
+        return {
+            "exit_code": process.returncode,
+            "stdout": stdout.decode("utf-8", errors="replace"),
+            "stderr": stderr.decode("utf-8", errors="replace"),
+        }
+
+    async def start_preview(self, backend_id: str) -> str:
+        sandbox = self._get(backend_id)
+        process = sandbox["process"]
+        if process is None or process.returncode is not None:
+            sandbox["port"] = _free_port()
+            sandbox["process"] = await asyncio.create_subprocess_shell(
+                self.start_command.format(port=sandbox["port"]),
+                cwd=sandbox["workdir"],
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL,
+                preexec_fn=self._limits,
+            )
+        return f"http://127.0.0.1:{sandbox['port']}"
+
+    async def is_ready(self, backend_id: str) -> bool:
+        sandbox = self._sandboxes.get(backend_id)
+        if sandbox is None or sandbox["process"] is None or sandbox["process"].returncode is not None:
+            return False
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", sandbox["port"])
+        except OSError:
+            return False
+        writer.close()
+        return True
+
+    @staticmethod
+    def _kill(process: asyncio.subprocess.Process):
+        # The child leads its own session, so this also reaps whatever it spawned
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    async def stop(self, backend_id: str):
+        sandbox = self._sandboxes.pop(backend_id, None)
+        if sandbox is None:
+            return
+        process = sandbox["process"]
+        if process is not None and process.returncode is None:
+            self._kill(process)
+            await process.wait()
+        await asyncio.to_thread(shutil.rmtree, sandbox["workdir"], True)
+        self._stats["stopped"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "running": len(self._sandboxes), **self._stats}
+
+
+def _mtime_ns(stamp: str) -> int:
+    """``find -printf %T@`` seconds (``1700000000.1234567890``) as integer nanoseconds"""
+    seconds, _, fraction = stamp.partition(".")
+    return int(seconds) * 1_000_000_000 + int((fraction + "000000000")[:9])
+
+
+class E2BBackend(SandboxBackend):
+    """Sandboxes on E2B, started from the Expo template.
+
+    Requires the optional ``e2b`` package. Connections are cached per worker
+    and re-established by id, so any worker can drive any sandbox. The files
+    API can't set mtimes, so ``write_bytes`` restores them with batched
+    ``touch`` commands; without that every restored file would look changed
+    and the next snapshot would re-read the whole tree.
+    """
+
+    name = "e2b"
+    # Paths per touch command when restoring mtimes
+    touch_batch_size = 200
+
+    def __init__(self, api_key: str, template: str, start_command: str, port: int):
+        try:
+            from e2b import AsyncSandbox
+        except ImportError:
+            raise RuntimeError("The e2b sandbox backend requires the e2b package: pip install e2b")
+        self._sandbox_class = AsyncSandbox
+        self.api_key = api_key
+        self.template = template
+        self.start_command = start_command
+        self.port = port
+        self._sandboxes: Dict[str, Any] = {}
+        self._stats = {"created": 0, "stopped": 0, "commands": 0, "files_written": 0}
+
+    async def _get(self, backend_id: str):
+        sandbox = self._sandboxes.get(backend_id)
+        if sandbox is None:
+            sandbox = await self._sandbox_class.connect(backend_id, api_key=self.api_key)
+            self._sandboxes[backend_id] = sandbox
+        return sandbox
+
+    async def create(self, sandbox_id: str) -> str:
+        sandbox = await self._sandbox_class.create(
+            template=self.template,
+            api_key=self.api_key,
+            metadata={"sandbox_id": sandbox_id},
+        )
+        self._sandboxes[sandbox.sandbox_id] = sandbox
+        self._stats["created"] += 1
+        return sandbox.sandbox_id
+
+    async def write_files(self, backend_id: str, files: Dict[str, Optional[str]]):
+        sandbox = await self._get(backend_id)
+        writes = [{"path": path, "data": content} for path, content in files.items() if content is not None]
+        if writes:
+            await sandbox.files.write(writes)
+        for path, content in files.items():
+            if content is None:
+                await sandbox.files.remove(path)
+        self._stats["files_written"] += len(files)
+
+    async def read_file(self, backend_id: str, path: str) -> str:
+        sandbox = await self._get(backend_id)
+        return await sandbox.files.read(path)
+
+    async def list_files(self, backend_id: str) -> Dict[str, Dict[str, Any]]:
+        result = await self.run(backend_id, "find . -type f -printf '%s %T@ %P\\n'")
+        files = {}
+        for line in result["stdout"].splitlines():
+            size, mtime, path = line.split(" ", 2)
+            files[path] = {"size": int(size), "mtime": _mtime_ns(mtime)}
+        return files
+
+    async def read_bytes(self, backend_id: str, paths: List[str]) -> Dict[str, bytes]:
+        sandbox = await self._get(backend_id)
+        contents = await asyncio.gather(*(sandbox.files.read(path, format="bytes") for path in paths))
+        return {path: bytes(content) for path, content in zip(paths, contents)}
+
+    async def write_bytes(self, backend_id: str, files: Dict[str, bytes],
+                          mtimes: Optional[Dict[str, Any]] = None):
+        sandbox = await self._get(backend_id)
+        if files:
+            await sandbox.files.write([{"path": path, "data": content} for path, content in files.items()])
+        self._stats["files_written"] += len(files)
+
+        touches = [
+            f"touch -m -d @{mtimes[path] // 1_000_000_000}.{mtimes[path] % 1_000_000_000:09d} -- {shlex.quote(path)}"
+            for path in files
+            if isinstance((mtimes or {}).get(path), int)
+        ]
+        for start in range(0, len(touches), self.touch_batch_size):
+            await self.run(backend_id, "; ".join(touches[start:start + self.touch_batch_size]))
+
+    async def run(self, backend_id: str, command: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        sandbox = await self._get(backend_id)
+        timeout = settings.sandbox_command_timeout_seconds if timeout is None else timeout
+        self._stats["commands"] += 1
+        try:
+            result = await sandbox.commands.run(command, timeout=timeout)
+        except Exception as e:
+            # Non-zero exits raise, carrying the same fields
+            result = e
+        return {
+            "exit_code": getattr(result, "exit_code", None),
+            "stdout": getattr(result, "stdout", ""),
+            "stderr": getattr(result, "stderr", str(result)),
+        }
+
+    async def start_preview(self, backend_id: str) -> str:
+        sandbox = await self._get(backend_id)
+        if not await self.is_ready(backend_id):
+            await sandbox.commands.run(self.start_command.format(port=self.port), background=True)
+        return f"https://{sandbox.get_host(self.port)}"
+
+    async def is_ready(self, backend_id: str) -> bool:
+        result = await self.run(backend_id, f"curl -s -o /dev/null http://localhost:{self.port}", timeout=5)
+        return result["exit_code"] == 0
+
+    async def stop(self, backend_id: str):
+        sandbox = self._sandboxes.pop(backend_id, None)
+        if sandbox is None:
+            await self._sandbox_class.kill(backend_id, api_key=self.api_key)
+        else:
+            await sandbox.kill()
+        self._stats["stopped"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "connected": len(self._sandboxes), **self._stats}
+
+
+def get_backend() -> SandboxBackend:
+    """Backend selected by ``settings.sandbox_backend``"""
+    if settings.sandbox_backend == "e2b":
+        return E2BBackend(
+            api_key=settings.e2b_api_key,
+            template=settings.e2b_template,
+            start_command=settings.e2b_start_command,
+            port=settings.e2b_preview_port,
+        )
+    return LocalProcessBackend(
+        root_dir=settings.sandbox_root_dir,
+        cpu_seconds=settings.sandbox_cpu_seconds,
+        memory_mb=settings.sandbox_memory_mb,
+        file_size_mb=settings.sandbox_file_size_mb,
+        start_command=settings.local_sandbox_start_command,
+    )
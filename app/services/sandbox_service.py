@@ -1,24 +1,435 @@
 """
 E2B Sandbox management service
 """
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Awaitable, Callable, List, Set
+from collections import deque
+from datetime import datetime, timezone
+from app.config import settings
 from app.database import get_supabase
+from app.metrics import LatencyRecorder, LatencyHistogram
+from app.services.event_bus import event_bus
+from app.services.file_store import file_store, blob_hash, DIRECTORY, EXPO_TEMPLATE
+from app.services.sandbox_backends import SandboxBackend, get_backend
+from app.services.snapshot_store import snapshot_store
+import asyncio
+import logging
+import math
+import time
 import uuid
 
+logger = logging.getLogger(__name__)
+
+
+def _seconds_since(timestamp: Any) -> float:
+    """Seconds since a database timestamp (UTC); 0 if it can't be parsed"""
+    try:
+        moment = datetime.fromisoformat(str(timestamp).replace("Z", "+00:00"))
+    except ValueError:
+        return 0.0
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return (datetime.utcnow() - moment).total_seconds()
+
+
+class SandboxPool:
+    """Pre-warmed sandboxes with the Expo template installed and its preview running.
+
+    Claiming one replaces provisioning plus dev-server start-up with a sync of
+    the files the project changed relative to the template. A background loop
+    keeps ``target()`` sandboxes ready: ``min_size`` plus enough to cover the
+    claims expected (at the recent claim rate) while replacements warm up,
+    capped at ``max_size``. When demand drops, the oldest extras are retired.
+    The pool is per worker, like the local backend's processes.
+    """
+
+    def __init__(self, backend: SandboxBackend, min_size: int, max_size: int, demand_window: float,
+                 warm_concurrency: int, check_interval: float):
+        self.backend = backend
+        self.min_size = min_size
+        self.max_size = max(min_size, max_size)
+        self.demand_window = demand_window
+        self.warm_concurrency = max(1, warm_concurrency)
+        self.check_interval = check_interval
+        self._ready: deque = deque()
+        self._warming = 0
+        self._claims: deque = deque()
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._warm_tasks: Set[asyncio.Task] = set()
+        self.claim_latency = LatencyRecorder()
+        self.cold_latency = LatencyRecorder()
+        self.warm_latency = LatencyRecorder()
+        self._stats = {"hits": 0, "misses": 0, "warmed": 0, "warm_failures": 0, "retired": 0}
+
+    def target(self) -> int:
+        now = time.monotonic()
+        while self._claims and now - self._claims[0] > self.demand_window:
+            self._claims.popleft()
+        rate = len(self._claims) / self.demand_window
+        warm_seconds = self.warm_latency.total_ms / self.warm_latency.count / 1000 if self.warm_latency.count else 10.0
+        # Twice the claims expected while a replacement warms up, on top of the floor
+        return min(self.max_size, self.min_size + math.ceil(rate * warm_seconds * 2))
+
+    def start(self):
+        if self._task is None and self.max_size > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        tasks = [task for task in [self._task, *self._warm_tasks] if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        while self._ready:
+            await self._retire(self._ready.popleft())
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """A warm sandbox, or None if the pool is empty"""
+        self._claims.append(time.monotonic())
+        self._wake.set()
+        if not self._ready:
+            self._stats["misses"] += 1
+            return None
+        self._stats["hits"] += 1
+        return self._ready.popleft()
+
+    async def _run(self):
+        while True:
+            self._fill()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.check_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            # Shrink slowly: retire one extra per pass once demand has fallen
+            if len(self._ready) > self.target():
+                await self._retire(self._ready.popleft())
+
+    def _fill(self):
+        deficit = self.target() - len(self._ready) - self._warming
+        for _ in range(max(0, min(deficit, self.warm_concurrency - self._warming))):
+            self._warming += 1
+            task = asyncio.create_task(self._warm())
+            self._warm_tasks.add(task)
+            task.add_done_callback(self._warm_tasks.discard)
+
+    async def _warm(self):
+        started = time.perf_counter()
+        try:
+            e2b_sandbox_id = await self.backend.create("pool")
+            try:
+                await self.backend.write_files(e2b_sandbox_id, EXPO_TEMPLATE)
+                preview_url = await self.backend.start_preview(e2b_sandbox_id)
+                if not await self.backend.wait_ready(e2b_sandbox_id):
+                    raise RuntimeError("preview did not become ready")
+            except BaseException:
+                await self.backend.stop(e2b_sandbox_id)
+                raise
+            self._ready.append({"e2b_sandbox_id": e2b_sandbox_id, "preview_url": preview_url})
+            self._stats["warmed"] += 1
+            self.warm_latency.record((time.perf_counter() - started) * 1000)
+            # Keep filling if we're still short
+            self._wake.set()
+        except Exception as e:
+            # Retried on the next pass rather than immediately
+            logger.warning("Failed to warm pool sandbox: %s", e)
+            self._stats["warm_failures"] += 1
+        finally:
+            self._warming -= 1
+
+    async def _retire(self, entry: Dict[str, Any]):
+        try:
+            await self.backend.stop(entry["e2b_sandbox_id"])
+        except Exception as e:
+            logger.warning("Failed to stop pool sandbox %s: %s", entry["e2b_sandbox_id"], e)
+        self._stats["retired"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool size, hit rate and claim latency"""
+        claims = self._stats["hits"] + self._stats["misses"]
+        return {
+            "ready": len(self._ready),
+            "warming": self._warming,
+            "target": self.target(),
+            "hit_rate": round(self._stats["hits"] / claims, 3) if claims else 0.0,
+            **self._stats,
+            "claim_latency": self.claim_latency.stats(),
+            "cold_latency": self.cold_latency.stats(),
+            "warm_latency": self.warm_latency.stats(),
+        }
+
+
+class SandboxSyncQueue:
+    """Per-project queue of file changes bound for the project's sandbox.
+
+    Writes are coalesced per path (the last one wins and moves to the end, so
+    a batch applied in order gives the same result as the writes one by one)
+    and sent as one batch once the project has been quiet for ``debounce``
+    seconds, ``max_delay`` after the first pending change, or as soon as
+    ``max_batch`` paths are waiting. A project has at most one batch in flight,
+    so batches land in the order they were queued. Files whose content hash
+    matches what was last delivered are dropped from the batch.
+
+    ``send(project_id, files)`` delivers a batch and returns whether the
+    sandbox received it; when it didn't (no running sandbox), the delivered
+    hashes are forgotten since the next sandbox starts from the store.
+    """
+
+    def __init__(self, send: Callable[[str, Dict[str, Optional[str]]], Awaitable[bool]], debounce: float,
+                 max_delay: float, max_batch: int):
+        self._send = send
+        self.debounce = debounce
+        self.max_delay = max(debounce, max_delay)
+        self.max_batch = max(1, max_batch)
+        self._projects: Dict[str, Dict[str, Any]] = {}
+        self.send_latency = LatencyRecorder()
+        self._stats = {"queued": 0, "coalesced": 0, "unchanged": 0, "batches": 0, "files_sent": 0, "failures": 0}
+
+    def _state(self, project_id: str) -> Dict[str, Any]:
+        state = self._projects.get(project_id)
+        if state is None:
+            state = {"pending": {}, "sent": {}, "first": 0.0, "last": 0.0, "flush": False,
+                     "wake": asyncio.Event(), "task": None}
+            self._projects[project_id] = state
+        return state
+
+    def enqueue(self, project_id: str, files: Dict[str, Optional[str]]):
+        """Queue changes (path -> content, None to delete) for the project's sandbox"""
+        if not files:
+            return
+        state = self._state(project_id)
+        now = time.monotonic()
+        if not state["pending"]:
+            state["first"] = now
+        state["last"] = now
+        for path, content in files.items():
+            if path in state["pending"]:
+                del state["pending"][path]
+                self._stats["coalesced"] += 1
+            state["pending"][path] = content
+        self._stats["queued"] += len(files)
+
+        if state["task"] is None:
+            state["task"] = asyncio.create_task(self._run(project_id, state))
+        state["wake"].set()
+
+    async def flush(self, project_id: str):
+        """Send the project's pending changes now and wait until they're delivered"""
+        state = self._projects.get(project_id)
+        if state is None or state["task"] is None:
+            return
+        state["flush"] = True
+        state["wake"].set()
+        await asyncio.shield(state["task"])
+
+    def reset(self, project_id: str):
+        """Forget what was delivered, e.g. when the project gets a new sandbox"""
+        state = self._projects.get(project_id)
+        if state is None:
+            return
+        state["sent"].clear()
+        if state["task"] is None:
+            del self._projects[project_id]
+
+    async def stop(self):
+        """Deliver everything still pending"""
+        await asyncio.gather(*(self.flush(project_id) for project_id in list(self._projects)),
+                             return_exceptions=True)
+
+    async def _run(self, project_id: str, state: Dict[str, Any]):
+        try:
+            while state["pending"]:
+                while not state["flush"] and len(state["pending"]) < self.max_batch:
+                    now = time.monotonic()
+                    deadline = min(state["last"] + self.debounce, state["first"] + self.max_delay)
+                    if now >= deadline:
+                        break
+                    state["wake"].clear()
+                    try:
+                        await asyncio.wait_for(state["wake"].wait(), timeout=deadline - now)
+                    except asyncio.TimeoutError:
+                        pass
+                batch, state["pending"] = state["pending"], {}
+                await self._deliver(project_id, state, batch)
+        finally:
+            state["task"] = None
+            state["flush"] = False
+
+    async def _deliver(self, project_id: str, state: Dict[str, Any], batch: Dict[str, Optional[str]]):
+        hashes = {path: None if content is None else blob_hash(content) for path, content in batch.items()}
+        changed = {
+            path: content for path, content in batch.items()
+            if path not in state["sent"] or state["sent"][path] != hashes[path]
+        }
+        self._stats["unchanged"] += len(batch) - len(changed)
+        if not changed:
+            return
+
+        started = time.perf_counter()
+        try:
+            delivered = await self._send(project_id, changed)
+        except Exception as e:
+            # The store has the changes; the sandbox catches up when it's next started
+            logger.warning("Failed to sync %d files to the sandbox of project %s: %s", len(changed), project_id, e)
+            self._stats["failures"] += 1
+            delivered = False
+        self.send_latency.record((time.perf_counter() - started) * 1000)
+
+        if delivered:
+            state["sent"].update({path: hashes[path] for path in changed})
+            self._stats["batches"] += 1
+            self._stats["files_sent"] += len(changed)
+        else:
+            state["sent"].clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, coalescing and batch counters"""
+        return {
+            "pending_files": sum(len(state["pending"]) for state in self._projects.values()),
+            "projects": len(self._projects),
+            **self._stats,
+            "send_latency": self.send_latency.stats(),
+        }
+
 
 class SandboxService:
-    """Service for managing E2B sandboxes"""
+    """Service for managing E2B sandboxes.
+    
+    The project's files live in the file store; a sandbox is a running copy
+    of them on the configured backend (E2B, or local processes). Edits are
+    written to the store first and then queued for the project's sandbox,
+    which receives them in debounced batches while it's ready. New
+    sandboxes come from the warm pool when it has one.
+    
+    Sandboxes idle past their tier's window are snapshotted and stopped
+    ("hibernated"), as are the least recently active ones when this worker
+    would exceed ``sandbox_max_live``. The next create for the project
+    resumes from the snapshot instead of starting fresh.
+    """
     
     def __init__(self):
         self.supabase = get_supabase()
+        self.backend = get_backend()
+        self.pool = SandboxPool(
+            self.backend,
+            min_size=settings.sandbox_pool_min_size,
+            max_size=settings.sandbox_pool_max_size,
+            demand_window=settings.sandbox_pool_demand_window_seconds,
+            warm_concurrency=settings.sandbox_pool_warm_concurrency,
+            check_interval=settings.sandbox_pool_check_seconds,
+        )
+        self.sync = SandboxSyncQueue(
+            self._sync,
+            debounce=settings.sandbox_sync_debounce_seconds,
+            max_delay=settings.sandbox_sync_max_delay_seconds,
+            max_batch=settings.sandbox_sync_max_batch_files,
+        )
+        self._creating: Dict[str, asyncio.Task] = {}
+        self._background: Set[asyncio.Task] = set()
+        self.restore_latency = LatencyRecorder()
+        # Sandboxes this worker started: sandbox id -> backend id
+        self._live: Dict[str, str] = {}
+        self._last_access: Dict[str, float] = {}
+        self._last_touched: Dict[str, float] = {}
+        self._hibernating: Set[str] = set()
+        self._idle_seconds = {
+            "free": settings.sandbox_idle_seconds_free,
+            "pro": settings.sandbox_idle_seconds_pro,
+            "premium": settings.sandbox_idle_seconds_premium,
+        }
+        self._reaper: Optional[asyncio.Task] = None
+        self._hibernated_count = 0
+        self.resume_latency = LatencyHistogram()
+        self._lifecycle_stats = {"hibernations": 0, "evictions": 0, "resumes": 0, "snapshot_failures": 0}
+    
+    def start(self):
+        self.pool.start()
+        if self._reaper is None:
+            self._reaper = asyncio.create_task(self._reap_periodically())
+    
+    def prepare(self, project_id: str):
+        """Give a new project its sandbox in the background"""
+        task = asyncio.create_task(self._prepare(project_id))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+    
+    async def _prepare(self, project_id: str):
+        try:
+            await self.create_sandbox(project_id)
+        except Exception as e:
+            logger.warning("Failed to prepare sandbox for project %s: %s", project_id, e)
     
     async def create_sandbox(self, project_id: str) -> Dict[str, Any]:
-        """Create a new E2B sandbox for a project"""
-        # In production, this would use the E2B SDK
-        # For now, create a mock sandbox entry
+        """Create a new sandbox for a project and wait until its preview is up.
+        
+        Concurrent calls for the same project share one creation.
+        """
+        task = self._creating.get(project_id)
+        if task is None:
+            task = asyncio.ensure_future(self._create_sandbox(project_id))
+            self._creating[project_id] = task
+            task.add_done_callback(lambda _: self._creating.pop(project_id, None))
+        # Shielded: a caller going away must not abort a creation others wait on
+        return await asyncio.shield(task)
+    
+    async def _create_sandbox(self, project_id: str) -> Dict[str, Any]:
+        started = time.perf_counter()
+        await self._make_room()
         
+        previous = await self.get_sandbox(project_id)
+        if previous and previous.get("cache_id") and previous["status"] in ("hibernated", "stopped"):
+            sandbox = await self._restore(project_id, previous["cache_id"], resume_id=previous["id"])
+            if sandbox is not None:
+                self.resume_latency.record((time.perf_counter() - started) * 1000)
+                self._lifecycle_stats["resumes"] += 1
+                if previous["status"] == "hibernated":
+                    self._hibernated_count = max(0, self._hibernated_count - 1)
+                return sandbox
+        
+        warm = self.pool.claim()
+        if warm is not None:
+            sandbox = await self._adopt(project_id, warm)
+            if sandbox is not None:
+                self.pool.claim_latency.record((time.perf_counter() - started) * 1000)
+                return sandbox
+        
+        sandbox = await self._create_cold(project_id)
+        self.pool.cold_latency.record((time.perf_counter() - started) * 1000)
+        return sandbox
+    
+    async def _adopt(self, project_id: str, warm: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Turn a warm template sandbox into the project's, syncing only what differs"""
+        e2b_sandbox_id = warm["e2b_sandbox_id"]
+        try:
+            root = await file_store.get_root(project_id)
+            changes = await file_store.diff(await file_store.template_root(), root["root_hash"])
+            if changes:
+                await self.backend.write_files(e2b_sandbox_id, changes)
+        except Exception as e:
+            logger.warning("Failed to adopt pool sandbox %s: %s", e2b_sandbox_id, e)
+            await self.backend.stop(e2b_sandbox_id)
+            return None
+        
+        response = await self.supabase.table("sandboxes").insert({
+            "id": str(uuid.uuid4()),
+            "project_id": project_id,
+            "e2b_sandbox_id": e2b_sandbox_id,
+            "status": "ready",
+            "preview_url": warm["preview_url"],
+            "qr_code": self._generate_qr_code(warm["preview_url"]),
+            "cache_id": None,
+        }).execute()
+        
+        if not response.data:
+            await self.backend.stop(e2b_sandbox_id)
+            raise Exception("Failed to create sandbox")
+        self._started(response.data[0])
+        self._publish("sandbox.created", response.data[0])
+        return response.data[0]
+    
+    async def _create_cold(self, project_id: str) -> Dict[str, Any]:
         sandbox_id = str(uuid.uuid4())
-        e2b_sandbox_id = f"sb_{uuid.uuid4().hex[:8]}"
+        e2b_sandbox_id = await self.backend.create(sandbox_id)
         
         sandbox_data = {
             "id": sandbox_id,
@@ -30,34 +441,74 @@ class SandboxService:
             "cache_id": None,
         }
         
-        response = self.supabase.table("sandboxes").insert(sandbox_data).execute()
+        response = await self.supabase.table("sandboxes").insert(sandbox_data).execute()
         
         if response.data:
-            # Simulate sandbox initialization
-            await self._initialize_sandbox(sandbox_id, e2b_sandbox_id)
-            return response.data[0]
+            self._publish("sandbox.created", response.data[0])
+            sandbox = await self._initialize_sandbox(sandbox_id, e2b_sandbox_id, project_id)
+            if sandbox.get("status") == "ready":
+                self._started({**sandbox, "e2b_sandbox_id": e2b_sandbox_id})
+            return sandbox
         
+        await self.backend.stop(e2b_sandbox_id)
         raise Exception("Failed to create sandbox")
     
-    async def _initialize_sandbox(self, sandbox_id: str, e2b_sandbox_id: str):
-        """Initialize the sandbox with Expo template"""
-        # Simulate initialization process
-        import asyncio
-        await asyncio.sleep(1)  # Simulate setup time
-        
-        # Update sandbox status
-        preview_url = f"https://expo.dev/@preview/{e2b_sandbox_id}"
-        qr_code = self._generate_qr_code(preview_url)
-        
-        self.supabase.table("sandboxes")\
-            .update({
-                "status": "ready",
-                "preview_url": preview_url,
-                "qr_code": qr_code,
-                "last_active": "now()"
-            })\
+    async def _initialize_sandbox(self, sandbox_id: str, e2b_sandbox_id: str, project_id: str) -> Dict[str, Any]:
+        """Materialize the project's files and start the dev server"""
+        try:
+            files = await file_store.export_files(project_id)
+            await self.backend.write_files(e2b_sandbox_id, files)
+            preview_url = await self.backend.start_preview(e2b_sandbox_id)
+            ready = await self.backend.wait_ready(e2b_sandbox_id)
+        except Exception as e:
+            logger.error("Sandbox %s failed to initialize: %s", sandbox_id, e)
+            preview_url, ready = None, False
+        
+        update_data = {"status": "ready" if ready else "error", "last_active": "now()"}
+        if ready:
+            update_data["preview_url"] = preview_url
+            update_data["qr_code"] = self._generate_qr_code(preview_url)
+        
+        response = await self.supabase.table("sandboxes")\
+            .update(update_data)\
             .eq("id", sandbox_id)\
             .execute()
+        for sandbox in response.data:
+            self._publish("sandbox.updated", sandbox)
+        return response.data[0] if response.data else {"id": sandbox_id, **update_data}
+    
+    def _started(self, sandbox: Dict[str, Any]):
+        """Track a sandbox this worker started for the reaper and the live cap"""
+        self._live[sandbox["id"]] = sandbox["e2b_sandbox_id"]
+        self._last_access[sandbox["id"]] = time.monotonic()
+        # It was materialized from the store, not from what earlier sandboxes were sent
+        self.sync.reset(sandbox["project_id"])
+    
+    def _forget(self, sandbox_id: str):
+        self._live.pop(sandbox_id, None)
+        self._last_access.pop(sandbox_id, None)
+        self._last_touched.pop(sandbox_id, None)
+    
+    async def _touch(self, sandbox_id: str):
+        """Record an access; ``last_active`` is written at most every ``sandbox_touch_seconds``"""
+        now = time.monotonic()
+        self._last_access[sandbox_id] = now
+        if now - self._last_touched.get(sandbox_id, float("-inf")) < settings.sandbox_touch_seconds:
+            return
+        self._last_touched[sandbox_id] = now
+        await self.supabase.table("sandboxes")\
+            .update({"last_active": "now()"})\
+            .eq("id", sandbox_id)\
+            .execute()
+    
+    def _publish(self, event_type: str, sandbox: Dict[str, Any]):
+        """Push a sandbox state change to the project's event subscribers"""
+        event_bus.publish(sandbox.get("project_id"), event_type, {
+            "id": sandbox.get("id"),
+            "status": sandbox.get("status"),
+            "preview_url": sandbox.get("preview_url"),
+            "cache_id": sandbox.get("cache_id"),
+        })
     
     def _generate_qr_code(self, url: str) -> str:
         """Generate QR code for the preview URL"""
@@ -67,7 +518,7 @@ class SandboxService:
     
     async def get_sandbox(self, project_id: str) -> Optional[Dict[str, Any]]:
         """Get sandbox for a project"""
-        response = self.supabase.table("sandboxes")\
+        response = await self.supabase.table("sandboxes")\
             .select("*")\
             .eq("project_id", project_id)\
             .order("created_at", desc=True)\
@@ -76,24 +527,108 @@ class SandboxService:
         
         return response.data[0] if response.data else None
     
-    async def update_sandbox_files(self, sandbox_id: str, files: Dict[str, str]):
-        """Update files in the sandbox"""
-        # In production, this would sync files to E2B
-        # For now, just update the last_active timestamp
-        self.supabase.table("sandboxes")\
-            .update({"last_active": "now()"})\
+    async def update_sandbox_files(self, sandbox_id: str, files: Dict[str, Optional[str]]):
+        """Queue files (path -> content, None to delete) for a sandbox's project"""
+        response = await self.supabase.table("sandboxes")\
+            .select("project_id")\
             .eq("id", sandbox_id)\
             .execute()
+        if not response.data:
+            raise LookupError(f"Sandbox {sandbox_id} not found")
+        
+        self.sync.enqueue(response.data[0]["project_id"], files)
+        return {"message": "Files queued for sync"}
+    
+    async def _sync(self, project_id: str, files: Dict[str, Optional[str]]) -> bool:
+        """Deliver a batch from the sync queue to the project's sandbox; False if none is running"""
+        sandbox = await self.get_sandbox(project_id)
+        if not sandbox or sandbox["status"] != "ready":
+            # Not running; the files are materialized from the store when it starts
+            return False
         
-        return {"message": "Files updated successfully"}
+        try:
+            await self.backend.write_files(sandbox["e2b_sandbox_id"], files)
+        except LookupError:
+            if sandbox["id"] in self._live:
+                # This worker started it and has since lost it: the environment is gone
+                self._forget(sandbox["id"])
+                await self._set_status(sandbox["id"], "stopped")
+            # Otherwise another worker holds it; the files are in the store either way
+            return False
+        
+        await self._touch(sandbox["id"])
+        return True
+    
+    async def _set_status(self, sandbox_id: str, status: str):
+        response = await self.supabase.table("sandboxes")\
+            .update({"status": status})\
+            .eq("id", sandbox_id)\
+            .execute()
+        for sandbox in response.data:
+            self._publish("sandbox.updated", sandbox)
+    
+    async def _push(self, project_id: str, files: Dict[str, Optional[str]]):
+        """Queue stored changes for the project's sandbox"""
+        self.sync.enqueue(project_id, files)
+    
+    async def get_file(self, project_id: str, file_path: str) -> str:
+        """Content of one project file"""
+        return await file_store.read_file(project_id, file_path)
+    
+    async def update_file(self, project_id: str, file_path: str, content: str):
+        """Save one project file and push it to the sandbox"""
+        await file_store.write_file(project_id, file_path, content)
+        await self._push(project_id, {file_path: content})
+    
+    async def update_sandbox(self, project_id: str, tree: Dict[str, Any]):
+        """Merge a nested ``{name: {type, content | children}}`` tree into the project's files.
+        
+        Only files that differ from the store are written and pushed; files
+        not in the tree are left alone. Keys that aren't file or directory
+        nodes are ignored.
+        """
+        changes: Dict[str, Any] = {}
+        
+        def flatten(nodes: Dict[str, Any], prefix: str):
+            for name, node in nodes.items():
+                if not isinstance(node, dict) or node.get("type") not in ("file", "directory"):
+                    continue
+                path = f"{prefix}{name}"
+                if node["type"] == "file":
+                    changes[path] = node.get("content") or ""
+                elif node.get("children"):
+                    flatten(node["children"], f"{path}/")
+                else:
+                    changes[path] = DIRECTORY
+        
+        flatten(tree, "")
+        
+        current = await file_store.read_files(project_id, list(changes))
+        changes = {path: change for path, change in changes.items() if current.get(path) != change}
+        await file_store.write_files(project_id, changes)
+        
+        await self._push(project_id, {
+            path: change for path, change in changes.items() if change is not DIRECTORY
+        })
+    
+    async def run_command(self, project_id: str, command: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Run a shell command in the project's sandbox, after its queued file changes"""
+        await self.sync.flush(project_id)
+        sandbox = await self.get_sandbox(project_id)
+        if not sandbox or sandbox["status"] != "ready":
+            sandbox = await self.create_sandbox(project_id)
+        await self._touch(sandbox["id"])
+        return await self.backend.run(sandbox["e2b_sandbox_id"], command, timeout=timeout)
     
     async def get_preview_info(self, project_id: str) -> Dict[str, Any]:
         """Get preview information for a project"""
         sandbox = await self.get_sandbox(project_id)
         
-        if not sandbox:
-            # Create sandbox if it doesn't exist
+        if not sandbox or sandbox["status"] in ("stopped", "error", "hibernated"):
+            # Create (or resume) the sandbox if it doesn't exist or isn't running
             sandbox = await self.create_sandbox(project_id)
+        elif sandbox["status"] == "ready":
+            await self._touch(sandbox["id"])
         
         return {
             "status": sandbox["status"],
@@ -102,23 +637,266 @@ class SandboxService:
         }
     
     async def cache_sandbox_state(self, sandbox_id: str) -> str:
-        """Cache the current sandbox state"""
-        cache_id = f"cache_{uuid.uuid4().hex[:8]}"
+        """Snapshot a running sandbox's files; returns the snapshot id.
+        
+        Snapshots are incremental against the sandbox's previous one, so only
+        files changed since then are read and stored.
+        """
+        response = await self.supabase.table("sandboxes")\
+            .select("*")\
+            .eq("id", sandbox_id)\
+            .execute()
+        if not response.data:
+            raise LookupError(f"Sandbox {sandbox_id} not found")
+        sandbox = response.data[0]
+        if sandbox["status"] != "ready":
+            raise ValueError(f"Sandbox {sandbox_id} is not running")
+        
+        await self.sync.flush(sandbox["project_id"])
+        root = await file_store.get_root(sandbox["project_id"])
+        cache_id = await snapshot_store.snapshot(
+            self.backend,
+            sandbox["e2b_sandbox_id"],
+            parent_id=sandbox.get("cache_id"),
+            root_hash=root["root_hash"],
+        )
         
-        # In production, this would snapshot the E2B sandbox
-        self.supabase.table("sandboxes")\
+        response = await self.supabase.table("sandboxes")\
             .update({"cache_id": cache_id})\
             .eq("id", sandbox_id)\
             .execute()
+        for sandbox in response.data:
+            self._publish("sandbox.updated", sandbox)
         
         return cache_id
     
     async def restore_sandbox(self, project_id: str, cache_id: str) -> Dict[str, Any]:
-        """Restore sandbox from cached state"""
-        # In production, this would restore from E2B cache
-        # For now, just create a new sandbox
-        return await self.create_sandbox(project_id)
+        """Start a sandbox from a snapshot, falling back to a fresh one if it can't be used"""
+        await self._make_room()
+        sandbox = await self._restore(project_id, cache_id)
+        if sandbox is None:
+            return await self.create_sandbox(project_id)
+        return sandbox
+    
+    async def _restore(self, project_id: str, cache_id: str,
+                       resume_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Write a snapshot into a sandbox, then bring its sources up to date with the store.
+        
+        A warm pool sandbox is used when available; its template files that
+        match the snapshot aren't rewritten and its preview is already up.
+        With ``resume_id`` the existing (hibernated) row is brought back
+        instead of a new one being added.
+        """
+        started = time.perf_counter()
+        try:
+            manifest = await snapshot_store.load_manifest(cache_id)
+        except LookupError as e:
+            logger.warning("Cannot restore project %s: %s", project_id, e)
+            return None
+        
+        sandbox_id = resume_id or str(uuid.uuid4())
+        warm = self.pool.claim()
+        e2b_sandbox_id = warm["e2b_sandbox_id"] if warm else await self.backend.create(sandbox_id)
+        try:
+            skip = {path: blob_hash(content) for path, content in EXPO_TEMPLATE.items()} if warm else {}
+            await snapshot_store.restore(self.backend, e2b_sandbox_id, manifest, skip=skip)
+        
+            # Template files the project deleted, and edits made since the snapshot
+            changes: Dict[str, Optional[str]] = {path: None for path in skip if path not in manifest["files"]}
+            root = await file_store.get_root(project_id)
+            changes.update(await file_store.diff(manifest.get("root_hash"), root["root_hash"]))
+            if changes:
+                await self.backend.write_files(e2b_sandbox_id, changes)
+        
+            if warm:
+                preview_url, ready = warm["preview_url"], True
+            else:
+                preview_url = await self.backend.start_preview(e2b_sandbox_id)
+                ready = await self.backend.wait_ready(e2b_sandbox_id)
+        except Exception as e:
+            logger.warning("Failed to restore snapshot %s for project %s: %s", cache_id, project_id, e)
+            await self.backend.stop(e2b_sandbox_id)
+            return None
+        
+        sandbox_data = {
+            "e2b_sandbox_id": e2b_sandbox_id,
+            "status": "ready" if ready else "error",
+            "preview_url": preview_url if ready else None,
+            "qr_code": self._generate_qr_code(preview_url) if ready else None,
+            "cache_id": cache_id,
+            "last_active": "now()",
+        }
+        if resume_id:
+            response = await self.supabase.table("sandboxes")\
+                .update(sandbox_data)\
+                .eq("id", resume_id)\
+                .execute()
+        else:
+            response = await self.supabase.table("sandboxes")\
+                .insert({"id": sandbox_id, "project_id": project_id, **sandbox_data})\
+                .execute()
+        
+        if not response.data:
+            await self.backend.stop(e2b_sandbox_id)
+            raise Exception("Failed to create sandbox")
+        if ready:
+            self._started(response.data[0])
+        self._publish("sandbox.updated" if resume_id else "sandbox.created", response.data[0])
+        self.restore_latency.record((time.perf_counter() - started) * 1000)
+        return response.data[0]
+    
+    async def hibernate(self, sandbox: Dict[str, Any]):
+        """Snapshot a sandbox and stop it; the next create for its project resumes it.
+        
+        If the snapshot fails the sandbox is stopped anyway (its sources are
+        in the file store) and resumes from its previous snapshot, if any.
+        """
+        if sandbox["id"] in self._hibernating:
+            return
+        self._hibernating.add(sandbox["id"])
+        try:
+            try:
+                await self.cache_sandbox_state(sandbox["id"])
+                status = "hibernated"
+            except Exception as e:
+                logger.warning("Failed to snapshot sandbox %s: %s", sandbox["id"], e)
+                self._lifecycle_stats["snapshot_failures"] += 1
+                status = "stopped"
+            
+            self._forget(sandbox["id"])
+            try:
+                await self.backend.stop(sandbox["e2b_sandbox_id"])
+            except Exception as e:
+                logger.warning("Failed to stop sandbox %s: %s", sandbox["id"], e)
+            
+            response = await self.supabase.table("sandboxes")\
+                .update({"status": status, "preview_url": None, "qr_code": None})\
+                .eq("id", sandbox["id"])\
+                .execute()
+            for row in response.data:
+                self._publish("sandbox.updated", row)
+            self._lifecycle_stats["hibernations"] += 1
+            if status == "hibernated":
+                # Re-counted from the database on each reaper pass
+                self._hibernated_count += 1
+        finally:
+            self._hibernating.discard(sandbox["id"])
+    
+    async def _live_sandboxes(self) -> List[Dict[str, Any]]:
+        """Rows of this worker's running sandboxes, longest idle first, with ``idle_seconds``"""
+        if not self._live:
+            return []
+        response = await self.supabase.table("sandboxes")\
+            .select("*")\
+            .in_("id", list(self._live))\
+            .execute()
+        rows = {sandbox["id"]: sandbox for sandbox in response.data}
+        
+        now = time.monotonic()
+        live = []
+        for sandbox_id, e2b_sandbox_id in list(self._live.items()):
+            sandbox = rows.get(sandbox_id)
+            if sandbox is None or sandbox["status"] != "ready" or sandbox["e2b_sandbox_id"] != e2b_sandbox_id:
+                # Deleted, stopped or replaced elsewhere
+                self._forget(sandbox_id)
+                continue
+            # Accesses on this worker count even before last_active is written
+            local_idle = now - self._last_access.get(sandbox_id, float("-inf"))
+            sandbox["idle_seconds"] = min(_seconds_since(sandbox.get("last_active")), local_idle)
+            live.append(sandbox)
+        live.sort(key=lambda sandbox: sandbox["idle_seconds"], reverse=True)
+        return live
+    
+    async def _make_room(self):
+        """Hibernate the least recently active sandboxes so one more fits under the cap"""
+        excess = len(self._live) - settings.sandbox_max_live + 1
+        if excess <= 0:
+            return
+        for sandbox in (await self._live_sandboxes())[:excess]:
+            await self.hibernate(sandbox)
+            self._lifecycle_stats["evictions"] += 1
+    
+    async def _tiers(self, project_ids: List[str]) -> Dict[str, str]:
+        """Owner tier per project"""
+        projects = await self.supabase.table("projects")\
+            .select("id,user_id")\
+            .in_("id", list(set(project_ids)))\
+            .execute()
+        owners = {project["id"]: project["user_id"] for project in projects.data}
+        if not owners:
+            return {}
+        users = await self.supabase.table("users")\
+            .select("id,tier")\
+            .in_("id", list(set(owners.values())))\
+            .execute()
+        tiers = {user["id"]: user["tier"] for user in users.data}
+        return {project_id: tiers.get(user_id, "free") for project_id, user_id in owners.items()}
+    
+    async def reap(self):
+        """Hibernate sandboxes idle past their tier's window, then any over the cap"""
+        live = await self._live_sandboxes()
+        if live:
+            tiers = await self._tiers([sandbox["project_id"] for sandbox in live])
+            for sandbox in live:
+                window = self._idle_seconds.get(tiers.get(sandbox["project_id"]), self._idle_seconds["free"])
+                if sandbox["idle_seconds"] >= window:
+                    await self.hibernate(sandbox)
+            
+            live = [sandbox for sandbox in live if sandbox["id"] in self._live]
+            for sandbox in live[:max(0, len(live) - settings.sandbox_max_live)]:
+                await self.hibernate(sandbox)
+                self._lifecycle_stats["evictions"] += 1
+        
+        response = await self.supabase.table("sandboxes")\
+            .select("id", count="exact")\
+            .eq("status", "hibernated")\
+            .limit(1)\
+            .execute()
+        self._hibernated_count = response.count or 0
+    
+    async def _reap_periodically(self):
+        while True:
+            await asyncio.sleep(settings.sandbox_reaper_interval_seconds)
+            try:
+                await self.reap()
+            except Exception as e:
+                logger.warning("Sandbox reaper pass failed: %s", e)
+    
+    async def stop(self):
+        """Stop the pool and environments that can't outlive this worker"""
+        if self._reaper is not None:
+            self._reaper.cancel()
+            await asyncio.gather(self._reaper, return_exceptions=True)
+            self._reaper = None
+        await self.sync.stop()
+        await self.pool.stop()
+        if not self.backend.ephemeral:
+            return
+        for e2b_sandbox_id in self.backend.running():
+            await self.backend.stop(e2b_sandbox_id)
+            response = await self.supabase.table("sandboxes")\
+                .update({"status": "stopped"})\
+                .eq("e2b_sandbox_id", e2b_sandbox_id)\
+                .execute()
+            for sandbox in response.data:
+                self._publish("sandbox.updated", sandbox)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Backend, warm pool, sync queue, lifecycle and snapshot counters"""
+        return {
+            **self.backend.stats(),
+            "pool": self.pool.stats(),
+            "sync": self.sync.stats(),
+            "lifecycle": {
+                "live": len(self._live),
+                "max_live": settings.sandbox_max_live,
+                "hibernated": self._hibernated_count,
+                **self._lifecycle_stats,
+                "resume_latency": self.resume_latency.stats(),
+            },
+            "snapshots": {**snapshot_store.stats(), "restore_latency": self.restore_latency.stats()},
+        }
 
 
 # Singleton instance
-sandbox_service = SandboxService()
\ No newline at end of file
+sandbox_service = SandboxService()
@@ -0,0 +1,215 @@
+"""
+Content-addressed, incremental snapshots of sandbox file state
+"""
+from typing import Any, Dict, List, Optional
+from datetime import datetime
+from pathlib import Path
+from app.cache import TTLCache
+from app.config import settings
+from app.metrics import LatencyRecorder
+from app.services.sandbox_backends import SandboxBackend
+import asyncio
+import hashlib
+import json
+import time
+import zlib
+
+# Blobs read or written per backend call
+SNAPSHOT_BATCH_SIZE = 200
+
+
+class DiskObjectStorage:
+    """Objects as files under a directory, sharded by key prefix"""
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def _path(self, key: str) -> Path:
+        kind, name = key.split("/", 1)
+        return self.root / kind / name[:2] / name
+
+    async def exists(self, key: str) -> bool:
+        return await asyncio.to_thread(self._path(key).exists)
+
+    async def get(self, key: str) -> bytes:
+        return await asyncio.to_thread(self._path(key).read_bytes)
+
+    async def put(self, key: str, data: bytes):
+        await asyncio.to_thread(self._write, self._path(key), data)
+
+    @staticmethod
+    def _write(path: Path, data: bytes):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_bytes(data)
+        tmp_path.replace(path)
+
+
+class S3ObjectStorage:
+    """Objects in an S3-compatible bucket (requires the optional boto3 package)"""
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None):
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("The s3 snapshot storage requires boto3: pip install boto3")
+        self.bucket = bucket
+        self.prefix = prefix
+        self._client = boto3.client("s3", endpoint_url=endpoint_url or None)
+
+    async def exists(self, key: str) -> bool:
+        def head() -> bool:
+            try:
+                self._client.head_object(Bucket=self.bucket, Key=f"{self.prefix}{key}")
+                return True
+            except self._client.exceptions.ClientError:
+                return False
+
+        return await asyncio.to_thread(head)
+
+    async def get(self, key: str) -> bytes:
+        def read() -> bytes:
+            return self._client.get_object(Bucket=self.bucket, Key=f"{self.prefix}{key}")["Body"].read()
+
+        return await asyncio.to_thread(read)
+
+    async def put(self, key: str, data: bytes):
+        await asyncio.to_thread(self._client.put_object, Bucket=self.bucket, Key=f"{self.prefix}{key}", Body=data)
+
+
+def get_snapshot_storage():
+    """Storage selected by ``settings.snapshot_storage``: ``disk`` or ``s3``"""
+    if settings.snapshot_storage == "s3":
+        return S3ObjectStorage(
+            settings.snapshot_bucket, settings.snapshot_prefix, settings.snapshot_endpoint_url
+        )
+    return DiskObjectStorage(settings.snapshot_dir)
+
+
+class SnapshotStore:
+    """Sandbox snapshots as a manifest plus zlib-compressed, content-addressed blobs.
+
+    A snapshot covers everything in the sandbox's project directory, installed
+    dependencies included, so a restore skips the install step. Blobs are keyed
+    by the SHA-256 of their content (the same hash the file store uses), so a
+    blob is uploaded once no matter how many snapshots or projects contain it.
+    Snapshots are incremental: files whose size and mtime match the parent
+    snapshot reuse its hash without being read, and only blobs the storage
+    doesn't already hold are written. The manifest is keyed by its own hash,
+    which is the snapshot's ``cache_id``.
+    """
+
+    def __init__(self, storage=None):
+        self.storage = storage or get_snapshot_storage()
+        # Blobs known to be stored, to skip existence checks
+        self._known = TTLCache(maxsize=settings.snapshot_known_blobs, ttl=86400.0)
+        self._manifests = TTLCache(maxsize=256, ttl=3600.0)
+        self.snapshot_latency = LatencyRecorder()
+        self._stats = {"snapshots": 0, "files_hashed": 0, "files_reused": 0, "blobs_written": 0, "bytes_written": 0}
+
+    async def load_manifest(self, cache_id: str) -> Dict[str, Any]:
+        manifest = self._manifests.get(cache_id)
+        if manifest is None:
+            try:
+                data = await self.storage.get(f"manifests/{cache_id}")
+            except Exception as e:
+                raise LookupError(f"Snapshot {cache_id} not found") from e
+            manifest = json.loads(zlib.decompress(data))
+            self._manifests.set(cache_id, manifest)
+        return manifest
+
+    async def snapshot(self, backend: SandboxBackend, e2b_sandbox_id: str, parent_id: Optional[str] = None,
+                       root_hash: Optional[str] = None) -> str:
+        """Snapshot a sandbox's files; returns the snapshot id"""
+        started = time.perf_counter()
+        parent = None
+        if parent_id:
+            try:
+                parent = await self.load_manifest(parent_id)
+            except LookupError:
+                parent = None
+        parent_files = parent["files"] if parent else {}
+
+        listing = await backend.list_files(e2b_sandbox_id)
+        files: Dict[str, List[Any]] = {}
+        to_hash = []
+        for path, info in listing.items():
+            previous = parent_files.get(path)
+            if previous and previous[1] == info["size"] and previous[2] == info["mtime"]:
+                files[path] = previous
+                self._known.set(previous[0], True)
+            else:
+                to_hash.append(path)
+        self._stats["files_reused"] += len(files)
+
+        for start in range(0, len(to_hash), SNAPSHOT_BATCH_SIZE):
+            batch = to_hash[start:start + SNAPSHOT_BATCH_SIZE]
+            contents = await backend.read_bytes(e2b_sandbox_id, batch)
+            for path, content in contents.items():
+                hash_ = hashlib.sha256(content).hexdigest()
+                files[path] = [hash_, listing[path]["size"], listing[path]["mtime"]]
+                await self._put_blob(hash_, content)
+            self._stats["files_hashed"] += len(contents)
+
+        manifest = {
+            "parent": parent_id if parent else None,
+            "root_hash": root_hash,
+            "files": files,
+            "created_at": datetime.utcnow().isoformat(),
+        }
+        data = zlib.compress(json.dumps(manifest, sort_keys=True, separators=(",", ":")).encode("utf-8"), 6)
+        cache_id = hashlib.sha256(data).hexdigest()
+        await self.storage.put(f"manifests/{cache_id}", data)
+        self._manifests.set(cache_id, manifest)
+
+        self._stats["snapshots"] += 1
+        self.snapshot_latency.record((time.perf_counter() - started) * 1000)
+        return cache_id
+
+    async def _put_blob(self, hash_: str, content: bytes):
+        if self._known.get(hash_) or await self.storage.exists(f"blobs/{hash_}"):
+            self._known.set(hash_, True)
+            return
+        compressed = await asyncio.to_thread(zlib.compress, content, 6)
+        await self.storage.put(f"blobs/{hash_}", compressed)
+        self._known.set(hash_, True)
+        self._stats["blobs_written"] += 1
+        self._stats["bytes_written"] += len(compressed)
+
+    async def restore(self, backend: SandboxBackend, e2b_sandbox_id: str, manifest: Dict[str, Any],
+                      skip: Optional[Dict[str, str]] = None):
+        """Write a snapshot's files into a sandbox.
+
+        ``skip`` maps paths already present in the sandbox to their content
+        hash; those are left alone when the snapshot has the same content.
+        """
+        skip = skip or {}
+        wanted = [(path, entry[0]) for path, entry in manifest["files"].items() if skip.get(path) != entry[0]]
+
+        async def fetch(hash_: str) -> bytes:
+            data = await self.storage.get(f"blobs/{hash_}")
+            return await asyncio.to_thread(zlib.decompress, data)
+
+        for start in range(0, len(wanted), SNAPSHOT_BATCH_SIZE):
+            batch = wanted[start:start + SNAPSHOT_BATCH_SIZE]
+            unique = list(dict.fromkeys(hash_ for _, hash_ in batch))
+            blobs = dict(zip(unique, await asyncio.gather(*(fetch(hash_) for hash_ in unique))))
+            # Original mtimes keep the next snapshot incremental against this one
+            await backend.write_bytes(
+                e2b_sandbox_id,
+                {path: blobs[hash_] for path, hash_ in batch},
+                mtimes={path: manifest["files"][path][2] for path, _ in batch},
+            )
+            for hash_ in unique:
+                self._known.set(hash_, True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot counters and latency"""
+        return {
+            **self._stats,
+            "snapshot_latency": self.snapshot_latency.stats(),
+        }
+
+
+# Singleton instance
+snapshot_store = SnapshotStore()
@@ -0,0 +1,305 @@
+"""
+Spec version history stored as compressed reverse deltas between keyframes
+"""
+from typing import Any, Dict, List, Optional
+from difflib import SequenceMatcher
+from app.cache import TTLCache
+from app.config import settings
+from app.database import get_supabase, DatabaseError
+from app.metrics import LatencyRecorder
+import asyncio
+import base64
+import hashlib
+import json
+import time
+import uuid
+import zlib
+
+# Version metadata returned without reconstructing content
+VERSION_COLUMNS = "id,spec_file_id,version,changes_summary,created_at,created_by,storage,content_size"
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def _pack(value: Any) -> str:
+    raw = json.dumps(value, separators=(",", ":")).encode("utf-8")
+    return base64.b64encode(zlib.compress(raw, 6)).decode("ascii")
+
+
+def _unpack(payload: str) -> Any:
+    return json.loads(zlib.decompress(base64.b64decode(payload)).decode("utf-8"))
+
+
+def encode_delta(content: str, base: str) -> str:
+    """Line delta that rebuilds ``content`` from ``base``.
+
+    Ops are ``[start, end]`` (copy those lines of ``base``) or a string (insert it).
+    """
+    source = base.splitlines(keepends=True)
+    target = content.splitlines(keepends=True)
+    ops: List[Any] = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, source, target, autojunk=False).get_opcodes():
+        if tag == "equal":
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append("".join(target[j1:j2]))
+    return _pack(ops)
+
+
+def apply_delta(payload: str, base: str) -> str:
+    source = base.splitlines(keepends=True)
+    parts = []
+    for op in _unpack(payload):
+        if isinstance(op, list):
+            parts.extend(source[op[0]:op[1]])
+        else:
+            parts.append(op)
+    return "".join(parts)
+
+
+class SpecHistory:
+    """Stores and reconstructs ``spec_versions`` rows.
+
+    When version ``v`` is superseded by ``v + 1`` both contents are in hand, so
+    ``v`` is written as a compressed delta against ``v + 1`` (a reverse delta;
+    no reconstruction is needed on save). Every ``spec_keyframe_interval``-th
+    version is written in full instead, so rebuilding any version applies at
+    most ``interval - 1`` deltas, walking back from the nearest later keyframe
+    or from the live spec file. Versions over ``spec_delta_max_lines`` are
+    also written in full, bounding the diff's cost. Rows from before this scheme keep their plain
+    ``content`` (storage ``full``) until compacted.
+
+    Saves go through the ``save_spec_version`` database function: the history
+    row and the spec file update happen in one round trip, under a row lock and
+    an optional expected-version check. The live content needed to build the
+    history delta is kept per spec, so repeated saves from the editor skip the
+    read entirely, and the delta is computed off the event loop.
+    """
+
+    def __init__(self):
+        self.supabase = get_supabase()
+        self.interval = max(1, settings.spec_keyframe_interval)
+        self.max_delta_lines = settings.spec_delta_max_lines
+        # Versions are immutable, so reconstructed content never goes stale
+        self._contents = TTLCache(maxsize=settings.spec_history_cache_size, ttl=3600.0)
+        # Live spec per (project, file type); the database checks version and hash before trusting it
+        self._live = TTLCache(maxsize=settings.spec_history_cache_size, ttl=3600.0)
+        self.save_latency = LatencyRecorder()
+        self._stats = {"saves": 0, "conflicts": 0, "live_hits": 0, "live_misses": 0}
+
+    def remember(self, spec: Dict[str, Any]):
+        """Record a spec file row as the live content of its (project, file type)"""
+        self._live.set((str(spec["project_id"]), spec["file_type"]), {
+            "id": spec["id"],
+            "version": spec["version"],
+            "content": spec["content"],
+        })
+
+    async def save(self, project_id: str, file_type: str, content: str, changes_summary: str,
+                   created_by: str, expected_version: Optional[int] = None,
+                   spec_file_id: Optional[str] = None) -> Dict[str, Any]:
+        """Replace a spec's content, moving the current version into history.
+
+        Raises ``DatabaseError`` with status 409 if ``expected_version`` is given
+        and the spec has moved on, or 404 if there is no such spec file.
+        """
+        started = time.perf_counter()
+        live_key = (project_id, file_type)
+
+        current = self._live.get(live_key)
+        if current is not None:
+            self._stats["live_hits"] += 1
+        else:
+            self._stats["live_misses"] += 1
+            current = await self._fetch_live(project_id, file_type)
+
+        history = None
+        if current is not None:
+            row = await asyncio.to_thread(self.build_version_row, current, content, changes_summary, created_by)
+            history = {key: row[key] for key in ("version", "storage", "payload", "base_version", "content_hash")}
+
+        try:
+            response = await self.supabase.rpc("save_spec_version", {
+                "p_project_id": project_id,
+                "p_file_type": file_type,
+                "p_content": content,
+                "p_expected_version": expected_version,
+                "p_spec_file_id": spec_file_id,
+                "p_changes_summary": changes_summary,
+                "p_created_by": created_by,
+                "p_history": history,
+            })
+        except DatabaseError as e:
+            self._live.invalidate(live_key)
+            if e.status_code == 409:
+                self._stats["conflicts"] += 1
+            raise
+
+        spec = response.data[0]
+        self.remember(spec)
+        self._stats["saves"] += 1
+        self.save_latency.record((time.perf_counter() - started) * 1000)
+        return spec
+
+    async def _fetch_live(self, project_id: str, file_type: str) -> Optional[Dict[str, Any]]:
+        response = await self.supabase.table("spec_files")\
+            .select("id, project_id, file_type, version, content")\
+            .eq("project_id", project_id)\
+            .eq("file_type", file_type)\
+            .order("version", desc=True)\
+            .limit(1)\
+            .execute()
+        if not response.data:
+            return None
+        self.remember(response.data[0])
+        return response.data[0]
+
+    def build_version_row(self, spec: Dict[str, Any], superseded_by: str, changes_summary: str,
+                          created_by: str) -> Dict[str, Any]:
+        """History row for ``spec``'s current content, which ``superseded_by`` replaces"""
+        version = spec["version"]
+        row = {
+            "id": str(uuid.uuid4()),
+            "spec_file_id": spec["id"],
+            "version": version,
+            "content": None,
+            "content_size": len(spec["content"]),
+            "content_hash": content_hash(spec["content"]),
+            "changes_summary": changes_summary,
+            "created_by": created_by,
+        }
+        lines = max(spec["content"].count("\n"), superseded_by.count("\n"))
+        if version % self.interval == 0 or lines > self.max_delta_lines:
+            row.update({"storage": "keyframe", "payload": _pack(spec["content"]), "base_version": None})
+        else:
+            row.update({
+                "storage": "delta",
+                "payload": encode_delta(spec["content"], superseded_by),
+                "base_version": version + 1,
+            })
+        return row
+
+    async def list_versions(self, spec_file_id: str, include_content: bool = False) -> List[Dict[str, Any]]:
+        """Version metadata, newest first; content only when asked for"""
+        response = await self.supabase.table("spec_versions")\
+            .select(VERSION_COLUMNS)\
+            .eq("spec_file_id", spec_file_id)\
+            .order("version", desc=True)\
+            .execute()
+
+        versions = response.data
+        if include_content:
+            for version in versions:
+                version["content"] = await self.get_content(spec_file_id, version["version"])
+        return versions
+
+    async def get_content(self, spec_file_id: str, version: int) -> str:
+        """Reconstruct the content of one version"""
+        cached = self._contents.get((spec_file_id, version))
+        if cached is not None:
+            return cached
+
+        # Rows from the wanted version up to (at most) the next keyframe
+        rows_response = await self.supabase.table("spec_versions")\
+            .select("version, storage, content, payload, base_version, content_hash")\
+            .eq("spec_file_id", spec_file_id)\
+            .gte("version", version)\
+            .lte("version", version + self.interval)\
+            .order("version", desc=False)\
+            .execute()
+        rows = {row["version"]: row for row in rows_response.data}
+        if version not in rows:
+            raise LookupError(f"Spec version {version} not found")
+
+        # Walk forward to a row that stands on its own (or to the live spec)
+        chain = []
+        current = rows[version]
+        while current.get("storage") == "delta":
+            chain.append(current)
+            base_version = current["base_version"]
+            if base_version in rows:
+                current = rows[base_version]
+                continue
+            current = await self._live_version(spec_file_id, base_version)
+            break
+
+        content = current["content"] if current.get("storage") in (None, "full") else _unpack(current["payload"])
+        for row in reversed(chain):
+            content = apply_delta(row["payload"], content)
+            if row.get("content_hash") and content_hash(content) != row["content_hash"]:
+                raise ValueError(f"Spec version {row['version']} failed its integrity check")
+            self._contents.set((spec_file_id, row["version"]), content)
+
+        self._contents.set((spec_file_id, version), content)
+        return content
+
+    async def _live_version(self, spec_file_id: str, version: int) -> Dict[str, Any]:
+        """The live spec file as a base row, if it is at ``version``"""
+        response = await self.supabase.table("spec_files")\
+            .select("version, content")\
+            .eq("id", spec_file_id)\
+            .execute()
+        if not response.data or response.data[0]["version"] != version:
+            raise LookupError(f"Base version {version} of spec {spec_file_id} is missing")
+        return {"storage": "full", "content": response.data[0]["content"]}
+
+    async def compact(self, spec_file_id: str) -> Dict[str, int]:
+        """Rewrite plain-content history of one spec file into keyframes and deltas"""
+        rows_response = await self.supabase.table("spec_versions")\
+            .select("id, version, storage, content")\
+            .eq("spec_file_id", spec_file_id)\
+            .order("version", desc=True)\
+            .execute()
+        live = await self.supabase.table("spec_files")\
+            .select("version, content")\
+            .eq("id", spec_file_id)\
+            .execute()
+        if not live.data:
+            return {"rewritten": 0, "bytes_before": 0, "bytes_after": 0}
+
+        stats = {"rewritten": 0, "bytes_before": 0, "bytes_after": 0}
+        # Newest first: each row's base (the next version) is already known
+        contents = {live.data[0]["version"]: live.data[0]["content"]}
+        for row in rows_response.data:
+            content = row["content"] if row["storage"] in (None, "full") else await self.get_content(
+                spec_file_id, row["version"]
+            )
+            contents[row["version"]] = content
+            base = contents.get(row["version"] + 1)
+            if row["storage"] not in (None, "full") or (base is None and row["version"] % self.interval):
+                continue
+
+            rebuilt = await asyncio.to_thread(
+                self.build_version_row,
+                {"id": spec_file_id, "version": row["version"], "content": content},
+                superseded_by=base if base is not None else content,
+                changes_summary=None,
+                created_by=None,
+            )
+            update_data = {
+                key: rebuilt[key]
+                for key in ("content", "content_size", "content_hash", "storage", "payload", "base_version")
+            }
+            await self.supabase.table("spec_versions")\
+                .update(update_data)\
+                .eq("id", row["id"])\
+                .execute()
+
+            stats["rewritten"] += 1
+            stats["bytes_before"] += len(content.encode("utf-8"))
+            stats["bytes_after"] += len(update_data["payload"])
+        return stats
+
+    def stats(self) -> Dict[str, Any]:
+        """Save counters and latency"""
+        return {
+            **self._stats,
+            "save_latency": self.save_latency.stats(),
+            "live_specs": len(self._live),
+        }
+
+
+# Singleton instance
+spec_history = SpecHistory()
@@ -0,0 +1,307 @@
+"""
+Persistent agent task queue backed by the tasks table, with an async worker pool
+"""
+from typing import Dict, Any, List, Optional
+from datetime import datetime, timedelta
+from app.config import settings
+from app.database import get_supabase
+from app.models import User, TaskStatus
+from app.services.event_bus import event_bus
+import asyncio
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+def _utc_iso(offset_seconds: float = 0.0) -> str:
+    """ISO timestamp relative to now (UTC)"""
+    return (datetime.utcnow() + timedelta(seconds=offset_seconds)).isoformat()
+
+
+class TaskQueue:
+    """Leases pending rows from the tasks table and runs them on a pool of workers.
+
+    Each claim is a conditional update (status=pending -> in_progress) so several
+    workers, or several API processes, never run the same task twice. A worker
+    renews its lease while the task runs; tasks whose lease expires (crashed
+    worker) are returned to the queue, and outcomes are only recorded by the
+    worker that still holds the lease. Failures are retried with exponential
+    backoff until ``task_max_attempts`` is reached; an expired lease on the
+    final attempt fails the task. ``updated_at`` is bumped on
+    every claim, renewal and requeue.
+    """
+
+    def __init__(self):
+        self.supabase = get_supabase()
+        self.worker_count = settings.task_workers
+        self.lease_seconds = settings.task_lease_seconds
+        self.max_attempts = settings.task_max_attempts
+        self.retry_backoff = settings.task_retry_backoff_seconds
+        self.poll_interval = settings.task_poll_interval_seconds
+        self._workers: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+        self._running = False
+        self._active = 0
+        self._stats = {"completed": 0, "failed": 0, "retried": 0, "reclaimed": 0}
+
+    async def start(self):
+        """Spawn the worker pool"""
+        if self._running:
+            return
+        self._running = True
+        for index in range(self.worker_count):
+            worker_id = f"worker-{index}-{uuid.uuid4().hex[:6]}"
+            self._workers.append(asyncio.create_task(self._worker_loop(worker_id)))
+
+    async def stop(self):
+        """Stop accepting work and cancel the workers"""
+        self._running = False
+        self._wakeup.set()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def notify(self):
+        """Wake idle workers after a new task was inserted"""
+        self._wakeup.set()
+
+    async def enqueue(self, project_id: str, agent_type: str, description: str, user: User,
+                      input_context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Insert a pending task row and wake the workers"""
+        task_id = str(uuid.uuid4())
+        task_data = {
+            "id": task_id,
+            "project_id": project_id,
+            "agent_type": agent_type,
+            "description": description,
+            "status": TaskStatus.PENDING.value,
+            "input_context": {**(input_context or {}), "user_id": user.id},
+            "attempts": 0,
+            "run_after": _utc_iso(),
+        }
+
+        response = await self.supabase.table("tasks").insert(task_data).execute()
+        if not response.data:
+            raise Exception("Failed to enqueue task")
+
+        event_bus.publish(project_id, "task.created", {
+            "id": task_id,
+            "agent_type": agent_type,
+            "status": TaskStatus.PENDING.value,
+        })
+        self.notify()
+        return response.data[0]
+
+    async def _worker_loop(self, worker_id: str):
+        """Claim and run tasks until stopped"""
+        while self._running:
+            try:
+                task = await self._claim_next(worker_id)
+            except Exception:
+                logger.exception("Task queue poll failed")
+                task = None
+
+            if task is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._run(worker_id, task)
+            except Exception:
+                logger.exception("Failed to record outcome of task %s", task["id"])
+
+    async def _claim_next(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """Lease the oldest runnable task, or return None if the queue is empty"""
+        await self._reclaim_expired()
+
+        candidates = await self.supabase.table("tasks")\
+            .select("id, attempts")\
+            .eq("status", TaskStatus.PENDING.value)\
+            .lte("run_after", _utc_iso())\
+            .order("created_at", desc=False)\
+            .limit(self.worker_count)\
+            .execute()
+
+        for candidate in candidates.data:
+            claimed = await self.supabase.table("tasks")\
+                .update({
+                    "status": TaskStatus.IN_PROGRESS.value,
+                    "worker_id": worker_id,
+                    "attempts": (candidate.get("attempts") or 0) + 1,
+                    "lease_expires_at": _utc_iso(self.lease_seconds),
+                    "updated_at": _utc_iso(),
+                })\
+                .eq("id", candidate["id"])\
+                .eq("status", TaskStatus.PENDING.value)\
+                .execute()
+
+            if claimed.data:
+                task = claimed.data[0]
+                event_bus.publish(task.get("project_id"), "task.updated", {
+                    "id": task["id"],
+                    "status": task["status"],
+                    "attempts": task.get("attempts"),
+                })
+                return task
+
+        return None
+
+    async def _reclaim_expired(self):
+        """Return tasks held by dead workers to the queue.
+
+        A task that has used up its attempts is failed rather than re-queued,
+        so one that keeps killing its worker can't cycle forever.
+        """
+        now = _utc_iso()
+        exhausted = await self.supabase.table("tasks")\
+            .update({
+                "status": TaskStatus.FAILED.value,
+                "worker_id": None,
+                "lease_expires_at": None,
+                "last_error": "Lease expired on the final attempt",
+                "completed_at": now,
+                "updated_at": now,
+            })\
+            .eq("status", TaskStatus.IN_PROGRESS.value)\
+            .lt("lease_expires_at", now)\
+            .gte("attempts", self.max_attempts)\
+            .execute()
+        self._stats["failed"] += len(exhausted.data)
+        for task in exhausted.data:
+            event_bus.publish(task.get("project_id"), "task.updated", {
+                "id": task["id"],
+                "status": task["status"],
+                "attempts": task.get("attempts"),
+                "error": task.get("last_error"),
+            })
+
+        reclaimed = await self.supabase.table("tasks")\
+            .update({
+                "status": TaskStatus.PENDING.value,
+                "worker_id": None,
+                "lease_expires_at": None,
+                "updated_at": now,
+            })\
+            .eq("status", TaskStatus.IN_PROGRESS.value)\
+            .lt("lease_expires_at", now)\
+            .lt("attempts", self.max_attempts)\
+            .execute()
+        self._stats["reclaimed"] += len(reclaimed.data)
+
+    async def _heartbeat(self, worker_id: str, task_id: str):
+        """Extend the lease while the task is running"""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await self.supabase.table("tasks")\
+                    .update({"lease_expires_at": _utc_iso(self.lease_seconds), "updated_at": _utc_iso()})\
+                    .eq("id", task_id)\
+                    .eq("worker_id", worker_id)\
+                    .execute()
+            except Exception:
+                logger.warning("Failed to renew lease for task %s", task_id)
+
+    async def _run(self, worker_id: str, task: Dict[str, Any]):
+        """Execute a claimed task and record the outcome"""
+        from app.routers.agents import process_agent_task
+
+        heartbeat = asyncio.create_task(self._heartbeat(worker_id, task["id"]))
+        self._active += 1
+        try:
+            user = await self._load_user(task)
+            use_cache = (task.get("input_context") or {}).get("use_cache", True)
+            output = await process_agent_task(task["id"], task["agent_type"], task["description"], user, use_cache)
+            await self._complete(worker_id, task, output)
+        except Exception as e:
+            logger.exception("Agent task %s failed", task["id"])
+            await self._handle_failure(task, str(e))
+        finally:
+            self._active -= 1
+            heartbeat.cancel()
+
+    async def _load_user(self, task: Dict[str, Any]) -> User:
+        """Load the submitting user so the task runs with their tier"""
+        user_id = (task.get("input_context") or {}).get("user_id")
+        response = await self.supabase.table("users").select("*").eq("id", user_id).execute()
+        if not response.data:
+            raise Exception(f"User {user_id} not found for task {task['id']}")
+        return User(**response.data[0])
+
+    async def _complete(self, worker_id: str, task: Dict[str, Any], output: Dict[str, Any]):
+        """Record a finished task, unless its lease was reclaimed meanwhile"""
+        now = _utc_iso()
+        response = await self.supabase.table("tasks")\
+            .update({
+                "status": TaskStatus.COMPLETED.value,
+                "output": output,
+                "worker_id": None,
+                "lease_expires_at": None,
+                "completed_at": now,
+                "updated_at": now,
+            })\
+            .eq("id", task["id"])\
+            .eq("worker_id", worker_id)\
+            .execute()
+        if not response.data:
+            logger.warning("Lost the lease on task %s before it completed; leaving it to its new owner", task["id"])
+            return
+        self._stats["completed"] += 1
+        event_bus.publish(task.get("project_id"), "task.updated", {"id": task["id"], "status": TaskStatus.COMPLETED.value})
+
+    async def _handle_failure(self, task: Dict[str, Any], error: str):
+        """Schedule a retry with backoff, or mark the task failed"""
+        attempts = task.get("attempts") or 1
+        if attempts < self.max_attempts:
+            delay = self.retry_backoff * (2 ** (attempts - 1))
+            update_data = {
+                "status": TaskStatus.PENDING.value,
+                "worker_id": None,
+                "lease_expires_at": None,
+                "run_after": _utc_iso(delay),
+                "last_error": error,
+            }
+            outcome = "retried"
+        else:
+            update_data = {
+                "status": TaskStatus.FAILED.value,
+                "worker_id": None,
+                "lease_expires_at": None,
+                "last_error": error,
+                "completed_at": _utc_iso(),
+            }
+            outcome = "failed"
+
+        update_data["updated_at"] = _utc_iso()
+        response = await self.supabase.table("tasks")\
+            .update(update_data)\
+            .eq("id", task["id"])\
+            .eq("worker_id", task.get("worker_id"))\
+            .execute()
+        if not response.data:
+            logger.warning("Lost the lease on task %s before recording its failure", task["id"])
+            return
+        self._stats[outcome] += 1
+        event_bus.publish(task.get("project_id"), "task.updated", {
+            "id": task["id"],
+            "status": update_data["status"],
+            "attempts": attempts,
+            "error": error,
+        })
+
+    def stats(self) -> Dict[str, Any]:
+        """Worker pool metrics"""
+        return {
+            "workers": len(self._workers),
+            "active": self._active,
+            **self._stats,
+        }
+
+
+# Singleton instance
+task_queue = TaskQueue()
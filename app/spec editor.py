@@ -16,7 +16,7 @@ async def get_spec_file(
     current_user: User = Depends(get_current_user)
 ):
     supabase = get_supabase()
-    response = supabase.table("spec_files")\
+    response = await supabase.table("spec_files")\
         .select("*")\
         .eq("project_id", project_id)\
         .eq("file_type", file_type)\
@@ -41,7 +41,7 @@ async def update_spec_file(
     supabase = get_supabase()
 
     # Get latest spec file
-    latest = supabase.table("spec_files")\
+    latest = await supabase.table("spec_files")\
         .select("*")\
         .eq("project_id", project_id)\
         .eq("file_type", file_type)\
@@ -65,7 +65,7 @@ async def update_spec_file(
         "created_by": current_user.id,
         "created_at": datetime.utcnow().isoformat()
     }
-    supabase.table("spec_versions").insert(version_data).execute()
+    await supabase.table("spec_versions").insert(version_data).execute()
 
     # --- Update spec file with new content ---
     new_version = current_spec["version"] + 1
@@ -74,7 +74,7 @@ async def update_spec_file(
         "version": new_version,
         "updated_at": datetime.utcnow().isoformat()
     }
-    updated = supabase.table("spec_files")\
+    updated = await supabase.table("spec_files")\
         .update(update_data)\
         .eq("id", current_spec["id"])\
         .execute()
@@ -93,7 +93,7 @@ async def get_spec_versions(
     current_user: User = Depends(get_current_user)
 ):
     supabase = get_supabase()
-    spec = supabase.table("spec_files")\
+    spec = await supabase.table("spec_files")\
         .select("id")\
         .eq("project_id", project_id)\
         .eq("file_type", file_type)\
@@ -104,7 +104,7 @@ async def get_spec_versions(
         return []
     
     spec_file_id = spec.data[0]["id"]
-    versions = supabase.table("spec_versions")\
+    versions = await supabase.table("spec_versions")\
         .select("*")\
         .eq("spec_file_id", spec_file_id)\
         .order("version", desc=True)\
@@ -124,7 +124,7 @@ async def rollback_spec(
     supabase = get_supabase()
     
     # Get version to rollback to
-    version_resp = supabase.table("spec_versions")\
+    version_resp = await supabase.table("spec_versions")\
         .select("*")\
         .eq("id", rollback_data.version_id)\
         .execute()
@@ -135,7 +135,7 @@ async def rollback_spec(
     target_version = version_resp.data[0]
     
     # Get current spec file
-    spec_resp = supabase.table("spec_files")\
+    spec_resp = await supabase.table("spec_files")\
         .select("*")\
         .eq("id", target_version["spec_file_id"])\
         .execute()
@@ -156,7 +156,7 @@ async def rollback_spec(
         "created_by": current_user.id,
         "created_at": datetime.utcnow().isoformat()
     }
-    supabase.table("spec_versions").insert(history_data).execute()
+    await supabase.table("spec_versions").insert(history_data).execute()
     
     # Apply rollback
     new_version = current_spec["version"] + 1
@@ -165,7 +165,7 @@ async def rollback_spec(
         "version": new_version,
         "updated_at": datetime.utcnow().isoformat()
     }
-    updated = supabase.table("spec_files")\
+    updated = await supabase.table("spec_files")\
         .update(update_data)\
         .eq("id", current_spec["id"])\
         .execute()
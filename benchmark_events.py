@@ -0,0 +1,86 @@
+"""
+Fan-out benchmark for the in-process project event bus
+
+Simulates thousands of idle event-stream subscribers in one worker and reports
+the memory they hold, how long a publish takes to fan out to all of them, and
+the publish-to-delivery latency seen by the consumers.
+
+Usage: python benchmark_events.py [subscribers] [projects] [events]
+"""
+import asyncio
+import statistics
+import sys
+import time
+import tracemalloc
+
+
+async def run(subscribers: int, projects: int, events: int):
+    from app.services.event_bus import EventBus
+
+    bus = EventBus(queue_size=100)
+    latencies = []
+    resyncs = []
+
+    async def consumer(subscription):
+        # Mirrors the SSE loop: wait with a keepalive timeout, forward the event
+        while True:
+            event = await subscription.get(timeout=15.0)
+            if event is None:
+                continue
+            if event["type"] == "resync":
+                resyncs.append(event)
+            else:
+                latencies.append(time.perf_counter() - event["data"]["sent"])
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+
+    subscriptions = []
+    consumers = []
+    for index in range(subscribers):
+        subscription = bus.subscribe(f"project-{index % projects}")
+        subscriptions.append(subscription)
+        consumers.append(asyncio.create_task(consumer(subscription)))
+    await asyncio.sleep(0)
+
+    held = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    print(f"Idle subscribers: {subscribers} across {projects} projects")
+    print(f"  memory held: {held / 1024 / 1024:.1f} MiB ({held / subscribers:.0f} bytes each)")
+
+    publish_times = []
+    for index in range(events):
+        project_id = f"project-{index % projects}"
+        started = time.perf_counter()
+        bus.publish(project_id, "task.updated", {"id": index, "status": "completed", "sent": started})
+        publish_times.append(time.perf_counter() - started)
+        # Let consumers drain, as they would between real state changes
+        await asyncio.sleep(0)
+
+    while any(subscription.backlog for subscription in subscriptions):
+        await asyncio.sleep(0.01)
+
+    per_event = subscribers / projects
+    print(f"Published {events} events, ~{per_event:.0f} subscribers each")
+    print(f"  publish (fan-out) p50: {statistics.median(publish_times) * 1e6:.0f} us, "
+          f"max: {max(publish_times) * 1e6:.0f} us")
+    latencies.sort()
+    print(f"  delivery latency p50: {latencies[len(latencies) // 2] * 1e3:.2f} ms, "
+          f"p99: {latencies[int(len(latencies) * 0.99)] * 1e3:.2f} ms")
+    print(f"  resyncs (backlog collapsed for slow consumers): {len(resyncs)}")
+    print(f"  stats: {bus.stats()}")
+
+    for task in consumers:
+        task.cancel()
+    await asyncio.gather(*consumers, return_exceptions=True)
+
+
+def main():
+    subscribers = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    projects = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    events = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+    asyncio.run(run(subscribers, projects, events))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""
+Compact existing spec history into keyframes and compressed deltas
+
+Run once after migrations/007_spec_history_deltas.sql. Safe to re-run: rows
+already stored as keyframes or deltas are left alone.
+
+Usage: python compact_spec_history.py
+"""
+import asyncio
+
+
+async def compact_all():
+    from app.database import get_supabase, close_database_connections
+    from app.services.spec_history import spec_history
+
+    supabase = get_supabase()
+    totals = {"specs": 0, "rewritten": 0, "bytes_before": 0, "bytes_after": 0}
+    try:
+        specs = await supabase.table("spec_files").select("id").execute()
+        for spec in specs.data:
+            stats = await spec_history.compact(spec["id"])
+            totals["specs"] += 1
+            for key, value in stats.items():
+                totals[key] += value
+            if stats["rewritten"]:
+                print(f"✓ {spec['id']}: {stats['rewritten']} versions, "
+                      f"{stats['bytes_before']} -> {stats['bytes_after']} bytes")
+    finally:
+        await close_database_connections()
+
+    print(f"\nCompacted {totals['rewritten']} versions across {totals['specs']} spec files: "
+          f"{totals['bytes_before']} -> {totals['bytes_after']} bytes")
+
+
+if __name__ == "__main__":
+    asyncio.run(compact_all())
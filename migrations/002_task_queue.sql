@@ -0,0 +1,11 @@
+-- Task queue columns: leasing, retries and backoff for agent tasks
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS worker_id VARCHAR(255);
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMP;
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS run_after TIMESTAMP DEFAULT NOW();
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS last_error TEXT;
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT NOW();
+
+-- Workers poll pending tasks by run_after and reclaim expired leases
+CREATE INDEX IF NOT EXISTS idx_tasks_pending ON tasks(status, run_after, created_at);
+CREATE INDEX IF NOT EXISTS idx_tasks_lease ON tasks(status, lease_expires_at);
@@ -0,0 +1,9 @@
+-- Persistent tier for the code generation response cache
+CREATE TABLE IF NOT EXISTS response_cache (
+    key VARCHAR(64) PRIMARY KEY,
+    value JSONB NOT NULL,
+    expires_at TIMESTAMP NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_response_cache_expires_at ON response_cache(expires_at);
@@ -0,0 +1,4 @@
+-- Locally computed memory embeddings, reused when rehydrating the in-process vector index
+ALTER TABLE memory_items
+    ADD COLUMN IF NOT EXISTS local_embedding REAL[],
+    ADD COLUMN IF NOT EXISTS embedding_model VARCHAR(100);
@@ -0,0 +1,21 @@
+-- Importance-first, cursor-paginated rehydration of project memory
+-- Added without a default so existing rows stay NULL until backfilled below
+ALTER TABLE memory_items
+    ADD COLUMN IF NOT EXISTS importance_score REAL;
+
+UPDATE memory_items SET importance_score = CASE
+    WHEN item_type = 'decision' THEN 0.9
+    WHEN item_type = 'pattern' THEN 0.8
+    WHEN item_type = 'conversation' AND metadata->>'role' = 'assistant' THEN 0.8
+    WHEN item_type = 'conversation' THEN 0.6
+    ELSE 0.7
+END
+WHERE importance_score IS NULL OR importance_score = 0.7::real;
+
+ALTER TABLE memory_items
+    ALTER COLUMN importance_score SET DEFAULT 0.7;
+
+CREATE INDEX IF NOT EXISTS idx_memory_items_importance
+    ON memory_items(project_id, importance_score DESC, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_memory_items_created_cursor
+    ON memory_items(project_id, created_at DESC, id DESC);
@@ -0,0 +1,3 @@
+-- Keyset pagination of chat history on (created_at, id)
+CREATE INDEX IF NOT EXISTS idx_chat_messages_project_cursor
+    ON chat_messages(project_id, created_at, id);
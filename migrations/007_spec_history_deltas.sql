@@ -0,0 +1,14 @@
+-- Spec history as compressed reverse deltas between periodic keyframes.
+-- Existing rows keep their content as storage = 'full'; run
+-- compact_spec_history.py afterwards to rewrite them as keyframes/deltas.
+ALTER TABLE spec_versions
+    ALTER COLUMN content DROP NOT NULL,
+    ADD COLUMN IF NOT EXISTS storage VARCHAR(10) NOT NULL DEFAULT 'full',
+    ADD COLUMN IF NOT EXISTS payload TEXT,
+    ADD COLUMN IF NOT EXISTS base_version INTEGER,
+    ADD COLUMN IF NOT EXISTS content_size INTEGER,
+    ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64);
+
+UPDATE spec_versions SET content_size = LENGTH(content) WHERE content_size IS NULL AND content IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_spec_versions_spec_version ON spec_versions(spec_file_id, version);
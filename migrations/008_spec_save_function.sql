@@ -0,0 +1,73 @@
+-- Atomic spec save: history row + spec file update in one call, guarded by
+-- optimistic concurrency. Used by both editor saves and rollbacks.
+--
+-- p_expected_version: the version the client last saw. If the spec has moved on,
+--   raises SQLSTATE PT409 (PostgREST answers HTTP 409) and changes nothing.
+-- p_spec_file_id: optionally require the live spec to be this row (rollbacks).
+-- p_history: the superseded version's row as built by the app (keyframe/delta).
+--   It is only used if it describes the version being replaced and its content
+--   hash matches; otherwise the superseded content is stored in full.
+CREATE OR REPLACE FUNCTION save_spec_version(
+    p_project_id UUID,
+    p_file_type VARCHAR,
+    p_content TEXT,
+    p_expected_version INTEGER DEFAULT NULL,
+    p_spec_file_id UUID DEFAULT NULL,
+    p_changes_summary TEXT DEFAULT NULL,
+    p_created_by UUID DEFAULT NULL,
+    p_history JSONB DEFAULT NULL
+)
+RETURNS SETOF spec_files
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    current_spec spec_files%ROWTYPE;
+    current_hash VARCHAR(64);
+BEGIN
+    SELECT * INTO current_spec
+    FROM spec_files
+    WHERE project_id = p_project_id AND file_type = p_file_type
+    ORDER BY version DESC
+    LIMIT 1
+    FOR UPDATE;
+
+    IF NOT FOUND OR (p_spec_file_id IS NOT NULL AND current_spec.id <> p_spec_file_id) THEN
+        RAISE EXCEPTION 'Spec file not found' USING ERRCODE = 'PT404';
+    END IF;
+
+    IF p_expected_version IS NOT NULL AND current_spec.version <> p_expected_version THEN
+        RAISE EXCEPTION 'Spec file is at version %, expected %', current_spec.version, p_expected_version
+            USING ERRCODE = 'PT409',
+                  DETAIL = json_build_object('current_version', current_spec.version)::TEXT;
+    END IF;
+
+    current_hash := encode(sha256(convert_to(current_spec.content, 'UTF8')), 'hex');
+
+    IF p_history IS NOT NULL
+        AND (p_history->>'version')::INTEGER = current_spec.version
+        AND p_history->>'content_hash' = current_hash THEN
+        INSERT INTO spec_versions (
+            spec_file_id, version, content, storage, payload, base_version,
+            content_size, content_hash, changes_summary, created_by
+        ) VALUES (
+            current_spec.id, current_spec.version, NULL, p_history->>'storage', p_history->>'payload',
+            (p_history->>'base_version')::INTEGER, LENGTH(current_spec.content), current_hash,
+            p_changes_summary, p_created_by
+        );
+    ELSE
+        INSERT INTO spec_versions (
+            spec_file_id, version, content, storage, content_size, content_hash,
+            changes_summary, created_by
+        ) VALUES (
+            current_spec.id, current_spec.version, current_spec.content, 'full',
+            LENGTH(current_spec.content), current_hash, p_changes_summary, p_created_by
+        );
+    END IF;
+
+    RETURN QUERY
+    UPDATE spec_files
+    SET content = p_content, version = current_spec.version + 1
+    WHERE id = current_spec.id
+    RETURNING *;
+END;
+$$;
@@ -0,0 +1,23 @@
+-- Content-addressed project file store. Blobs and trees are immutable and
+-- keyed by SHA-256, so identical files and unchanged directories are stored
+-- once across revisions and projects. project_files points each project at
+-- its current root tree; writers move it with a compare-and-set on revision.
+CREATE TABLE IF NOT EXISTS file_blobs (
+    hash VARCHAR(64) PRIMARY KEY,
+    content TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS file_trees (
+    hash VARCHAR(64) PRIMARY KEY,
+    entries JSONB NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS project_files (
+    project_id UUID PRIMARY KEY REFERENCES projects(id) ON DELETE CASCADE,
+    root_hash VARCHAR(64) NOT NULL,
+    revision INTEGER NOT NULL DEFAULT 1,
+    updated_at TIMESTAMP DEFAULT NOW()
+);
@@ -0,0 +1,152 @@
+"""
+Streaming chat endpoint driven by the fake token model
+
+Runs POST /api/projects/{id}/chat/stream end to end with FakeTokenModel in
+place of an LLM and an in-memory stand-in for the database.
+
+Usage: python -m pytest test_chat_stream.py
+"""
+import asyncio
+import json
+from datetime import datetime
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.auth import get_current_user
+from app.database import QueryResponse
+from app.models import User, UserTier
+
+
+class FakeTable:
+    """Just enough of the query builder for the chat router"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.filters = []
+        self.body = None
+
+    def select(self, *args, **kwargs):
+        return self
+
+    def eq(self, column, value):
+        self.filters.append((column, value))
+        return self
+
+    def insert(self, data):
+        self.body = data
+        return self
+
+    async def execute(self):
+        if self.body is not None:
+            self.rows.append(dict(self.body))
+            return QueryResponse([dict(self.body)])
+        return QueryResponse([
+            row for row in self.rows if all(row.get(column) == value for column, value in self.filters)
+        ])
+
+
+class FakeSupabase:
+    def __init__(self):
+        self.tables = {"projects": [{"id": "p1", "user_id": "u1"}], "chat_messages": []}
+
+    def table(self, name):
+        return FakeTable(self.tables.setdefault(name, []))
+
+
+def _events(body: str):
+    """Parse an SSE body into (event, data) pairs"""
+    events = []
+    for frame in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in frame.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+@pytest.fixture
+def db(monkeypatch):
+    from app.routers import chat
+    from app.services.memory_service import memory_service
+
+    async def no_context(project_id, query):
+        return {}
+
+    async def store_conversation(*args, **kwargs):
+        return None
+
+    supabase = FakeSupabase()
+    monkeypatch.setattr(chat, "get_supabase", lambda: supabase)
+    monkeypatch.setattr(chat, "get_project_context", no_context)
+    monkeypatch.setattr(memory_service, "store_conversation", store_conversation)
+    return supabase
+
+
+@pytest.fixture
+def client(db):
+    from app.routers import chat
+
+    app = FastAPI()
+    app.include_router(chat.router, prefix="/api/projects/{project_id}/chat")
+    app.dependency_overrides[get_current_user] = lambda: User(
+        id="u1", email="dev@example.com", name="Dev", tier=UserTier.FREE, credits_remaining=10,
+        created_at=datetime.utcnow(), updated_at=datetime.utcnow(),
+    )
+    return TestClient(app)
+
+
+def _use_model(monkeypatch, model):
+    from app.services.ai_service import ai_service
+    from app.services.chat_stream import timed_stream, stream_metrics
+
+    async def stream_response(user, prompt, **kwargs):
+        async for token in timed_stream(model.stream(prompt), stream_metrics):
+            yield token
+
+    monkeypatch.setattr(ai_service, "stream_response", stream_response)
+
+
+def test_stream_sends_tokens_then_done_and_saves_reply(client, db, monkeypatch):
+    from app.services.chat_stream import FakeTokenModel
+
+    _use_model(monkeypatch, FakeTokenModel(interval=0, reply="Hello from the fake model"))
+    response = client.post("/api/projects/p1/chat/stream", json={"message": "hi"})
+
+    assert response.status_code == 200
+    events = _events(response.text)
+    assert "".join(data["token"] for event, data in events if event == "token") == "Hello from the fake model"
+    assert events[-1][0] == "done"
+    assert events[-1][1]["message"]["content"] == "Hello from the fake model"
+    assert [row["role"] for row in db.tables["chat_messages"]] == ["user", "assistant"]
+
+
+def test_stream_failure_sends_error_event_and_keeps_partial_reply(client, db, monkeypatch):
+    from app.services.chat_stream import FakeTokenModel
+
+    class FailingModel(FakeTokenModel):
+        async def stream(self, prompt):
+            yield "partial"
+            raise RuntimeError("model went away")
+
+    _use_model(monkeypatch, FailingModel(interval=0))
+    response = client.post("/api/projects/p1/chat/stream", json={"message": "hi"})
+
+    events = _events(response.text)
+    assert events[-1] == ("error", {"error": "model went away"})
+    assert db.tables["chat_messages"][-1]["content"] == "partial"
+
+
+def test_agno_stream_ends_when_executor_fails_before_producing(monkeypatch):
+    from app.services.agent_executor import agent_executor
+    from app.services.chat_stream import AgnoTokenModel
+
+    async def rejected(*args, **kwargs):
+        raise RuntimeError("executor shut down")
+
+    monkeypatch.setattr(agent_executor, "run", rejected)
+
+    async def consume():
+        return [token async for token in AgnoTokenModel(agent=None, tier="free").stream("hi")]
+
+    with pytest.raises(RuntimeError, match="executor shut down"):
+        asyncio.run(asyncio.wait_for(consume(), timeout=2))
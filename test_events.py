@@ -0,0 +1,72 @@
+"""
+Project event bus and SSE stream
+
+Usage: python -m pytest test_events.py
+"""
+import asyncio
+
+from app.config import settings
+from app.database import QueryResponse
+from app.services.event_bus import EventBus
+
+
+def test_get_returns_none_when_idle():
+    async def idle():
+        subscription = EventBus(queue_size=4).subscribe("p1")
+        return await subscription.get(timeout=0.05)
+
+    assert asyncio.run(idle()) is None
+
+
+def test_get_returns_published_event():
+    async def publish_later():
+        bus = EventBus(queue_size=4)
+        subscription = bus.subscribe("p1")
+        asyncio.get_running_loop().call_later(0.01, bus.publish, "p1", "task.updated", {"id": "t1"})
+        return await subscription.get(timeout=1)
+
+    event = asyncio.run(publish_later())
+    assert event["type"] == "task.updated"
+    assert event["data"] == {"id": "t1"}
+
+
+def test_idle_stream_sends_keepalive(monkeypatch):
+    from app.routers import events
+    from app.models import User
+
+    class FakeTable:
+        def select(self, *args, **kwargs):
+            return self
+
+        def eq(self, column, value):
+            return self
+
+        async def execute(self):
+            return QueryResponse([{"user_id": "u1"}])
+
+    class FakeSupabase:
+        def table(self, name):
+            return FakeTable()
+
+    class FakeRequest:
+        """Connected for two polls, then gone"""
+
+        def __init__(self):
+            self.polls = 0
+
+        async def is_disconnected(self):
+            self.polls += 1
+            return self.polls > 2
+
+    monkeypatch.setattr(events, "get_supabase", lambda: FakeSupabase())
+    monkeypatch.setattr(settings, "event_keepalive_seconds", 0.01)
+
+    async def stream():
+        user = User.model_construct(id="u1")
+        response = await events.stream_project_events("p1", FakeRequest(), current_user=user)
+        return [frame async for frame in response.body_iterator]
+
+    frames = asyncio.run(stream())
+    assert frames[0].startswith("retry:")
+    assert frames[1:] == [": keepalive\n\n", ": keepalive\n\n"]
+    assert events.event_bus.subscriber_count("p1") == 0